@@ -0,0 +1,224 @@
+"""
+---------------  Benchmarks  -----------------
+Timing and memory of solveCrop (nleb_linear),
+runExp (nleb_nonlinear) and solveIrelandModel
+(goalProg_Ireland) on synthetic basins
+
+Each case runs in its own process and reports
+data load, model build, solve and extraction
+separately, and the peak resident memory of the
+whole case. With --memory, every phase also
+reports the peak of the memory allocated from
+Python and NumPy during it (tracemalloc: solver
+memory is not seen, and timings get slower).
+The linear model is timed both in full
+(subdivision x crop) and aggregated by crop,
+the nonlinear model both in [x, y, p] and
+reduced (nleb_nonlinear.solveReduced).
+
+    python benchmark.py --save baseline.json
+    python benchmark.py --compare baseline.json
+
+May     2021
+----------------------------------------------
+
+"""
+
+import numpy as np
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import tracemalloc
+import platform
+import subprocess
+import tempfile
+
+import nleb_synthetic
+
+
+# (subdivisions, crops), from Ontario size up
+sizes = [(50,10),(500,20),(2000,50),(10000,100)]
+
+# Largest number of x variables each nonlinear case is run at, by method
+# (None: every size). SLSQP is dense, and the dense rows of the full model
+# fill in trust-constr's factorizations; the reduced trust-constr solve is
+# in crop totals.
+maxNonlinear = {'nonlinear':{'SLSQP':5000,'trust-constr':5000},
+                'nonlinearReduced':{'SLSQP':5000,'trust-constr':None}}
+
+
+#%% Phases
+
+def maxRSS():
+    # Peak resident memory of this process [MB] (ru_maxrss is kB on Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def measure(phases,name,fun):
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    out = fun()
+    phases[name] = {'seconds':time.perf_counter() - start}
+    if tracing:
+        phases[name]['allocMB'] = (tracemalloc.get_traced_memory()[1] - before) / 2**20
+    return out
+
+def runLinear(phases,presolve=False):
+    nleb_linear = measure(phases,'load',lambda: __import__('nleb_linear'))
+    import lp_tools
+
+    model = measure(phases,'build',lambda: nleb_linear.CropModel(presolve=presolve))
+
+    def solve():
+        lp = model.lp
+        model.constraints[lp['rowP']].SetUb(model.allowed['P'] * (1-0.4))
+        model.constraints[lp['rowN']].SetUb(model.allowed['N'] * (1-0.3))
+        return model.solver.Solve()
+    measure(phases,'solve',solve)
+
+    def extract():
+        values = lp_tools.solutionValues(model.solver)
+        nX,nC = model.lp['nX'],model.lp['nC']
+        return nleb_linear.areaTable(model.lp,values),values[nX:nX+nC]
+    measure(phases,'extract',extract)
+
+def runNonlinear(phases,method='SLSQP',reduced=False):
+    nleb_nonlinear = measure(phases,'load',lambda: __import__('nleb_nonlinear'))
+    import instrumentation
+
+    # solveExp builds the model it solves (Jacobians or the reduced
+    # evaluator) and records that apart from the solver; the traced
+    # memory of 'solve' includes the build
+    rec = instrumentation.Recorder('nleb_nonlinear',event='solve')
+    solve = {}
+    sol = measure(solve,'solve',lambda: nleb_nonlinear.solveExp(0.1,0.0,method=method,
+                                                                 reduced=reduced,rec=rec))
+    phases['build'] = {'seconds':rec.record['phases'].get('build',0.0)}
+    phases['solve'] = dict(solve['solve'],seconds=rec.record['phases']['solve'],
+                           iterations=int(sol.nit))
+    measure(phases,'extract',lambda: nleb_nonlinear.extractVars(sol.x))
+
+def runGoalProg(phases,nWeights=1000):
+    goalProg = measure(phases,'load',lambda: __import__('goalProg_Ireland'))
+    import lp_tools
+
+    model = measure(phases,'build',goalProg.IrelandModel)
+    weights = np.random.default_rng(0).uniform(0.001,1,(nWeights,len(goalProg.weightNames)))
+
+    def solve():
+        for w in weights:
+            model.setWeights(w)
+            model.solver.Solve()
+    measure(phases,'solve',solve)
+    measure(phases,'extract',lambda: lp_tools.solutionValues(model.solver))
+    phases['solve']['weightVectors'] = nWeights
+
+
+#%% Runner
+
+def runCase(case,nS,nC,data,method,memory=False):
+    """
+    Run one case in a fresh process so memory and import costs are its own.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp,'phases.json')
+        env = dict(os.environ,NLEB_DATA=data) if data else os.environ
+        subprocess.run([sys.executable,os.path.abspath(__file__),'--case',case,
+                        '--method',method,'--out',out] + (['--memory'] if memory else []),
+                       env=env,check=True,stdout=subprocess.DEVNULL)
+        with open(out) as f:
+            result = json.load(f)
+    return dict(case=case,nS=nS,nC=nC,**result)
+
+def runSuite(sizes,method='SLSQP',memory=False):
+    results = [runCase('goalProg',0,0,None,method,memory)]
+    for nS,nC in sizes:
+        with tempfile.TemporaryDirectory() as data:
+            nleb_synthetic.writeSynthetic(data,nS,nC)
+            results.append(runCase('linear',nS,nC,data,method,memory))
+            results.append(runCase('linearAggregated',nS,nC,data,method,memory))
+            for case,limits in maxNonlinear.items():
+                if limits[method] is None or nS*nC <= limits[method]:
+                    results.append(runCase(case,nS,nC,data,method,memory))
+    return {'python':platform.python_version(),'machine':platform.machine(),
+            'method':method,'results':results}
+
+def compare(current,baseline,tolerance=1.25,minSeconds=1e-3):
+    """
+    Phases slower than tolerance times the baseline. Returns a list of
+    (case, nS, nC, phase, baseline seconds, current seconds).
+    """
+    base = {(r['case'],r['nS'],r['nC']):r['phases'] for r in baseline['results']}
+    slower = []
+    for r in current['results']:
+        key = (r['case'],r['nS'],r['nC'])
+        for phase,now in r['phases'].items():
+            before = base.get(key,{}).get(phase)
+            if before is None or before['seconds'] < minSeconds:
+                continue
+            if now['seconds'] > tolerance * before['seconds']:
+                slower.append(key + (phase,before['seconds'],now['seconds']))
+    return slower
+
+def printResults(suite):
+    print(f"{'case':<18}{'size':>12}{'phase':>9}{'seconds':>12}{'MB':>10}")
+    for r in suite['results']:
+        size = str(r['nS']) + 'x' + str(r['nC'])
+        for phase,m in r['phases'].items():
+            alloc = f"{m['allocMB']:>10.1f}" if 'allocMB' in m else f"{'-':>10}"
+            print(f"{r['case']:<18}{size:>12}{phase:>9}{m['seconds']:>12.4f}{alloc}")
+        print(f"{r['case']:<18}{size:>12}{'peakRSS':>9}{'':>12}{r.get('peakMB',float('nan')):>10.1f}")
+
+
+#%% Command line
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark the NLEB and goal programming models.')
+    parser.add_argument('--sizes',nargs='+',metavar='SxC',
+                        help='basin sizes, e.g. 50x10 2000x50 (default: Ontario up to 10000x100)')
+    parser.add_argument('--method',default='SLSQP',choices=['SLSQP','trust-constr'],help='runExp method')
+    parser.add_argument('--save',help='write the results as a JSON baseline')
+    parser.add_argument('--compare',help='baseline JSON to check for regressions')
+    parser.add_argument('--tolerance',type=float,default=1.25)
+    parser.add_argument('--memory',action='store_true',
+                        help='also trace the memory allocated in each phase (slower)')
+    parser.add_argument('--case',help=argparse.SUPPRESS)
+    parser.add_argument('--out',help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Child process: one case, phases written to --out
+    if args.case:
+        if args.memory:
+            tracemalloc.start()
+        phases = {}
+        {'linear':runLinear,
+         'linearAggregated':lambda p: runLinear(p,presolve=True),
+         'nonlinear':lambda p: runNonlinear(p,args.method),
+         'nonlinearReduced':lambda p: runNonlinear(p,args.method,reduced=True),
+         'goalProg':runGoalProg}[args.case](phases)
+        with open(args.out,'w') as f:
+            json.dump({'phases':phases,'peakMB':maxRSS()},f)
+        sys.exit(0)
+
+    if args.sizes:
+        sizes = [tuple(int(k) for k in s.lower().split('x')) for s in args.sizes]
+
+    suite = runSuite(sizes,args.method,args.memory)
+    printResults(suite)
+
+    if args.save:
+        with open(args.save,'w') as f:
+            json.dump(suite,f,indent=1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            slower = compare(suite,json.load(f),args.tolerance)
+        for case,nS,nC,phase,before,now in slower:
+            print(f'Regression: {case} {nS}x{nC} {phase} {before:.4f}s -> {now:.4f}s')
+        sys.exit(1 if slower else 0)
@@ -54,173 +54,353 @@ By:         Jorge A. Garcia
 """
 
 from ortools.linear_solver import pywraplp
+import numpy as np
+import time
 
+import lp_tools
+import instrumentation
+import solve_cache
 
-# Function to solve model
-def solveIrelandModel(weights):
-    
-    # Parameters (insert the respective data)------------------------
-    
-    # Average earnings [€/Ha] for crops and [€/Head] for livestock
-    sales = {'grass':0.5, 'wheat':0.7, 'cow':1.2}
-    
-    # Production or capital costs [€/Ha-year] for crops and [€/Head-year] for livestock
-    cost = {'grass':0.05, 'wheat':0.17, 'cow':0.6}
-    
-    # Emissions P [kg/Ha-year] for crops and [kg/Head] for livestock
-    emissionP = {'grass':2, 'wheat':5, 'cow':13}
-    
-    # Emissions C [kg/Ha-year] for crops and [kg/Head] for livestock  (ghg1, ghg2, ghg3)
-    emissionC = {'grass':1, 'wheat':2, 'cow':15}
-    
-    # Organic Fertilizer [kg/Ha-year] for crops and [kg/Head] for livestock 
-    of = {'grass':10, 'wheat':15, 'cow':5}
-    
-    # Chemical Fertilizer [kg/year] for crops and [kg/Head] for livestock 
-    cf = {'grass':10, 'wheat':12, 'cow':0}
-    
-    # Yield [kg/Ha-year] for crops and [kg/head-year] for livestock
-    yieldAgro = {'grass':10, 'wheat':12, 'cow':20}
+
+# Deviation variable penalized by each weight
+deviations = {
+    'Deficit_GrassSales': 'd_salesGrass_minus', # 1st constraint
+    'Deficit_WheatSales': 'd_salesWheat_minus', # 1st constraint
+    'Deficit_CowSales':   'd_salesCow_minus',   # 1st constraint
+    'Exceed_Cost':        'd_cost_plus',        # 2nd constraint
+    'Exceed_P':           'd_emissP_plus',      # 4th constraint
+    'Exceed_C':           'd_emissC_plus',      # 5th constraint
+    'Deficit_OF':         'd_of_minus',         # 6th constraint
+    'Exceed_OF':          'd_of_plus',          # 6th constraint
+    'Exceed_CF':          'd_cf_plus',          # 7th constraint
+    'Deficit_ProdGrass':  'd_grass_minus',      # 8th constraint
+    'Exceed_ProdGrass':   'd_grass_plus',       # 8th constraint
+    'Deficit_ProdWheat':  'd_wheat_minus',      # 8th constraint
+    'Exceed_ProdWheat':   'd_wheat_plus',       # 8th constraint
+    'Deficit_ProdCow':    'd_cow_minus',        # 8th constraint
+    'Exceed_ProdCow':     'd_cow_plus'          # 8th constraint
+    }
+
+# Column order of weight matrices
+weightNames = list(deviations)
+
+
+class IrelandModel:
+    """
+    Goal programming model built once. Only the objective coefficients
+    (the weights of the deviation variables) change between solves, and
+    GLOP starts each solve from the basis of the previous one.
+    """
+    
+    def __init__(self):
+        
+        buildStart = time.perf_counter()
+        
+        # Parameters (insert the respective data)------------------------
+        
+        # Average earnings [€/Ha] for crops and [€/Head] for livestock
+        sales = {'grass':0.5, 'wheat':0.7, 'cow':1.2}
+        
+        # Production or capital costs [€/Ha-year] for crops and [€/Head-year] for livestock
+        cost = {'grass':0.05, 'wheat':0.17, 'cow':0.6}
+        
+        # Emissions P [kg/Ha-year] for crops and [kg/Head] for livestock
+        emissionP = {'grass':2, 'wheat':5, 'cow':13}
+        
+        # Emissions C [kg/Ha-year] for crops and [kg/Head] for livestock  (ghg1, ghg2, ghg3)
+        emissionC = {'grass':1, 'wheat':2, 'cow':15}
+        
+        # Organic Fertilizer [kg/Ha-year] for crops and [kg/Head] for livestock 
+        of = {'grass':10, 'wheat':15, 'cow':5}
+        
+        # Chemical Fertilizer [kg/year] for crops and [kg/Head] for livestock 
+        cf = {'grass':10, 'wheat':12, 'cow':0}
+        
+        # Yield [kg/Ha-year] for crops and [kg/head-year] for livestock
+        yieldAgro = {'grass':10, 'wheat':12, 'cow':20}
+        
+        RHS = {
+               'TypicalSalesGrass': 2000.0,# [€/year]
+               'TypicalSalesWheat': 5000.0,# [€/year]
+               'TypicalSalesCow': 15000.0, # [€/year]
+               'AvailableArea': 500.0,     # [Ha]
+               'Budget': 10000.0,          # [€/year]
+               'maxEmissionP': 1000.0,     # [kg/year]
+               'maxEmissionC': 1200.0,     # [kg/year]
+               'Tof': 100.0,               # [kg/year]
+               'MaxChemical': 2000.0,      # [kg/year]
+               'TargetGrassProd': 2000.0,  # [kg/year]
+               'TargetWheatProd': 2000.0,  # [kg/year]
+               'TargetCowProd': 6000.0     # [kg/year]
+               }
+        
+        # Solver ------------------------------------------------
+        solver = pywraplp.Solver.CreateSolver('GLOP')
+        
+        # Without presolve GLOP restarts from the last basis when only the weights change
+        solver.SetSolverSpecificParametersAsString('use_preprocessing: false')
+        
+        # Decision variables
+        grass = solver.NumVar(0, solver.infinity(), 'grass')
+        wheat = solver.NumVar(0, solver.infinity(), 'wheat')
+        cow =   solver.NumVar(0, solver.infinity(), 'cow')
+        
+        # Dummy variables
+        d_salesGrass_minus = solver.NumVar(0, solver.infinity(), 'd_salesGrass_minus')
+        d_salesWheat_minus = solver.NumVar(0, solver.infinity(), 'd_salesWheat_minus')
+        d_salesCow_minus =   solver.NumVar(0, solver.infinity(), 'd_salesCow_minus')
+        
+        d_cost_plus = solver.NumVar(0, solver.infinity(), 'd_cost_plus')
+        
+        d_emissP_plus = solver.NumVar(0, solver.infinity(), 'd_emissP_plus')
+        d_emissC_plus = solver.NumVar(0, solver.infinity(), 'd_emissC_plus')
+        
+        d_of_minus = solver.NumVar(0, solver.infinity(), 'd_of_minus')
+        d_of_plus =  solver.NumVar(0, solver.infinity(), 'd_of_plus')
+        
+        d_cf_plus =  solver.NumVar(0, solver.infinity(), 'd_cf_plus')
+        
+        d_grass_plus =  solver.NumVar(0, solver.infinity(), 'd_grass_plus')
+        d_grass_minus = solver.NumVar(0, solver.infinity(), 'd_grass_minus')
+        
+        d_wheat_plus =  solver.NumVar(0, solver.infinity(), 'd_wheat_plus')
+        d_wheat_minus = solver.NumVar(0, solver.infinity(), 'd_wheat_minus')
+        
+        d_cow_plus =  solver.NumVar(0, solver.infinity(), 'd_cow_plus')
+        d_cow_minus = solver.NumVar(0, solver.infinity(), 'd_cow_minus')
+        
+        
+        # Constraint 1. Sales [€/year]
+        solver.Add( sales['grass']*grass + d_salesGrass_minus >= RHS['TypicalSalesGrass'] )
+        solver.Add( sales['wheat']*wheat + d_salesWheat_minus >= RHS['TypicalSalesWheat'] )   
+        solver.Add( sales['cow'] * cow   + d_salesCow_minus   >= RHS['TypicalSalesCow'] )
+         
+        # Constraint 2. Costs [€/year]
+        solver.Add( cost['grass']*grass + cost['wheat']*wheat + cost['cow']*cow - d_cost_plus <= RHS['Budget'] )   
+        
+        # Constraint 3. Area [Ha]. Livestock: 11 cows per 9 Ha -> 0.82 [Ha/head] -> changed to 0.51
+        solver.Add( grass + wheat + 0.51*cow <= RHS['AvailableArea'] )
+        
+        # Constraint 4. Emissions of P [kg/year]
+        solver.Add( emissionP['grass']*grass + emissionP['wheat']*wheat + emissionP['cow']*cow - d_emissP_plus <= RHS['maxEmissionP'] )
+        
+        # Constraint 5. Emissions of C  [kg/year]
+        solver.Add( emissionC['grass']*grass + emissionC['wheat']*wheat + emissionC['cow']*cow - d_emissC_plus <= RHS['maxEmissionC'] )
+        
+        # Constraint 6. Organic Fertilizer [kg/year]
+        solver.Add( of['grass']*grass + of['wheat']*wheat - of['cow']*cow + d_of_minus - d_of_plus <= RHS['Tof'] )
+        solver.Add( of['grass']*grass + of['wheat']*wheat - of['cow']*cow + d_of_minus - d_of_plus >= RHS['Tof'] )
+        
+        # Constraint 7. Chemical Fertilizer [kg/year]
+        solver.Add( cf['grass']*grass + cf['wheat']*wheat - d_cf_plus <= RHS['MaxChemical'] )
+        
+        # Constraint 8. Target production
+        solver.Add( yieldAgro['grass']*grass + d_grass_minus - d_grass_plus >= RHS['TargetGrassProd'])
+        solver.Add( yieldAgro['grass']*grass + d_grass_minus - d_grass_plus <= RHS['TargetGrassProd'])
+        
+        solver.Add( yieldAgro['wheat']*wheat + d_wheat_minus - d_wheat_plus >= RHS['TargetWheatProd'])
+        solver.Add( yieldAgro['wheat']*wheat + d_wheat_minus - d_wheat_plus <= RHS['TargetWheatProd'])
+        
+        solver.Add( yieldAgro['cow']*cow + d_cow_minus - d_cow_plus >= RHS['TargetCowProd'])
+        solver.Add( yieldAgro['cow']*cow + d_cow_minus - d_cow_plus <= RHS['TargetCowProd'])
+        
+        
+        self.solver = solver
+        self.variables = solver.variables()
+        self.variableNames = [var.name() for var in self.variables]
+        self.deviationVars = [solver.LookupVariable(deviations[w]) for w in weightNames]
+        
+        # Objective function (weights are set in solve)
+        solver.Objective().SetMinimization()
+        
+        # Rows that hold the optimum of each priority level (preemptive mode)
+        self.levelRows = []
+        
+        rec = instrumentation.Recorder('goalProg_Ireland',event='build',
+                                       variables=solver.NumVariables(),
+                                       constraints=solver.NumConstraints())
+        rec.record['phases']['build'] = time.perf_counter() - buildStart
+        rec.emit()
+    
+    
+    def setWeights(self,weights):
+        # One weight per weightNames, in that order
+        if len(weights) != len(self.deviationVars):
+            raise ValueError(f'Expected {len(self.deviationVars)} weights, got {len(weights)}')
+        objective = self.solver.Objective()
+        for var,w in zip(self.deviationVars,weights):
+            objective.SetCoefficient(var,float(w))
+    
+    
+    def solve(self,weights,verbose=False):
+        """
+        Solve for one weight dictionary. Returns a dict of variable values
+        plus 'Obj_fun', or None if there is no feasible solution.
+        """
+        solver = self.solver
+        self.setWeights([weights[w] for w in weightNames])
+        
+        # Solution -----------------------------------------
+        rec = instrumentation.Recorder('goalProg_Ireland',event='solve')
+        with rec.phase('solve'):
+            status = solver.Solve()
+        self.addStats(rec,status)
+        
+        if status == pywraplp.Solver.OPTIMAL:
+            with rec.phase('extract'):
+                opt_sol = dict(zip(self.variableNames,lp_tools.solutionValues(solver)))
+                opt_sol['Obj_fun'] = solver.Objective().Value()
+            rec.emit()
+            if verbose:
+                printSolution(opt_sol)
+            return opt_sol
+        else:
+            rec.emit()
+            if verbose:
+                print('The problem does not have a feasible solution.')
+        return None
+    
+    
+    def solveWeights(self,weightMatrix):
+        """
+        Solve for every row of weightMatrix (columns ordered as weightNames).
+        Returns the values of all variables (rows x variableNames) and the
+        objective of each row; infeasible rows are NaN.
+        """
+        solver = self.solver
+        weightMatrix = np.asarray(weightMatrix,'float64')
+        if weightMatrix.ndim != 2 or weightMatrix.shape[1] != len(weightNames):
+            raise ValueError(f'The weight matrix must have {len(weightNames)} columns '
+                             f'(weightNames), not shape {weightMatrix.shape}')
+        
+        values = np.full((len(weightMatrix),len(self.variables)),np.nan)
+        objective = np.full(len(weightMatrix),np.nan)
+        
+        # Records only cost time when someone listens
+        recording = instrumentation.sink is not None
+        
+        for k,weights in enumerate(weightMatrix):
+            self.setWeights(weights)
+            if recording:
+                rec = instrumentation.Recorder('goalProg_Ireland',event='solve',row=k)
+                with rec.phase('solve'):
+                    status = solver.Solve()
+                self.addStats(rec,status)
+                rec.emit()
+            else:
+                status = solver.Solve()
+            if status == pywraplp.Solver.OPTIMAL:
+                values[k] = lp_tools.solutionValues(solver)
+                objective[k] = solver.Objective().Value()
+        
+        return values,objective
+    
+    
+    def addStats(self,rec,status):
+        solver = self.solver
+        rec.add(status=int(status),optimal=status == pywraplp.Solver.OPTIMAL,
+                iterations=int(solver.iterations()),solverWallTime=solver.wall_time()*1e-3)
+        if status == pywraplp.Solver.OPTIMAL:
+            rec.add(objective=solver.Objective().Value())
+    
+    
+    def solvePreemptive(self,priorities,tol=1e-6,verbose=False):
+        """
+        Lexicographic goal programming. priorities is a list of levels, most
+        important first; each level is a list of weight names (weight 1) or
+        a dict of weight names and weights. Each level is minimized on the
+        same solver, from the current basis, with the optimum of every
+        earlier level kept as a constraint (relaxed by tol, relative).
+        Returns the final solution dict with 'Levels', the optimum of each
+        level, or None if a level has no feasible solution.
+        """
+        if not priorities:
+            raise ValueError('solvePreemptive needs at least one priority level')
+        solver = self.solver
+        objective = solver.Objective()
+        levels = []
+        
+        for k,level in enumerate(priorities):
+            if not isinstance(level,dict):
+                level = {w:1.0 for w in level}
+            self.setWeights([level.get(w,0.0) for w in weightNames])
+            
+            status = solver.Solve()
+            if status != pywraplp.Solver.OPTIMAL:
+                if verbose:
+                    print(f'Priority level {k+1} does not have a feasible solution.')
+                self.releaseLevels()
+                return None
+            levels.append(objective.Value())
+            if k == len(priorities) - 1:
+                # Read before any change: the model must stay as solved
+                values = lp_tools.solutionValues(solver)
+                break
+            
+            # Fix this level's optimum before the next one
+            if k == len(self.levelRows):
+                self.levelRows.append(solver.Constraint(-solver.infinity(),solver.infinity()))
+            row = self.levelRows[k]
+            row.Clear()
+            for w,weight in level.items():
+                row.SetCoefficient(self.deviationVars[weightNames.index(w)],float(weight))
+            row.SetUb(levels[-1] + tol*max(1.0,abs(levels[-1])))
+        
+        opt_sol = dict(zip(self.variableNames,values))
+        opt_sol['Obj_fun'] = levels[-1]
+        opt_sol['Levels'] = levels
+        if verbose:
+            printSolution(opt_sol)
+            for k,value in enumerate(levels):
+                print(f'Priority level {k+1}: {value:.3f}')
+        
+        self.releaseLevels()
+        return opt_sol
     
-    RHS = {
-           'TypicalSalesGrass': 2000.0,# [€/year]
-           'TypicalSalesWheat': 5000.0,# [€/year]
-           'TypicalSalesCow': 15000.0, # [€/year]
-           'AvailableArea': 500.0,     # [Ha]
-           'Budget': 10000.0,          # [€/year]
-           'maxEmissionP': 1000.0,     # [kg/year]
-           'maxEmissionC': 1200.0,     # [kg/year]
-           'Tof': 100.0,               # [kg/year]
-           'MaxChemical': 2000.0,      # [kg/year]
-           'TargetGrassProd': 2000.0,  # [kg/year]
-           'TargetWheatProd': 2000.0,  # [kg/year]
-           'TargetCowProd': 6000.0     # [kg/year]
-           }
     
-    # Solver ------------------------------------------------
-    solver = pywraplp.Solver.CreateSolver('GLOP')
-    
-    # Decision variables
-    grass = solver.NumVar(0, solver.infinity(), 'grass')
-    wheat = solver.NumVar(0, solver.infinity(), 'wheat')
-    cow =   solver.NumVar(0, solver.infinity(), 'cow')
-    
-    # Dummy variables
-    d_salesGrass_minus = solver.NumVar(0, solver.infinity(), 'd_salesGrass_minus')
-    d_salesWheat_minus = solver.NumVar(0, solver.infinity(), 'd_salesWheat_minus')
-    d_salesCow_minus =   solver.NumVar(0, solver.infinity(), 'd_salesCow_minus')
-    
-    d_cost_plus = solver.NumVar(0, solver.infinity(), 'd_cost_plus')
-    
-    d_emissP_plus = solver.NumVar(0, solver.infinity(), 'd_emissP_plus')
-    d_emissC_plus = solver.NumVar(0, solver.infinity(), 'd_emissC_plus')
-    
-    d_of_minus = solver.NumVar(0, solver.infinity(), 'd_of_minus')
-    d_of_plus =  solver.NumVar(0, solver.infinity(), 'd_of_plus')
-    
-    d_cf_plus =  solver.NumVar(0, solver.infinity(), 'd_cf_plus')
-    
-    d_grass_plus =  solver.NumVar(0, solver.infinity(), 'd_grass_plus')
-    d_grass_minus = solver.NumVar(0, solver.infinity(), 'd_grass_minus')
-    
-    d_wheat_plus =  solver.NumVar(0, solver.infinity(), 'd_wheat_plus')
-    d_wheat_minus = solver.NumVar(0, solver.infinity(), 'd_wheat_minus')
-    
-    d_cow_plus =  solver.NumVar(0, solver.infinity(), 'd_cow_plus')
-    d_cow_minus = solver.NumVar(0, solver.infinity(), 'd_cow_minus')
-    
-    
-    # Constraint 1. Sales [€/year]
-    solver.Add( sales['grass']*grass + d_salesGrass_minus >= RHS['TypicalSalesGrass'] )
-    solver.Add( sales['wheat']*wheat + d_salesWheat_minus >= RHS['TypicalSalesWheat'] )   
-    solver.Add( sales['cow'] * cow   + d_salesCow_minus   >= RHS['TypicalSalesCow'] )
-     
-    # Constraint 2. Costs [€/year]
-    solver.Add( cost['grass']*grass + cost['wheat']*wheat + cost['cow']*cow - d_cost_plus <= RHS['Budget'] )   
-    
-    # Constraint 3. Area [Ha]. Livestock: 11 cows per 9 Ha -> 0.82 [Ha/head] -> changed to 0.51
-    solver.Add( grass + wheat + 0.51*cow <= RHS['AvailableArea'] )
-    
-    # Constraint 4. Emissions of P [kg/year]
-    solver.Add( emissionP['grass']*grass + emissionP['wheat']*wheat + emissionP['cow']*cow - d_emissP_plus <= RHS['maxEmissionP'] )
-    
-    # Constraint 5. Emissions of C  [kg/year]
-    solver.Add( emissionC['grass']*grass + emissionC['wheat']*wheat + emissionC['cow']*cow - d_emissC_plus <= RHS['maxEmissionC'] )
-    
-    # Constraint 6. Organic Fertilizer [kg/year]
-    solver.Add( of['grass']*grass + of['wheat']*wheat - of['cow']*cow + d_of_minus - d_of_plus <= RHS['Tof'] )
-    solver.Add( of['grass']*grass + of['wheat']*wheat - of['cow']*cow + d_of_minus - d_of_plus >= RHS['Tof'] )
-    
-    # Constraint 7. Chemical Fertilizer [kg/year]
-    solver.Add( cf['grass']*grass + cf['wheat']*wheat - d_cf_plus <= RHS['MaxChemical'] )
-    
-    # Constraint 8. Target production
-    solver.Add( yieldAgro['grass']*grass + d_grass_minus - d_grass_plus >= RHS['TargetGrassProd'])
-    solver.Add( yieldAgro['grass']*grass + d_grass_minus - d_grass_plus <= RHS['TargetGrassProd'])
-    
-    solver.Add( yieldAgro['wheat']*wheat + d_wheat_minus - d_wheat_plus >= RHS['TargetWheatProd'])
-    solver.Add( yieldAgro['wheat']*wheat + d_wheat_minus - d_wheat_plus <= RHS['TargetWheatProd'])
-    
-    solver.Add( yieldAgro['cow']*cow + d_cow_minus - d_cow_plus >= RHS['TargetCowProd'])
-    solver.Add( yieldAgro['cow']*cow + d_cow_minus - d_cow_plus <= RHS['TargetCowProd'])
-    
-    # Objective function
-    solver.Minimize(
-        weights['Deficit_GrassSales'] * d_salesGrass_minus + # 1st constraint
-        weights['Deficit_WheatSales'] * d_salesWheat_minus + # 1st constraint
-        weights['Deficit_CowSales'] * d_salesCow_minus +     # 1st constraint
-        weights['Exceed_Cost'] * d_cost_plus + # 2nd constraint
-        weights['Exceed_P'] * d_emissP_plus +  # 4th constraint
-        weights['Exceed_C'] * d_emissC_plus +  # 5th constraint
-        weights['Deficit_OF'] * d_of_minus +   # 6th constraint
-        weights['Exceed_OF']  * d_of_plus +    # 6th constraint
-        weights['Exceed_CF'] * d_cf_plus +     # 7th constraint
-        weights['Deficit_ProdGrass'] * d_grass_minus + # 8th constraint
-        weights['Exceed_ProdGrass'] * d_grass_plus +   # 8th constraint
-        weights['Deficit_ProdWheat'] * d_wheat_minus + # 8th constraint
-        weights['Exceed_ProdWheat'] * d_wheat_plus +   # 8th constraint
-        weights['Deficit_ProdCow'] * d_cow_minus +     # 8th constraint
-        weights['Exceed_ProdCow'] * d_cow_plus         # 8th constraint
-        )           
-    
-    
-    # Solution -----------------------------------------
-    status = solver.Solve()
-    
-    if status == pywraplp.Solver.OPTIMAL:
-        print('\n')  # Leaves a row without printing
-        print('Optimal solution found:')
-        print('Objective value (€/year): {0:.3f}'.format( solver.Objective().Value() ))
-        print('-----------------------------')
-        print('Grass (Ha) = \t {0:.3f}'.format( grass.solution_value() ))
-        print('Wheat (Ha) = \t {0:.3f}'.format( wheat.solution_value() ))
-        print('Cow (Heads) = \t {0:.3f}'.format( cow.solution_value() ))
-        print('-----------------------------')
-        print('Loss in grass sales (€/year): {0:.3f}'.format( d_salesGrass_minus.solution_value() ))
-        print('Loss in wheat sales (€/year): {0:.3f}'.format( d_salesWheat_minus.solution_value() ))
-        print('Loss in cow sales (€/year): {0:.3f}'.format( d_salesCow_minus.solution_value() ))
-        print('Exceedance of costs (€/year): {0:.3f}'.format( d_cost_plus.solution_value() ))
-        print('-----------------------------')
-        print('Exceedance in emissions of P (kg/year): {0:.3f}'.format( d_emissP_plus.solution_value() ))
-        print('Exceedance in emissions of C (kg/year): {0:.3f}'.format( d_emissC_plus.solution_value() ))
-        print('-----------------------------')
-        print('Exceedance of Organic Fertilizer (kg/year): {0:.3f}'.format( d_of_plus.solution_value() ))
-        print('Deficit of Organic Fertilizer (kg/year): {0:.3f}'.format( d_of_minus.solution_value() ))
-        print('Exceedance of Chemical Fertilizer (kg/year): {0:.3f}'.format( d_cf_plus.solution_value() ))
-        print('-----------------------------')
-        print('Exceedance in supply (grass): {0:.3f}'.format( d_grass_plus.solution_value() ))
-        print('Deficit in supply (grass): {0:.3f}'.format( d_grass_minus.solution_value() ))
-        print('Exceedance in supply (wheat): {0:.3f}'.format( d_wheat_plus.solution_value() ))
-        print('Deficit in supply (wheat): {0:.3f}'.format( d_wheat_minus.solution_value() ))
-        print('Exceedance in supply (cow): {0:.3f}'.format( d_cow_plus.solution_value() ))
-        print('Deficit in supply (cow): {0:.3f}'.format( d_cow_minus.solution_value() ))
-        
-        opt_sol = {var.name():var.solution_value() for var in solver.variables()}
-        opt_sol['Obj_fun'] = solver.Objective().Value()
-        return opt_sol
-    else:
-        print('The problem does not have a feasible solution.')
-    return None
+    def releaseLevels(self):
+        # Level rows stay in the model but no longer bind
+        for row in self.levelRows:
+            row.SetUb(self.solver.infinity())
+
+
+def printSolution(opt_sol):
+    print('\n')  # Leaves a row without printing
+    print('Optimal solution found:')
+    print('Objective value (€/year): {0:.3f}'.format( opt_sol['Obj_fun'] ))
+    print('-----------------------------')
+    print('Grass (Ha) = \t {0:.3f}'.format( opt_sol['grass'] ))
+    print('Wheat (Ha) = \t {0:.3f}'.format( opt_sol['wheat'] ))
+    print('Cow (Heads) = \t {0:.3f}'.format( opt_sol['cow'] ))
+    print('-----------------------------')
+    print('Loss in grass sales (€/year): {0:.3f}'.format( opt_sol['d_salesGrass_minus'] ))
+    print('Loss in wheat sales (€/year): {0:.3f}'.format( opt_sol['d_salesWheat_minus'] ))
+    print('Loss in cow sales (€/year): {0:.3f}'.format( opt_sol['d_salesCow_minus'] ))
+    print('Exceedance of costs (€/year): {0:.3f}'.format( opt_sol['d_cost_plus'] ))
+    print('-----------------------------')
+    print('Exceedance in emissions of P (kg/year): {0:.3f}'.format( opt_sol['d_emissP_plus'] ))
+    print('Exceedance in emissions of C (kg/year): {0:.3f}'.format( opt_sol['d_emissC_plus'] ))
+    print('-----------------------------')
+    print('Exceedance of Organic Fertilizer (kg/year): {0:.3f}'.format( opt_sol['d_of_plus'] ))
+    print('Deficit of Organic Fertilizer (kg/year): {0:.3f}'.format( opt_sol['d_of_minus'] ))
+    print('Exceedance of Chemical Fertilizer (kg/year): {0:.3f}'.format( opt_sol['d_cf_plus'] ))
+    print('-----------------------------')
+    print('Exceedance in supply (grass): {0:.3f}'.format( opt_sol['d_grass_plus'] ))
+    print('Deficit in supply (grass): {0:.3f}'.format( opt_sol['d_grass_minus'] ))
+    print('Exceedance in supply (wheat): {0:.3f}'.format( opt_sol['d_wheat_plus'] ))
+    print('Deficit in supply (wheat): {0:.3f}'.format( opt_sol['d_wheat_minus'] ))
+    print('Exceedance in supply (cow): {0:.3f}'.format( opt_sol['d_cow_plus'] ))
+    print('Deficit in supply (cow): {0:.3f}'.format( opt_sol['d_cow_minus'] ))
+
+
+# Function to solve model (the model data is in this file, so the key is the weights)
+@solve_cache.memoize('goalProg_Ireland',lambda: ())
+def solveIrelandModel(weights,verbose=False):
+    return IrelandModel().solve(weights,verbose)
+
+# Function to solve model with priority levels
+def solveIrelandPreemptive(priorities,verbose=False):
+    return IrelandModel().solvePreemptive(priorities,verbose=verbose)
 
 
 
@@ -245,6 +425,6 @@ if __name__ == '__main__':
         }
     
     # Call function to solve model
-    opt_sol = solveIrelandModel(weights)
+    opt_sol = solveIrelandModel(weights,verbose=True)
 
     
@@ -0,0 +1,238 @@
+"""
+------- Goal Programming for many farms -------
+Data-driven version of goalProg_Ireland
+
+Two tables describe any number of farms,
+enterprises and goals:
+
+  enterprises  one row per (farm, enterprise):
+               farm, enterprise and one column
+               per coefficient (sales, cost,
+               emissionP, area, ...)
+  goals        one row per (farm, goal): farm,
+               goal, coefficient (a column of
+               enterprises), enterprise (empty
+               for the sum over the farm),
+               sense ('<=', '>=' or '='),
+               target, under and over (weights
+               of the deviations; empty means
+               no deviation, i.e. a hard row)
+
+Goal rows and deviation variables are built as
+sparse blocks. Farms are independent unless a
+regional cap links them, so they are solved in
+blocks on a process pool, or as one model with
+the cap rows.
+
+May     2021
+-----------------------------------------------
+
+"""
+
+import pandas as pd
+import numpy as np
+import os
+import multiprocessing
+from scipy import sparse
+from ortools.linear_solver import pywraplp
+
+import lp_tools
+import instrumentation
+
+
+#%% Data
+
+def readFarms(path):
+    """
+    Enterprise and goal tables from the 'Enterprises' and 'Goals' sheets.
+    """
+    sheets = pd.read_excel(path,sheet_name=['Enterprises','Goals'])
+    return sheets['Enterprises'],sheets['Goals']
+
+def irelandFarms(nFarms=1):
+    """
+    The farm of goalProg_Ireland (and the weights of its example) as
+    tables, repeated nFarms times.
+    """
+    coef = pd.DataFrame({'enterprise':['grass','wheat','cow'],
+                         'sales':[0.5,0.7,1.2],
+                         'cost':[0.05,0.17,0.6],
+                         'emissionP':[2,5,13],
+                         'emissionC':[1,2,15],
+                         'of':[10,15,-5],
+                         'cf':[10,12,0],
+                         'yield':[10,12,20],
+                         'area':[1,1,0.51]})
+    goal = pd.DataFrame([('SalesGrass','sales','grass','>=',2000.0,1.0,None),
+                         ('SalesWheat','sales','wheat','>=',5000.0,1.0,None),
+                         ('SalesCow','sales','cow','>=',15000.0,1.0,None),
+                         ('Budget','cost',None,'<=',10000.0,None,1.0),
+                         ('AvailableArea','area',None,'<=',500.0,None,None),
+                         ('EmissionP','emissionP',None,'<=',1000.0,None,0.001),
+                         ('EmissionC','emissionC',None,'<=',1200.0,None,0.001),
+                         ('OrganicFertilizer','of',None,'=',100.0,0.1,0.01),
+                         ('ChemicalFertilizer','cf',None,'<=',2000.0,None,0.001),
+                         ('ProdGrass','yield','grass','=',2000.0,1.0,1.0),
+                         ('ProdWheat','yield','wheat','=',2000.0,1.0,1.0),
+                         ('ProdCow','yield','cow','=',6000.0,1.0,1.0)],
+                        columns=['goal','coefficient','enterprise','sense','target','under','over'])
+    farms = range(nFarms)
+    enterprises = pd.concat([coef.assign(farm=f) for f in farms],ignore_index=True)
+    goals = pd.concat([goal.assign(farm=f) for f in farms],ignore_index=True)
+    return enterprises,goals
+
+
+#%% Model
+
+def goalMatrices(enterprises,goals,caps=None):
+    """
+    Goal programme of the farms in the tables as arrays for
+    lp_tools.loadMatrixModel: minimize c z  s.t.  rowLo <= A z <= rowHi,
+    z >= 0, with z = [levels of the enterprise rows, under deviations,
+    over deviations]. Each goal row is
+        sum of coefficient * level + under - over  (sense)  target
+    followed by one hard row per regional cap, {coefficient: cap}, over
+    every enterprise row.
+    """
+    nX,nG = len(enterprises),len(goals)
+    names = [c for c in enterprises.columns if c not in ('farm','enterprise')]
+
+    # Coefficient of every (goal, enterprise row) pair, by merging on farm and coefficient
+    levels = enterprises.assign(col=np.arange(nX)).melt(id_vars=['col','farm','enterprise'],
+                                                         value_vars=names,var_name='coefficient')
+    pairs = goals.loc[:,['farm','coefficient','enterprise']].assign(row=np.arange(nG)) \
+                 .merge(levels,on=['farm','coefficient'],suffixes=('','Level'))
+    pairs = pairs[(pairs.enterprise.isna() | (pairs.enterprise == pairs.enterpriseLevel))
+                  & pairs.value.notna() & (pairs.value != 0)]
+
+    under = np.flatnonzero(goals.under.notna().to_numpy())
+    over = np.flatnonzero(goals.over.notna().to_numpy())
+    nU,nO = len(under),len(over)
+
+    rows = [pairs.row.to_numpy(),under,over]
+    cols = [pairs.col.to_numpy(),nX + np.arange(nU),nX + nU + np.arange(nO)]
+    vals = [pairs.value.to_numpy('float64'),np.ones(nU),-np.ones(nO)]
+
+    target = goals.target.to_numpy('float64')
+    sense = goals.sense.to_numpy()
+    rowLo = [np.where(sense == '<=',-np.inf,target)]
+    rowHi = [np.where(sense == '>=',np.inf,target)]
+
+    for k,(name,cap) in enumerate((caps or {}).items()):
+        coef = enterprises[name].to_numpy('float64')
+        rows.append(np.full(nX,nG + k))
+        cols.append(np.arange(nX))
+        vals.append(coef)
+        rowLo.append([-np.inf])
+        rowHi.append([float(cap)])
+
+    nRows = nG + len(caps or {})
+    A = sparse.csr_matrix((np.concatenate(vals),(np.concatenate(rows),np.concatenate(cols))),
+                          shape=(nRows,nX + nU + nO))
+    c = np.concatenate((np.zeros(nX),goals.under.to_numpy('float64')[under],
+                        goals.over.to_numpy('float64')[over]))
+
+    return {'c':c,'A':A,'rowLo':np.concatenate(rowLo),'rowHi':np.concatenate(rowHi),
+            'colLo':np.zeros(A.shape[1]),'colHi':np.full(A.shape[1],np.inf),
+            'nX':nX,'under':under,'over':over}
+
+def solveTables(enterprises,goals,caps=None):
+    """
+    Solve the farms of the tables as one GLOP model. Returns the levels of
+    the enterprise rows and the under and over deviations of the goal rows,
+    or None if the model has no optimal solution.
+    """
+    m = goalMatrices(enterprises,goals,caps)
+    solver = pywraplp.Solver.CreateSolver('GLOP')
+    lp_tools.loadMatrixModel(solver,m['c'],m['A'],m['rowLo'],m['rowHi'],m['colLo'],m['colHi'])
+    if solver.Solve() != pywraplp.Solver.OPTIMAL:
+        return None
+    values = lp_tools.solutionValues(solver)
+    nX,nU = m['nX'],len(m['under'])
+    under = np.zeros(len(goals))
+    over = np.zeros(len(goals))
+    under[m['under']] = values[nX:nX + nU]
+    over[m['over']] = values[nX + nU:]
+    return values[:nX],under,over
+
+
+#%% Solver
+
+def solveBlock(task):
+    """
+    Solve a block of independent farms as one model. If the block has no
+    solution, its farms are solved one at a time so that only the
+    infeasible ones are left out (None).
+    """
+    enterprises,goals = task
+    sol = solveTables(enterprises,goals)
+    if sol is not None:
+        return enterprises.index,goals.index,sol
+    out = []
+    for farm in enterprises.farm.unique():
+        e = enterprises[enterprises.farm == farm]
+        g = goals[goals.farm == farm]
+        out.append((e.index,g.index,solveTables(e,g)))
+    return out
+
+def solveFarms(enterprises,goals,caps=None,processes=None,blocks=None):
+    """
+    Solve every farm of the tables.
+
+    Without caps the farms are independent: they are split into blocks of
+    whole farms and each block is solved as one model on a process pool.
+    With caps, {coefficient: regional cap} (e.g. {'emissionP': 5e5}), the
+    farms share those rows and are solved together as one model.
+
+    Returns the enterprise table with a 'level' column, the goal table with
+    'underDeviation' and 'overDeviation' columns and the weighted deviation
+    of each farm.
+    Farms without a solution are NaN.
+    """
+    enterprises = enterprises.reset_index(drop=True)
+    goals = goals.reset_index(drop=True)
+    farms = enterprises.farm.unique()
+
+    rec = instrumentation.Recorder('goalProg_farms',event='solve',farms=len(farms),
+                                   enterprises=len(enterprises),goals=len(goals),joint=bool(caps))
+
+    level = np.full(len(enterprises),np.nan)
+    under = np.full(len(goals),np.nan)
+    over = np.full(len(goals),np.nan)
+
+    def store(e,g,sol):
+        if sol is not None:
+            level[e],under[g],over[g] = sol
+
+    with rec.phase('solve'):
+        if caps:
+            store(enterprises.index,goals.index,solveTables(enterprises,goals,caps))
+        else:
+            processes = processes or os.cpu_count()
+            blocks = min(len(farms),blocks or 4*processes)
+            groups = np.array_split(farms,blocks)
+            tasks = [(enterprises[enterprises.farm.isin(f)],goals[goals.farm.isin(f)]) for f in groups]
+            with multiprocessing.Pool(processes) as pool:
+                for out in pool.imap_unordered(solveBlock,tasks):
+                    for e,g,sol in (out if isinstance(out,list) else [out]):
+                        store(e,g,sol)
+
+    weighted = goals.under.fillna(0) * under + goals.over.fillna(0) * over
+    objective = weighted.groupby(goals.farm).sum(min_count=1)
+
+    rec.add(solved=int(objective.notna().sum()),objective=float(objective.sum()))
+    rec.emit()
+
+    return {'enterprises':enterprises.assign(level=level),
+            'goals':goals.assign(underDeviation=under,overDeviation=over),
+            'objective':objective}
+
+
+if __name__ == '__main__':
+    enterprises,goals = irelandFarms(1000)
+    sol = solveFarms(enterprises,goals)
+    print(sol['enterprises'].groupby('enterprise').level.sum())
+
+    # The same farms under a regional cap on P emissions [kg/year]
+    sol = solveFarms(enterprises,goals,caps={'emissionP':0.8 * 1000 * 1000.0})
+    print('Total weighted deviation:', round(float(sol['objective'].sum()),3))
@@ -0,0 +1,95 @@
+"""
+-------------  Instrumentation  --------------
+One structured record per solve (or data load)
+with per-phase timings and solver statistics
+
+Records go to a pluggable sink and are dropped
+by default:
+
+    import instrumentation
+    instrumentation.setSink(instrumentation.JsonLinesSink('solves.jsonl'))
+
+A sink is any callable taking the record dict.
+Setting NLEB_RECORDS=path before the models are
+imported also records the data load.
+
+May     2021
+----------------------------------------------
+
+"""
+
+import os
+import json
+import time
+from contextlib import contextmanager
+
+
+sink = None
+
+
+def setSink(newSink):
+    """
+    Send every record to newSink (None turns recording off).
+    Returns the previous sink.
+    """
+    global sink
+    previous = sink
+    sink = newSink
+    return previous
+
+
+class JsonLinesSink:
+    """
+    Append each record as one JSON line. Every write is a single append,
+    so several processes can share the file.
+    """
+
+    def __init__(self,path):
+        self.path = path
+
+    def __call__(self,record):
+        with open(self.path,'a') as f:
+            f.write(json.dumps(record,default=float) + '\n')
+
+
+def printSink(record):
+    print(json.dumps(record,default=float))
+
+
+class Recorder:
+    """
+    Collects the phases and statistics of one event (a phase entered
+    more than once adds up):
+
+        rec = Recorder('nleb_linear',event='solve',capP=0.1)
+        with rec.phase('solve'):
+            ...
+        rec.add(iterations=120)
+        rec.emit()
+    """
+
+    def __init__(self,model,**fields):
+        self.record = {'model':model,'time':time.time(),'pid':os.getpid(),'phases':{}}
+        self.record.update(fields)
+
+    @contextmanager
+    def phase(self,name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            phases = self.record['phases']
+            phases[name] = phases.get(name,0.0) + time.perf_counter() - start
+
+    def add(self,**stats):
+        self.record.update(stats)
+
+    def emit(self):
+        if sink is not None:
+            sink(self.record)
+        return self.record
+
+
+# Sink from the environment, so records start before any model import
+if os.environ.get('NLEB_RECORDS'):
+    sink = JsonLinesSink(os.environ['NLEB_RECORDS'])
@@ -0,0 +1,185 @@
+"""
+--------------  LP matrix tools  ---------------
+Helpers to hand linear programs written as arrays
+
+    rowLo <= A x <= rowHi
+    colLo <=  x  <= colHi
+
+to OR-Tools (GLOP) or to SciPy's HiGHS without building the model one
+variable and one constraint at a time.
+
+May     2021
+------------------------------------------------
+
+"""
+
+import numpy as np
+import os
+import tempfile
+from scipy import sparse
+from scipy.optimize import linprog
+from scipy.sparse.linalg import splu
+from ortools.linear_solver import linear_solver_pb2
+from ortools.linear_solver.python import model_builder_helper
+
+
+def loadMatrixModel(solver,c,A,rowLo,rowHi,colLo,colHi,maximize=False,integer=None):
+    """
+    Load the LP into an empty pywraplp solver through a model proto.
+    integer flags the integer columns (for MIP solvers; LP solvers relax them).
+    Returns the lists of variables and constraints, in column and row order.
+
+    The proto is filled from the arrays in one call by OR-Tools' model
+    builder (C++) and handed over in its binary form, so no Python loop
+    runs per variable, row or nonzero.
+    """
+    helper = model_builder_helper.ModelBuilderHelper()
+    helper.fill_model_from_sparse_data(np.asarray(colLo,'float64'),np.asarray(colHi,'float64'),
+                                       np.asarray(c,'float64'),np.asarray(rowLo,'float64'),
+                                       np.asarray(rowHi,'float64'),sparse.csr_matrix(A,dtype='float64'))
+    helper.set_maximize(maximize)
+    if integer is not None:
+        for k in np.flatnonzero(integer).tolist():
+            helper.set_var_integrality(k,True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp,'model.pb')
+        if not helper.write_model_to_proto_file(path):
+            raise ValueError('Could not write the model proto')
+        with open(path,'rb') as f:
+            proto = linear_solver_pb2.MPModelProto.FromString(f.read())
+
+    error = solver.LoadModelFromProto(proto)
+    if error:
+        raise ValueError(f'Could not load the model: {error}')
+
+    return solver.variables(),solver.constraints()
+
+
+def updateMatrixModel(solver,variables,constraints,old,new):
+    """
+    Move a model loaded by loadMatrixModel from the arrays in old to the
+    arrays in new (dicts with c, A, rowLo, rowHi, colLo and colHi of the
+    same shapes), changing only the entries that differ so the solver keeps
+    its model and basis. Returns the number of changes.
+    """
+    changes = 0
+
+    objective = solver.Objective()
+    for k in np.flatnonzero(new['c'] != old['c']):
+        objective.SetCoefficient(variables[k],float(new['c'][k]))
+        changes += 1
+
+    A = sparse.csr_matrix(new['A'])
+    diff = (A - sparse.csr_matrix(old['A'])).tocoo()
+    diff.eliminate_zeros()
+    if diff.nnz:
+        values = np.asarray(A[diff.row,diff.col]).ravel()
+        for i,j,v in zip(diff.row.tolist(),diff.col.tolist(),values.tolist()):
+            constraints[i].SetCoefficient(variables[j],v)
+        changes += diff.nnz
+
+    for k in np.flatnonzero((new['colLo'] != old['colLo']) | (new['colHi'] != old['colHi'])):
+        variables[k].SetBounds(float(new['colLo'][k]),float(new['colHi'][k]))
+        changes += 1
+    for k in np.flatnonzero((new['rowLo'] != old['rowLo']) | (new['rowHi'] != old['rowHi'])):
+        constraints[k].SetBounds(float(new['rowLo'][k]),float(new['rowHi'][k]))
+        changes += 1
+
+    return changes
+
+
+def solveMatrixHighs(c,A,rowLo,rowHi,colLo,colHi,maximize=False):
+    """
+    Solve the LP with scipy.optimize.linprog (HiGHS), which takes the sparse
+    matrix directly. Returns (x, objective), or (None, None) if not optimal.
+    """
+    A = sparse.csr_matrix(A)
+    rowLo = np.asarray(rowLo,'float64')
+    rowHi = np.asarray(rowHi,'float64')
+    c = np.asarray(c,'float64')
+
+    eq = rowLo == rowHi
+    up = ~eq & np.isfinite(rowHi)
+    lo = ~eq & np.isfinite(rowLo)
+
+    # Ranged and >= rows are written as <= rows
+    Aub = sparse.vstack([A[up],-A[lo]]).tocsr()
+    bub = np.concatenate((rowHi[up],-rowLo[lo]))
+
+    sol = linprog(-c if maximize else c,
+                  A_ub=Aub if Aub.shape[0] > 0 else None,
+                  b_ub=bub if Aub.shape[0] > 0 else None,
+                  A_eq=A[eq] if eq.any() else None,
+                  b_eq=rowHi[eq] if eq.any() else None,
+                  bounds=np.column_stack((colLo,colHi)),
+                  method='highs')
+
+    if sol.status != 0:
+        return None,None
+    return sol.x,(-sol.fun if maximize else sol.fun)
+
+
+def rhsRanging(c,A,rowLo,rowHi,colLo,colHi,x,colBasic,rowBasic,row,rate):
+    """
+    Parametric analysis of the upper bound of one row around an optimal basis.
+
+    The bound of `row` moves by `rate` per unit of the parameter. While the
+    basis stays feasible the solution moves along a straight line, so this
+    returns the rate of change of x, the shadow prices of every row
+    (d objective / d bound) and the largest parameter step before a basic
+    variable reaches one of its bounds, i.e. the next breakpoint.
+    colBasic and rowBasic flag the basic columns and the rows whose
+    slack is basic.
+    """
+    A = sparse.csr_matrix(A)
+    m,n = A.shape
+    colBasic = np.asarray(colBasic,bool)
+    rowBasic = np.asarray(rowBasic,bool)
+    basic = np.concatenate((colBasic,rowBasic))
+    if basic.sum() != m:
+        raise ValueError(f'The basis has {basic.sum()} columns for {m} rows')
+
+    # Columns of [A -I] for z = [x, A x]
+    M = sparse.hstack([A,-sparse.identity(m)]).tocsc()
+    lu = splu(M[:,basic].tocsc())
+
+    # A nonbasic row sits on its bound and moves with it
+    dHi = np.zeros(n+m)
+    dHi[n+row] = rate
+    dz = np.where(basic,0,dHi)
+    dz[basic] = lu.solve(-(M @ dz))
+
+    shadow = lu.solve(np.concatenate((c,np.zeros(m)))[basic],trans='T')
+
+    # Ratio test, with the moving bound of the row itself
+    z = np.concatenate((x,A @ x))
+    lo = np.concatenate((colLo,rowLo))
+    hi = np.concatenate((colHi,rowHi))
+    up = dz - dHi
+    tol = 1e-12
+    with np.errstate(divide='ignore',invalid='ignore'):
+        stepHi = np.where(basic & (up > tol),(hi - z)/up,np.inf)
+        stepLo = np.where(basic & (dz < -tol),(lo - z)/dz,np.inf)
+    step = max(0.0,min(stepHi.min(),stepLo.min()))
+
+    return dz[:n],shadow,step
+
+
+def solutionValues(solver):
+    """
+    Values of all the variables of a solved pywraplp model as one array,
+    read from the solution proto instead of one solution_value() call each.
+    """
+    response = linear_solver_pb2.MPSolutionResponse()
+    solver.FillSolutionResponseProto(response)
+    return np.array(response.variable_value,'float64')
+
+
+def maxViolation(A,rowLo,rowHi,colLo,colHi,x):
+    """
+    Largest violation of a row or column bound at x (0 if x is feasible).
+    """
+    r = A @ x
+    return float(max(0.0,np.max(r - rowHi,initial=0),np.max(rowLo - r,initial=0),
+                     np.max(x - colHi,initial=0),np.max(colLo - x,initial=0)))
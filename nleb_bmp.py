@@ -0,0 +1,240 @@
+"""
+-----------  NLEB BMP adoption  --------------
+North Lake Erie Basin model with a discrete
+choice of best management practice (BMP) per
+subdivision
+
+Each subdivision adopts at most one BMP. A BMP
+has a fixed cost per adoption, a cost per area
+of the subdivision and removes a fraction of
+the subdivision's P and N exports. Adoption
+variables are binary; the removed exports are
+linked to them by big-M rows (the largest
+export the subdivision can have), which is
+exact because removal only ever helps.
+
+The MIP goes to any pywraplp MIP backend, CBC
+by default, with a hint from its LP relaxation.
+CP-SAT rounds the continuous areas and exports
+to integers, so it is only approximate here.
+
+The BMP workbook (bmpFile) is not distributed
+with the data; nleb_synthetic.syntheticBMPs
+gives a table in the same layout.
+
+May     2021
+----------------------------------------------
+
+"""
+
+import pandas as pd
+import numpy as np
+import os
+from scipy import sparse
+from ortools.linear_solver import pywraplp
+
+import lp_tools
+import nleb_data
+import nleb_linear
+import instrumentation
+
+
+bmpFile = os.path.join(nleb_data.dataFolder,'../ResultsModel/DataBMPs.xlsx')
+
+bmpColumns = ['Fixed','CostHa','Pred','Nred']
+
+
+#%% Data
+
+def readBMPs(path=None):
+    """
+    BMP table from the 'DataBMPs' sheet: Names, Fixed [$M/yr], CostHa
+    [$M/thousand-Ha/yr], Pred and Nred [fraction of exports removed].
+    """
+    path = path or bmpFile
+    if not os.path.exists(path):
+        raise FileNotFoundError(f'No BMP workbook at {path}: pass a table to solveBMP '
+                                '(e.g. nleb_synthetic.syntheticBMPs())')
+    bmps = pd.read_excel(path,sheet_name='DataBMPs',usecols=bmpColumns + ['Names'])
+    return bmps.set_index('Names',drop=False)
+
+
+#%% Model
+
+def bmpMatrices(bmps,capP=0.4,capN=0.3,waterAvailable=False):
+    """
+    The full (subdivision x crop) model of nleb_linear.cropMatrices with
+    three more blocks of columns per (subdivision, BMP), row-major:
+    adoption z (binary), P removed rP and N removed rN [Ton/yr]. Rows added:
+        rP <= Pred * P exports of the subdivision     rP <= Pred * M_P * z
+        rN <= Nred * N exports of the subdivision     rN <= Nred * M_N * z
+        sum over BMPs of z <= 1 (per subdivision)
+    and the basin P and N rows count exports minus removals.
+    """
+    lp = nleb_linear.cropMatrices(capP,capN,waterAvailable,aggregate=False)
+    table = nleb_linear.coefficientTable()
+    nS,nC = lp['nS'],lp['nC']
+    nB = len(bmps)
+    n0 = len(lp['c'])
+    SB = nS * nB
+
+    fixed = bmps.Fixed.to_numpy('float64')
+    costHa = bmps.CostHa.to_numpy('float64')
+    red = {'P':bmps.Pred.to_numpy('float64'),'N':bmps.Nred.to_numpy('float64')}
+
+    s = np.repeat(np.arange(nS),nB)     # subdivision of each (s, b)
+    b = np.tile(np.arange(nB),nS)       # BMP of each (s, b)
+    k = np.arange(SB)
+    z0,r0 = n0,{'P':n0 + SB,'N':n0 + 2*SB}
+    xCols = (s[:,None]*nC + np.arange(nC)).ravel()
+
+    rows,cols,vals = [],[],[]
+    def add(r,c,v):
+        rows.append(r)
+        cols.append(c)
+        vals.append(v)
+
+    for offset,nutrient in ((0,'P'),(2*SB,'N')):
+        coef = table[nutrient + 'exp']
+        bigM = lp['area'] * coef.max(1)
+        # Removal up to the fraction of the subdivision's exports
+        add(offset + k,r0[nutrient] + k,np.ones(SB))
+        add(np.repeat(offset + k,nC),xCols,(-red[nutrient][b][:,None] * coef[s]).ravel())
+        # Nothing removed without adoption
+        add(offset + SB + k,r0[nutrient] + k,np.ones(SB))
+        add(offset + SB + k,z0 + k,-red[nutrient][b] * bigM[s])
+    add(4*SB + s,z0 + k,np.ones(SB))
+
+    nCols = n0 + 3*SB
+    bottom = sparse.csr_matrix((np.concatenate(vals),(np.concatenate(rows),np.concatenate(cols))),
+                               shape=(4*SB + nS,nCols))
+    # Columns local to the BMP block [z, rP, rN]
+    topRight = sparse.csr_matrix((-np.ones(2*SB),
+                                  (np.repeat([lp['rowP'],lp['rowN']],SB),
+                                   np.concatenate((SB + k,2*SB + k)))),
+                                 shape=(lp['A'].shape[0],3*SB))
+    A = sparse.vstack([sparse.hstack([lp['A'],topRight]),bottom],format='csr')
+
+    c = np.concatenate((lp['c'],-(fixed[b] + costHa[b] * lp['area'][s]),np.zeros(2*SB)))
+    rowLo = np.concatenate((lp['rowLo'],np.full(4*SB + nS,-np.inf)))
+    rowHi = np.concatenate((lp['rowHi'],np.zeros(4*SB),np.ones(nS)))
+    colLo = np.concatenate((lp['colLo'],np.zeros(3*SB)))
+    colHi = np.concatenate((lp['colHi'],np.ones(SB),np.full(2*SB,np.inf)))
+    integer = np.zeros(nCols,bool)
+    integer[z0:z0 + SB] = True
+
+    return dict(lp,c=c,A=A,rowLo=rowLo,rowHi=rowHi,colLo=colLo,colHi=colHi,integer=integer,
+                nB=nB,z0=z0)
+
+
+#%% Solver
+
+def solveBMP(bmps=None,capP=0.4,capN=0.3,waterAvailable=False,backend='CBC',threads=None,
+             timeLimit=None,gap=None,hint=True,verbose=False):
+    """
+    Best crop areas and BMP adoption for one (capP, capN) scenario.
+
+    backend is a pywraplp MIP solver ('CBC', 'SCIP', ...); threads defaults
+    to every core (for backends that use them) and timeLimit is in seconds.
+    gap stops the search at that relative gap. The LP relaxation (GLOP) is
+    solved first: its value is an upper bound, and with hint its rounded
+    adoption and its areas are passed to the MIP solver. CP-SAT gets no
+    hint: after it rounds the continuous variables to integers, a hinted
+    search can find the production rows infeasible.
+
+    Returns a dict with status, utility, best bound, relative gap, areas
+    (subdivision x crop) and adoption (subdivision x BMP) frames, production
+    and the LP bound, or None if no solution was found.
+    """
+    crops,subdivisions = nleb_linear.crops,nleb_linear.subdivisions
+    bmps = readBMPs() if bmps is None else bmps
+    rec = instrumentation.Recorder('nleb_bmp',event='solve',backend=backend,
+                                   capP=float(capP),capN=float(capN),bmps=len(bmps))
+
+    with rec.phase('build'):
+        mip = bmpMatrices(bmps,capP,capN,waterAvailable)
+        nS,nC,nB,z0 = mip['nS'],mip['nC'],mip['nB'],mip['z0']
+        nX = nS * nC
+
+        solver = pywraplp.Solver.CreateSolver(backend)
+        if solver is None:
+            raise ValueError(f'MIP backend not available: {backend}')
+        variables,_ = lp_tools.loadMatrixModel(solver,mip['c'],mip['A'],mip['rowLo'],mip['rowHi'],
+                                               mip['colLo'],mip['colHi'],maximize=True,
+                                               integer=mip['integer'])
+        solver.SetNumThreads(threads or os.cpu_count())
+        if timeLimit is not None:
+            solver.SetTimeLimit(int(timeLimit * 1000))
+        if verbose:
+            solver.EnableOutput()
+
+    lpBound = None
+    with rec.phase('relaxation'):
+        relaxed = pywraplp.Solver.CreateSolver('GLOP')
+        lp_tools.loadMatrixModel(relaxed,mip['c'],mip['A'],mip['rowLo'],mip['rowHi'],
+                                 mip['colLo'],mip['colHi'],maximize=True)
+        if relaxed.Solve() == pywraplp.Solver.OPTIMAL:
+            lpBound = relaxed.Objective().Value()
+            if hint and backend != 'CP-SAT':
+                values = lp_tools.solutionValues(relaxed)
+                z = values[z0:z0 + nS*nB].reshape((nS,nB))
+                adopt = np.zeros((nS,nB))
+                best = z.argmax(1)
+                adopt[np.arange(nS),best] = z[np.arange(nS),best] >= 0.5
+                hinted = variables[:nX] + variables[z0:z0 + nS*nB]
+                solver.SetHint(hinted,values[:nX].tolist() + adopt.ravel().tolist())
+    rec.add(lpBound=lpBound)
+
+    params = pywraplp.MPSolverParameters()
+    if gap is not None:
+        params.SetDoubleParam(pywraplp.MPSolverParameters.RELATIVE_MIP_GAP,gap)
+
+    with rec.phase('solve'):
+        status = solver.Solve(params)
+    rec.add(status=int(status),solverWallTime=solver.wall_time()*1e-3,threads=threads or os.cpu_count())
+
+    if status not in (pywraplp.Solver.OPTIMAL,pywraplp.Solver.FEASIBLE):
+        rec.add(optimal=False)
+        rec.emit()
+        if verbose:
+            print('The solver could not find a solution.')
+        return None
+
+    with rec.phase('extract'):
+        values = lp_tools.solutionValues(solver)
+        utility = solver.Objective().Value()
+        bound = solver.Objective().BestBound()
+        relGap = abs(bound - utility) / max(1.0,abs(utility))
+        violation = lp_tools.maxViolation(mip['A'],mip['rowLo'],mip['rowHi'],
+                                          mip['colLo'],mip['colHi'],values)
+        areas = pd.DataFrame(values[:nX].reshape((nS,nC)),columns=crops,index=subdivisions)
+        adoption = pd.DataFrame(np.round(values[z0:z0 + nS*nB]).reshape((nS,nB)).astype(int),
+                                columns=list(bmps.index),index=subdivisions)
+        prod = values[nX:nX + nC]
+
+    rec.add(optimal=status == pywraplp.Solver.OPTIMAL,utility=utility,bound=bound,gap=relGap,
+            adoptions=int(adoption.to_numpy().sum()),maxViolation=violation)
+    rec.emit()
+
+    if verbose:
+        print('-------------------------------------------')
+        print(f'BMP solution for reduction {int(capP*100)}P%, {int(capN*100)}N%')
+        print('Total utility:', round(utility,3),'Million CAD (gap',round(relGap,6),')')
+        print('Subdivisions adopting a BMP:', int(adoption.to_numpy().sum()),'of',nS)
+        print('-------------------------------------------\n')
+
+    return {'status':'optimal' if status == pywraplp.Solver.OPTIMAL else 'feasible',
+            'utility':utility,'bound':bound,'gap':relGap,'lpBound':lpBound,
+            'areas':areas,'adoption':adoption,
+            'prod':pd.DataFrame(prod,columns=['Prod_Ton'],index=crops),
+            'maxViolation':violation}
+
+
+if __name__ == '__main__':
+
+    os.chdir(nleb_data.dataFolder)
+
+    sol = solveBMP(capP=0.4,capN=0.3,timeLimit=300,verbose=True)
+    if sol is not None:
+        sol['adoption'].to_csv('BMP_adoption.csv')
+        sol['areas'].to_csv('BMP_areas.csv')
@@ -0,0 +1,146 @@
+"""
+-------------  NLEB data  --------------
+North Lake Erie Basin input data shared by
+nleb_linear and nleb_nonlinear
+
+The Excel workbooks are parsed once and kept as
+.npy arrays in a cache folder. Later runs (and
+every worker process) memory-map those arrays.
+The cache is rebuilt when a workbook changes.
+
+May     2021
+----------------------------------------
+
+"""
+
+import pandas as pd
+import numpy as np
+import os
+import json
+import hashlib
+
+import instrumentation
+
+
+dataFolder = os.path.expanduser('~/Documents/data/folder/path')
+
+parametersFile = os.path.join(dataFolder,'../ResultsModel/DataCropsLingo.xlsx')
+baselineFile = os.path.join(dataFolder,'../AllCropsOntario2016.xlsx')
+
+cacheFolder = os.path.join(dataFolder,'nlebCache')
+
+parameterNames = ['Pexp','Nexp','Water','Yield','Cost','Price']
+
+
+#%% Cache
+
+def fileSignature(path):
+    with open(path,'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    stat = os.stat(path)
+    return {'path':os.path.abspath(path),'mtime':stat.st_mtime_ns,'size':stat.st_size,'sha256':digest}
+
+def isFresh(meta):
+    """
+    True if every source workbook still matches the cache. A changed mtime
+    alone triggers a hash check, so touching a file does not rebuild the cache.
+    Sources that no longer exist (e.g. synthetic data sets) are not checked.
+    """
+    for source in meta['sources']:
+        path = source['path']
+        if not os.path.exists(path):
+            continue
+        stat = os.stat(path)
+        if stat.st_mtime_ns == source['mtime'] and stat.st_size == source['size']:
+            continue
+        if fileSignature(path)['sha256'] != source['sha256']:
+            return False
+    return True
+
+def writeCache(folder,parameters,crops,subdivisions,x0,sources=()):
+    """
+    Store the data as .npy files plus a meta.json index. Every file is
+    written under a temporary name and moved into place, meta.json last,
+    so concurrent readers never see a half-written cache.
+    """
+    os.makedirs(folder,exist_ok=True)
+    tag = f'.{os.getpid()}.tmp'
+
+    arrays = {'parameters':np.asarray(parameters.loc[:,parameterNames],'float64'),
+              'x0':np.asarray(x0,'float64')}
+    for name,arr in arrays.items():
+        with open(os.path.join(folder,name + '.npy' + tag),'wb') as f:
+            np.save(f,arr)
+        os.replace(os.path.join(folder,name + '.npy' + tag),os.path.join(folder,name + '.npy'))
+
+    meta = {'crops':list(crops),'subdivisions':list(subdivisions),
+            'parameterNames':parameterNames,'sources':list(sources)}
+    with open(os.path.join(folder,'meta.json' + tag),'w') as f:
+        json.dump(meta,f)
+    os.replace(os.path.join(folder,'meta.json' + tag),os.path.join(folder,'meta.json'))
+
+def readExcel():
+    parameters = pd.read_excel(parametersFile,
+                               sheet_name='DataParametersCrops',
+                               usecols=parameterNames + ['Names'])
+
+    crops = parameters.Names.tolist()
+
+    baseline = pd.read_excel(baselineFile,
+                             sheet_name='FinalData',
+                             usecols=['Geography'] + crops)
+
+    subdivisions = baseline.Geography.tolist()
+
+    # Baseline [thousand-Ha/yr]
+    x0 = baseline.loc[:,crops].to_numpy('float64').reshape((len(subdivisions),len(crops))) * 1e-3
+
+    return parameters,crops,subdivisions,x0
+
+
+#%% Loader
+
+def loadData(folder=None):
+    """
+    Crop parameters, crop names, subdivision names and baseline areas x0
+    [thousand-Ha/yr] (subdivisions x crops).
+
+    folder defaults to the NLEB_DATA environment variable, then to
+    cacheFolder. The arrays are memory-mapped read-only, so processes that
+    load the same cache share its pages.
+    """
+    folder = folder or os.environ.get('NLEB_DATA') or cacheFolder
+    metaFile = os.path.join(folder,'meta.json')
+    rec = instrumentation.Recorder('nleb_data',event='load',folder=folder)
+
+    with rec.phase('validate'):
+        meta = None
+        if os.path.exists(metaFile):
+            with open(metaFile) as f:
+                meta = json.load(f)
+            if not isFresh(meta):
+                meta = None
+    rec.add(cacheHit=meta is not None)
+
+    if meta is None:
+        with rec.phase('excel'):
+            parameters,crops,subdivisions,x0 = readExcel()
+            writeCache(folder,parameters,crops,subdivisions,x0,
+                       [fileSignature(parametersFile),fileSignature(baselineFile)])
+        with open(metaFile) as f:
+            meta = json.load(f)
+
+    with rec.phase('load'):
+        crops = meta['crops']
+        subdivisions = meta['subdivisions']
+
+        parameters = pd.DataFrame(np.load(os.path.join(folder,'parameters.npy'),mmap_mode='r'),
+                                  columns=meta['parameterNames'],index=crops)
+        parameters['Names'] = crops
+
+        x0 = np.load(os.path.join(folder,'x0.npy'),mmap_mode='r')
+
+    rec.add(subdivisions=len(subdivisions),crops=len(crops))
+    rec.emit()
+
+    return parameters,crops,subdivisions,x0
@@ -0,0 +1,227 @@
+"""
+-----------  NLEB decomposition  -------------
+Dantzig-Wolfe decomposition of the NLEB linear
+model by subdivision
+
+Subdivisions are only linked by the basin-wide
+P, N and water rows and the per-crop production
+bounds. The master LP (GLOP) keeps those rows and
+one convexity row per subdivision; its columns
+are crop allocations of single subdivisions. The
+pricing subproblems (best allocation of each
+subdivision's area at the master's prices) run
+in blocks on a process pool.
+
+May     2021
+----------------------------------------------
+
+"""
+
+import numpy as np
+import os
+import time
+import multiprocessing
+from ortools.linear_solver import pywraplp
+
+import nleb_linear
+import instrumentation
+
+
+#%% Subproblems
+
+def subdivisionCoefficients():
+    """
+    Coefficients of every (subdivision, crop) pair as S x C arrays. They
+    are crop-level in the current data, but the pricing does not rely on it.
+    """
+    parameters,x0 = nleb_linear.parameters,nleb_linear.x0
+    shape = x0.shape
+    yieldHa = parameters.Yield.to_numpy('float64')
+    price = parameters.Price.to_numpy('float64')/1000
+    costHa = parameters.Cost.to_numpy('float64')*1e-3
+    return {'profit':np.broadcast_to(price*yieldHa - costHa,shape),
+            'P':np.broadcast_to(parameters.Pexp.to_numpy('float64'),shape),
+            'N':np.broadcast_to(parameters.Nexp.to_numpy('float64'),shape),
+            'W':np.broadcast_to(parameters.Water.to_numpy('float64'),shape),
+            'yield':np.broadcast_to(yieldHa,shape),
+            'area':np.asarray(x0).sum(1)}
+
+def initPricing():
+    global coef
+    coef = subdivisionCoefficients()
+
+def priceBlock(task):
+    """
+    Pricing of subdivisions start:end. With row prices yP, yN, yW and
+    yProd (per crop), the best allocation of a subdivision is all its area
+    on the crop with the largest reduced profit, or nothing if none is
+    positive. Returns the best crop and the subproblem value of each one.
+    """
+    global coef
+    start,end,yP,yN,yW,yProd = task
+    g = (coef['profit'][start:end] - yP*coef['P'][start:end] - yN*coef['N'][start:end]
+         - yW*coef['W'][start:end] - yProd*coef['yield'][start:end])
+    best = g.argmax(1)
+    value = coef['area'][start:end] * np.maximum(0,g[np.arange(end-start),best])
+    return start,best,value
+
+
+#%% Master
+
+class Master:
+    """
+    Restricted master LP over subdivision allocations. Rows that the
+    initial columns may violate (P, N and production) get penalized
+    artificial slacks, so the master is always feasible.
+    """
+
+    def __init__(self,capP,capN,waterAvailable,coef):
+        nS,nC = coef['profit'].shape
+        self.coef = coef
+
+        # Right-hand sides as in nleb_linear.cropMatrices, without the S x C matrix
+        x0 = np.asarray(nleb_linear.x0)
+        allowed = {k:float((coef[k] * x0).sum()) for k in ('P','N','W')}
+        prod = (coef['yield'] * x0).sum(0)
+
+        solver = pywraplp.Solver.CreateSolver('GLOP')
+        inf = solver.infinity()
+
+        self.rowP = solver.Constraint(-inf,allowed['P'] * (1-capP))
+        self.rowN = solver.Constraint(-inf,allowed['N'] * (1-capN))
+        self.rowW = solver.Constraint(-inf,allowed['W'])
+        self.rowProd = [solver.Constraint(nleb_linear.minProd * prod[c],nleb_linear.maxProd * prod[c])
+                        for c in range(nC)]
+        self.rowConv = [solver.Constraint(-inf,1) for s in range(nS)]
+
+        objective = solver.Objective()
+        objective.SetMaximization()
+
+        # Additional water
+        w = solver.NumVar(0,inf if waterAvailable else 0,'w')
+        self.rowW.SetCoefficient(w,-1)
+        objective.SetCoefficient(w,nleb_linear.costWater)
+
+        # Artificial slacks
+        self.penalty = 1e4 * max(1.0,np.abs(coef['profit']).max())
+        self.artificial = []
+        for row,sign in [(self.rowP,-1),(self.rowN,-1)] + \
+                        [(r,s) for r in self.rowProd for s in (1,-1)]:
+            a = solver.NumVar(0,inf,'')
+            row.SetCoefficient(a,sign)
+            objective.SetCoefficient(a,-self.penalty)
+            self.artificial.append(a)
+
+        self.solver = solver
+        self.columns = []      # (subdivision, allocation, variable)
+
+    def addColumn(self,s,alloc):
+        solver = self.solver
+        lam = solver.NumVar(0,solver.infinity(),'')
+        solver.Objective().SetCoefficient(lam,float(self.coef['profit'][s] @ alloc))
+        self.rowP.SetCoefficient(lam,float(self.coef['P'][s] @ alloc))
+        self.rowN.SetCoefficient(lam,float(self.coef['N'][s] @ alloc))
+        self.rowW.SetCoefficient(lam,float(self.coef['W'][s] @ alloc))
+        for c,row in enumerate(self.rowProd):
+            if alloc[c] != 0:
+                row.SetCoefficient(lam,float(self.coef['yield'][s,c] * alloc[c]))
+        self.rowConv[s].SetCoefficient(lam,1)
+        self.columns.append((s,alloc,lam))
+
+    def duals(self):
+        """
+        Row prices (objective change per unit of right-hand side).
+        """
+        return (self.rowP.dual_value(),self.rowN.dual_value(),self.rowW.dual_value(),
+                np.array([row.dual_value() for row in self.rowProd]),
+                np.array([row.dual_value() for row in self.rowConv]))
+
+    def allocation(self):
+        nS,nC = self.coef['profit'].shape
+        x = np.zeros((nS,nC))
+        for s,alloc,lam in self.columns:
+            x[s] += lam.solution_value() * alloc
+        return x
+
+
+#%% Solver
+
+def decompose(capP=0.4,capN=0.3,waterAvailable=False,processes=None,blocks=None,
+              tol=1e-6,maxIter=500):
+    """
+    Solve the NLEB linear model by column generation.
+
+    Each iteration solves the master, prices every subdivision at the
+    master's row prices on the pool, and adds the allocations with positive
+    reduced profit. The master objective is a lower bound (once the
+    artificial slacks are zero) and the master objective plus the reduced
+    profits of the subproblems is an upper bound; stops when their relative
+    gap is below tol.
+
+    Returns a dict with areas x (S x C), production, utility, the upper
+    bound, the gap, the iterations, the number of columns and the remaining
+    artificial slack (non-zero means the scenario is infeasible).
+    """
+    rec = instrumentation.Recorder('nleb_decomposition',event='solve',
+                                   capP=float(capP),capN=float(capN))
+
+    coef = subdivisionCoefficients()
+    nS,nC = coef['profit'].shape
+
+    processes = processes or os.cpu_count()
+    blocks = blocks or 4*processes
+    edges = np.linspace(0,nS,min(nS,blocks)+1).astype(int)
+
+    with rec.phase('build'):
+        master = Master(capP,capN,waterAvailable,coef)
+
+        # Start from the 2016 allocation of every subdivision
+        x0 = np.asarray(nleb_linear.x0)
+        for s in range(nS):
+            master.addColumn(s,x0[s].copy())
+
+    rec.record['phases']['master'] = 0.0
+    rec.record['phases']['pricing'] = 0.0
+
+    with multiprocessing.Pool(processes,initializer=initPricing) as pool:
+        for it in range(1,maxIter+1):
+            start = time.perf_counter()
+            status = master.solver.Solve()
+            rec.record['phases']['master'] += time.perf_counter() - start
+            if status != pywraplp.Solver.OPTIMAL:
+                rec.add(success=False,status=int(status),iterations=it)
+                rec.emit()
+                return None
+
+            lower = master.solver.Objective().Value()
+            yP,yN,yW,yProd,mu = master.duals()
+
+            start = time.perf_counter()
+            reduced = np.zeros(nS)
+            bestCrop = np.zeros(nS,int)
+            tasks = [(a,b,yP,yN,yW,yProd) for a,b in zip(edges[:-1],edges[1:])]
+            for a,best,value in pool.imap_unordered(priceBlock,tasks):
+                bestCrop[a:a+len(best)] = best
+                reduced[a:a+len(best)] = value - mu[a:a+len(best)]
+            rec.record['phases']['pricing'] += time.perf_counter() - start
+
+            upper = lower + np.maximum(reduced,0).sum()
+            gap = (upper - lower) / max(1.0,abs(lower))
+            if gap <= tol:
+                break
+
+            for s in np.flatnonzero(reduced > tol * max(1.0,abs(lower)) / nS):
+                alloc = np.zeros(nC)
+                alloc[bestCrop[s]] = coef['area'][s]
+                master.addColumn(s,alloc)
+
+    x = master.allocation()
+    artificial = sum(a.solution_value() for a in master.artificial)
+    utility = lower + master.penalty * artificial
+
+    rec.add(success=artificial <= tol,iterations=it,columns=len(master.columns),
+            objective=utility,upper=upper,gap=gap,artificial=artificial)
+    rec.emit()
+
+    return {'x':x,'prod':(coef['yield'] * x).sum(0),'utility':utility,'upper':upper,
+            'gap':gap,'iterations':it,'columns':len(master.columns),'artificial':artificial}
@@ -11,173 +11,625 @@ April   2021
 import pandas as pd
 import numpy as np
 import os
+import heapq
+import multiprocessing
+from scipy import sparse
 from ortools.linear_solver import pywraplp
 
+import lp_tools
+import nleb_data
+import instrumentation
+import result_cube
+import solve_cache
 
-os.chdir('~/Documents/data/folder/path')
 
 #% Parameters
-parameters = pd.read_excel(
-  '../ResultsModel/DataCropsLingo.xlsx',
-  sheet_name='DataParametersCrops',
-  usecols=['Pexp','Nexp','Water','Yield','Cost','Price','Names']
-)
+parameters,crops,subdivisions,x0 = nleb_data.loadData()
 
-parameters.index = parameters.Names.tolist()
-crops = parameters.Names.tolist()
+# Min & Max production
+minProd = 0.5
+maxProd = 1.5
 
-baseline = pd.read_excel(
-  '../AllCropsOntario2016.xlsx',
-  sheet_name='FinalData',
-  usecols=['Geography'] + crops
-)
+# Cost of additional water [$M/(thousand-m^3 yr)]
+costWater = 0
 
-subdivisions = baseline.Geography.tolist()
+#%% Optimization model
+coefficientNames = ['Yield','Cost','Price','Pexp','Nexp','Water']
 
+def coefficientTable(coefficients=None):
+    """
+    Model coefficients as subdivision x crop arrays. coefficients may give
+    any of coefficientNames per (subdivision, crop); the others come from
+    the crop-level parameters.
+    """
+    global parameters,x0
+    coefficients = coefficients or {}
+    return {k:np.broadcast_to(np.asarray(coefficients[k],'float64') if k in coefficients
+                              else parameters[k].to_numpy('float64'),x0.shape)
+            for k in coefficientNames}
 
-# Baseline [thousand-Ha/yr]
-x0 = baseline.loc[:,crops].to_numpy().reshape((len(subdivisions),len(crops))) * 1e-3
+def isCropLevel(table):
+    # True if no coefficient changes between subdivisions
+    return all((arr == arr[:1]).all() for arr in table.values())
 
-del baseline
-
-#%% Optimization function
-def solveCrop(capP=0.4,capN=0.3,createHaTable=False,waterAvailable=False):
+def cropMatrices(capP=0.4,capN=0.3,waterAvailable=False,coefficients=None,aggregate=False):
+    """
+    NLEB linear model as arrays: maximize c x  s.t.  rowLo <= A x <= rowHi,
+    colLo <= x <= colHi, with x = [x[s,c] (row-major), y[c], w].
+    Rows are P, N, water, one area row per subdivision and one production
+    row per crop; min and max production are the bounds of y.
+    
+    With aggregate=True and coefficients that only depend on the crop, the
+    area columns are the basin totals X[c] instead and the area rows collapse
+    into one row on the total area. Both models have the same optimal y and
+    utility: any X with sum(X) <= total area splits back into subdivisions
+    (see areaTable). 'nX' is the number of area columns either way.
+    """
+    global subdivisions,x0,minProd,maxProd,costWater
     
-    global parameters,crops,subdivisions,x0
+    nS = len(subdivisions)
+    nC = x0.shape[1]
     
     # Parameters ----------------------------------------------------------------------------------
-    yieldHa = parameters.Yield       # [Ton/thousand-Ha]
-    costHa = parameters.Cost*1e-3    # [$M/thousand-Ha]
-    costWater = 0                    # [$M/(thousand-m^3 yr)]
-    exportPHa = parameters.Pexp      # [Ton/thousand-Ha]
-    exportNHa = parameters.Nexp      # [Ton/thousand-Ha]
-    waterUseHa = parameters.Water    # [thousand-m^3/thousand-Ha]
+    table = coefficientTable(coefficients)
+    yieldHa = table['Yield']             # [Ton/thousand-Ha]
+    costHa = table['Cost']*1e-3          # [$M/thousand-Ha]
+    exportPHa = table['Pexp']            # [Ton/thousand-Ha]
+    exportNHa = table['Nexp']            # [Ton/thousand-Ha]
+    waterUseHa = table['Water']          # [thousand-m^3/thousand-Ha]
+    price = table['Price']/1000          # [$M/Ton]
     
     # Production baseline [Ton/yr]
-    prod = x0.sum(0) * yieldHa
+    prod = (x0 * yieldHa).sum(0)
     
     # Allowed emissions or use
-    allowed = {'P':np.matmul(x0.sum(0),exportPHa),    # [Ton/yr]
-               'N':np.matmul(x0.sum(0),exportNHa),    # [Ton/yr]
-               'W':np.matmul(x0.sum(0),waterUseHa)}   # [thousand-m^3/yr]
-    
-    # Price baseline [$M/Ton]
-    price = parameters.Price/1000       # [$M/Ton]
+    allowed = {'P':(x0 * exportPHa).sum(),    # [Ton/yr]
+               'N':(x0 * exportNHa).sum(),    # [Ton/yr]
+               'W':(x0 * waterUseHa).sum()}   # [thousand-m^3/yr]
     
     # Available area
     area = x0.sum(1)
     
-    # Min & Max production
-    minProd = 0.5
-    maxProd = 1.5
+    aggregated = aggregate and isCropLevel(table)
+    if aggregated:
+        # One column per crop, one row on the total area
+        profit = (price*yieldHa - costHa)[0]
+        export = sparse.csr_matrix(np.vstack((exportPHa[0],exportNHa[0],waterUseHa[0])))
+        areaRows = sparse.csr_matrix(np.ones((1,nC)))
+        prodRows = sparse.diags(yieldHa[0])
+        areaHi = [area.sum()]
+    else:
+        profit = (price*yieldHa - costHa).ravel()
+        export = sparse.csr_matrix(np.vstack((exportPHa.ravel(),exportNHa.ravel(),waterUseHa.ravel())))
+        areaRows = sparse.kron(sparse.identity(nS),np.ones((1,nC)))
+        prodRows = sparse.csr_matrix((yieldHa.ravel(),(np.tile(np.arange(nC),nS),np.arange(nS*nC))),
+                                     shape=(nC,nS*nC))
+        areaHi = area
+    nX = len(profit)
     
+    # Objective function
+    c = np.concatenate((profit,np.zeros(nC),[costWater]))
     
-    # Optimization model --------------------------------------------------------------------------
-    solver = pywraplp.Solver.CreateSolver('GLOP')
+    # Runoff export and water use, area and production rows
+    A = sparse.bmat([[export,None,sparse.csr_matrix([[0],[0],[-1]])],
+                     [areaRows,None,None],
+                     [prodRows,-sparse.identity(nC),None]],format='csr')
     
-    # Decision variables
-    x = {}      # [Thousand-Ha/yr]
-    for s in subdivisions:
-        for c in crops:
-            x[s,c] = solver.NumVar(0.0,solver.infinity(),f'x[{s},{c}]')
+    rowLo = np.concatenate((np.full(3+len(areaHi),-np.inf),np.zeros(nC)))
+    rowHi = np.concatenate(([allowed['P']*(1-capP),allowed['N']*(1-capN),allowed['W']],
+                            areaHi,np.zeros(nC)))
     
-    y = {}      # [Ton/yr]
-    for c in crops:
-        y[c] = solver.NumVar(0.0,solver.infinity(),f'y[{c}]')
+    colLo = np.concatenate((np.zeros(nX),minProd*prod,[0]))
+    colHi = np.concatenate((np.full(nX,np.inf),maxProd*prod,[np.inf if waterAvailable else 0]))
     
-    if waterAvailable == True:
-        w = solver.NumVar(0.0,solver.infinity(),'w')
-    else:
-        w = solver.NumVar(0.0,0,'w')
-    # Objective function
-    solver.Maximize(solver.Sum([(price[c]*yieldHa[c] - costHa[c]) * x[s,c] for s in subdivisions
-                                                                           for c in crops])
-                    + costWater * w)
+    return {'c':c,'A':A,'rowLo':rowLo,'rowHi':rowHi,'colLo':colLo,'colHi':colHi,
+            'allowed':allowed,'rowP':0,'rowN':1,'nS':nS,'nC':nC,'nX':nX,
+            'aggregated':aggregated,'area':area}
+
+def areaTable(lp,values):
+    """
+    Areas [thousand-Ha] per subdivision and crop (S x C) from a solution.
+    Basin totals of the aggregated model are split in proportion to the
+    subdivisions' areas, which keeps every subdivision within its area.
+    """
+    nS,nC,nX = lp['nS'],lp['nC'],lp['nX']
+    if lp['aggregated']:
+        return np.outer(lp['area'] / lp['area'].sum(),values[:nX])
+    return values[:nX].reshape((nS,nC))
+
+
+class CropModel:
+    """
+    NLEB linear model built once and re-solved for any (capP, capN).
+    
+    Only the right-hand sides of the P and N constraints depend on the caps,
+    so solve() just moves those two bounds and lets GLOP restart from the
+    basis of the previous solve instead of building a new model.
+    The model is assembled by cropMatrices and loaded in bulk; backend='HiGHS'
+    solves the same arrays with scipy's linprog (no warm start).
+    With presolve=True (default) the crop-level model is solved aggregated
+    by crop; it falls back to the full model when coefficients (see
+    coefficientTable) vary by subdivision.
+    """
+    
+    def __init__(self,waterAvailable=False,backend='GLOP',presolve=True,coefficients=None):
+        
+        rec = instrumentation.Recorder('nleb_linear',event='build',backend=backend,
+                                       waterAvailable=waterAvailable)
+        
+        with rec.phase('build'):
+            self.lp = cropMatrices(0,0,waterAvailable,coefficients,aggregate=presolve)
+            self.allowed = self.lp['allowed']
+            self.backend = backend
+            self.waterAvailable = waterAvailable
+            
+            if backend == 'GLOP':
+                solver = pywraplp.Solver.CreateSolver('GLOP')
+                
+                # Without presolve GLOP keeps the previous basis when only bounds change
+                solver.SetSolverSpecificParametersAsString('use_preprocessing: false')
+                
+                lp = self.lp
+                self.variables,self.constraints = lp_tools.loadMatrixModel(solver,lp['c'],lp['A'],
+                                                                           lp['rowLo'],lp['rowHi'],
+                                                                           lp['colLo'],lp['colHi'],
+                                                                           maximize=True)
+                self.solver = solver
+            elif backend != 'HiGHS':
+                raise ValueError(f'Unknown backend: {backend}')
+        
+        rec.add(variables=len(self.lp['c']),constraints=len(self.lp['rowHi']),
+                nonzeros=int(self.lp['A'].nnz),aggregated=self.lp['aggregated'])
+        rec.emit()
+    
+    
+    def setCoefficients(self,coefficients):
+        """
+        Change the model coefficients in place (see coefficientTable). GLOP
+        keeps its model and only the entries that differ are changed, so the
+        next solve starts from the current basis. The caps are relative to
+        the allowed exports under the new coefficients.
+        """
+        lp = cropMatrices(0,0,self.waterAvailable,coefficients,aggregate=self.lp['aggregated'])
+        if lp['aggregated'] != self.lp['aggregated']:
+            raise ValueError('The coefficients vary by subdivision: build a CropModel with them')
+        
+        if self.backend == 'GLOP':
+            lp_tools.updateMatrixModel(self.solver,self.variables,self.constraints,self.lp,lp)
+        self.lp = lp
+        self.allowed = lp['allowed']
+    
+    
+    def solve(self,capP=0.4,capN=0.3,createHaTable=False,verbose=False):
+        
+        global crops,subdivisions
+        
+        rec = instrumentation.Recorder('nleb_linear',event='solve',backend=self.backend,
+                                       capP=float(capP),capN=float(capN))
+        
+        lp = self.lp
+        nC,nX = lp['nC'],lp['nX']
+        lp['rowHi'][lp['rowP']] = self.allowed['P'] * (1-capP)
+        lp['rowHi'][lp['rowN']] = self.allowed['N'] * (1-capN)
+        
+        # Solution ------------------------------------------------------------------------------------
+        if self.backend == 'GLOP':
+            solver = self.solver
+            self.constraints[lp['rowP']].SetUb(lp['rowHi'][lp['rowP']])
+            self.constraints[lp['rowN']].SetUb(lp['rowHi'][lp['rowN']])
+            
+            with rec.phase('solve'):
+                status = solver.Solve()
+            rec.add(status=int(status),iterations=int(solver.iterations()),
+                    solverWallTime=solver.wall_time()*1e-3)
+            
+            with rec.phase('extract'):
+                if status == solver.OPTIMAL or status == solver.FEASIBLE:
+                    values = lp_tools.solutionValues(solver)
+                    utility = solver.Objective().Value()
+                else:
+                    values,utility = None,None
+        else:
+            with rec.phase('solve'):
+                values,utility = lp_tools.solveMatrixHighs(lp['c'],lp['A'],lp['rowLo'],lp['rowHi'],
+                                                           lp['colLo'],lp['colHi'],maximize=True)
+        
+        self.values = values
+        self.utility = utility
+        
+        if values is None:
+            rec.add(optimal=False)
+            rec.emit()
+            if verbose:
+                print('The solver could not solve the problem.')
+            return None
+        
+        rec.add(optimal=True,utility=utility,water=float(values[-1]))
+        # A full A x product: only when someone listens
+        if instrumentation.sink is not None:
+            rec.add(maxViolation=lp_tools.maxViolation(lp['A'],lp['rowLo'],lp['rowHi'],
+                                                       lp['colLo'],lp['colHi'],values))
+        
+        if verbose:
+            print('-------------------------------------------')
+            print(f'Solution found for reduction {str(int(capP*100))}P%, {str(int(capN*100))}N%')
+            print('Additional water:', round(values[-1],3), 'thousand cubic meters')
+            print('Total utility:', round(utility,3),'Million CAD')
+            print('-------------------------------------------\n')
+        
+        with rec.phase('frame'):
+            # Data frame of solution
+            if createHaTable == True:
+                self.optSol = pd.DataFrame(areaTable(lp,values),columns=crops,index=subdivisions)
+            
+            # Data frame of production
+            optSolProd = pd.DataFrame(values[nX:nX+nC],columns=['Prod_Ton'],index=crops)
+        
+        rec.emit()
+        return optSolProd
+
+
+#%% Optimization function
+@solve_cache.memoize('nleb_linear',lambda: (parameters,x0,minProd,maxProd,costWater))
+def solveCrop(capP=0.4,capN=0.3,createHaTable=False,waterAvailable=False,verbose=False,
+              presolve=True):
+    return CropModel(waterAvailable,presolve=presolve).solve(capP,capN,createHaTable,verbose)
+
+
+def solveChunkToCube(chunk):
+    """
+    Solve a run of neighbouring scenarios and write areas, production,
+    utility and additional water straight into the worker's result cube.
+    """
+    global workerModel,workerCube
+    lp = workerModel.lp
+    nC,nX = lp['nC'],lp['nX']
+    for j,i,cp,cn in chunk:
+        if workerModel.solve(cp,cn) is None:
+            continue
+        values = workerModel.values
+        workerCube['area'][j,i] = areaTable(lp,values)
+        workerCube['prod'][j,i] = values[nX:nX+nC]
+        workerCube['utility'][j,i] = workerModel.utility
+        workerCube['water'][j,i] = values[-1]
+    for arr in workerCube.values():
+        arr.flush()
+    return len(chunk)
+
+def sweepCube(capP,capN,folder,processes=None,waterAvailable=False):
+    """
+    Solve the capP x capN grid like sweepCaps but keep every solution in a
+    memory-mapped cube in folder (see result_cube): 'area' (capP x capN x
+    subdivision x crop) [thousand-Ha], 'prod' [Ton/yr], 'utility' [$M] and
+    'water' [thousand-m^3]. Scenarios without a solution stay NaN.
+    """
+    global crops,subdivisions
+    
+    result_cube.createCube(folder,
+                           {'capP':[round(c,3) for c in capP],'capN':[round(c,3) for c in capN],
+                            'subdivision':subdivisions,'crop':crops},
+                           {'area':('capP','capN','subdivision','crop'),
+                            'prod':('capP','capN','crop'),
+                            'utility':('capP','capN'),
+                            'water':('capP','capN')})
     
-    # Constraints of runoff export and water use
-    solver.Add(solver.Sum([exportPHa[c] * x[s,c] for s in subdivisions
-                                                 for c in crops]) <= allowed['P'] * (1-capP))
-    solver.Add(solver.Sum([exportNHa[c] * x[s,c] for s in subdivisions
-                                                 for c in crops]) <= allowed['N'] * (1-capN))
-    solver.Add(solver.Sum([waterUseHa[c] * x[s,c] for s in subdivisions
-                                                  for c in crops]) <= allowed['W'] + w)
+    order = [(j,i,capP[j],capN[i]) for j,i in serpentine(len(capP),len(capN))]
     
-    # Area
-    for s,i in zip(subdivisions,range(len(subdivisions))):
-        solver.Add(solver.Sum([x[s,c] for c in crops]) <= area[i])
+    processes = processes or os.cpu_count()
+    nChunks = min(len(order),4*processes)
+    bounds = np.linspace(0,len(order),nChunks+1).astype(int)
+    chunks = [order[a:b] for a,b in zip(bounds[:-1],bounds[1:])]
     
-    # Production
-    for c in crops:
-        solver.Add(solver.Sum([yieldHa[c] * x[s,c] for s in subdivisions]) <= y[c])
-        solver.Add(solver.Sum([yieldHa[c] * x[s,c] for s in subdivisions]) >= y[c])
+    with multiprocessing.Pool(processes,initializer=initWorker,
+                              initargs=(waterAvailable,folder)) as pool:
+        for _ in pool.imap_unordered(solveChunkToCube,chunks):
+            pass
     
-    # Min and max production
-    for c in crops:
-        solver.Add(solver.Sum([minProd * prod[c]]) <= y[c])
-        solver.Add(solver.Sum([maxProd * prod[c]]) >= y[c])
+    return result_cube.openCube(folder)[0]
+
+
+#%% Parametric analysis
+def capFrontier(fixedCap=0.3,vary='P',start=0.0,stop=0.5,waterAvailable=False,eps=1e-7):
+    """
+    Exact production frontier along one cap with the other one fixed.
+    
+    The cap only moves the right-hand side of its row, so the optimum is
+    piecewise linear in it. Each piece is found from one solve: the optimal
+    basis gives the slopes and shadow prices (lp_tools.rhsRanging) and the
+    ratio test gives the next breakpoint, where the next solve is made just
+    past the breakpoint. Stops early if the model becomes infeasible.
     
+    Returns a dict of arrays with the breakpoints ('caps', K+1) and, per
+    piece, production at its start and its slope ('prod','prodSlope', K x C),
+    utility and its slope, and the shadow prices of the P and N rows
+    [$M/Ton]. Use frontierAt to evaluate it at any cap.
+    """
+    model = CropModel(waterAvailable)
+    lp = model.lp
+    nC,nX = lp['nC'],lp['nX']
+    row = lp['rowP'] if vary == 'P' else lp['rowN']
     
+    # d bound / d cap
+    rate = -model.allowed[vary]
     
-    # Solution ------------------------------------------------------------------------------------
-    status = solver.Solve()
+    caps = [start]
+    pieces = {'prod':[],'prodSlope':[],'utility':[],'utilitySlope':[],'shadowP':[],'shadowN':[]}
     
-    if status == solver.OPTIMAL or status == solver.FEASIBLE:
-        print('-------------------------------------------')
-        print(f'Solution found for reduction {str(int(capP*100))}P%, {str(int(capN*100))}N%')
-        print('Additional water:', round(w.solution_value(),3), 'thousand cubic meters')
-        print('Total utility:', round(solver.Objective().Value(),3),'Million CAD')
-        print('-------------------------------------------\n')
+    cap = start
+    probe = start
+    while cap < stop:
+        if vary == 'P':
+            sol = model.solve(probe,fixedCap)
+        else:
+            sol = model.solve(fixedCap,probe)
+        if sol is None:
+            break
         
+        basic = pywraplp.Solver.BASIC
+        colBasic = [v.basis_status() == basic for v in model.variables]
+        rowBasic = [ct.basis_status() == basic for ct in model.constraints]
         
-        # Data frame of solution
-        if createHaTable == True:
-            optSol = pd.DataFrame(columns=crops,index=subdivisions)
-            for s in subdivisions:
-                for c in crops:
-                    optSol.loc[s,c] = x[s,c].solution_value()
+        dx,shadow,step = lp_tools.rhsRanging(lp['c'],lp['A'],lp['rowLo'],lp['rowHi'],
+                                             lp['colLo'],lp['colHi'],model.values,
+                                             colBasic,rowBasic,row,rate)
         
-        # Data frame of production
-        optSolProd = pd.DataFrame(columns=['Prod_Ton'],index=crops)
-        for c in crops:
-            optSolProd.loc[c,'Prod_Ton'] = y[c].solution_value()
+        end = min(probe + step,stop)
         
-    else:
-        print('The solver could not solve the problem.')
+        # Solve just past the breakpoint to get the basis of the next piece
+        if end <= cap:
+            probe = min(cap + eps,stop)
+            continue
+        
+        # Values at the start of the piece
+        back = probe - cap
+        slope = shadow[row] * rate
+        pieces['prod'].append(model.values[nX:nX+nC] - back*dx[nX:nX+nC])
+        pieces['prodSlope'].append(dx[nX:nX+nC])
+        pieces['utility'].append(model.utility - back*slope)
+        pieces['utilitySlope'].append(slope)
+        pieces['shadowP'].append(shadow[lp['rowP']])
+        pieces['shadowN'].append(shadow[lp['rowN']])
+        
+        caps.append(end)
+        cap = end
+        probe = min(cap + eps,stop)
     
-    return optSolProd
-#%% Scenarios
+    frontier = {k:np.array(v) for k,v in pieces.items()}
+    frontier['caps'] = np.array(caps)
+    frontier['vary'] = vary
+    frontier['fixedCap'] = fixedCap
+    return frontier
+
+def frontierAt(frontier,cap):
+    """
+    Production [Ton/yr], utility [$M] and P and N shadow prices at any cap
+    inside the range covered by capFrontier.
+    """
+    caps = frontier['caps']
+    if len(caps) < 2:
+        raise ValueError(f'The frontier has no pieces: no solution at cap {caps[0]}')
+    if cap < caps[0] or cap > caps[-1]:
+        raise ValueError(f'Cap {cap} is outside the frontier [{caps[0]}, {caps[-1]}]')
+    k = min(np.searchsorted(caps,cap,side='right') - 1,len(caps) - 2)
+    d = cap - caps[k]
+    return {'prod':frontier['prod'][k] + d*frontier['prodSlope'][k],
+            'utility':frontier['utility'][k] + d*frontier['utilitySlope'][k],
+            'shadowP':frontier['shadowP'][k],
+            'shadowN':frontier['shadowN'][k]}
+
 
-dx = 0.02
-capP = np.arange(0.0,0.5+dx,dx)
-capN = np.arange(0.0,0.5+dx,dx)
+#%% Scenario helpers
+def scenarioName(capP,capN):
+    i = round(capN,3)
+    j = round(capP,3)
+    if 100*i >= 10:
+        if 100*j >= 10:
+            return 'P' + str(100*j)[0:2] + 'N' + str(100*i)[0:2]
+        return 'P0' + str(100*j)[0:1] + 'N' + str(100*i)[0:2]
+    if 100*j >= 10:
+        return 'P' + str(100*j)[0:2] + 'N0' + str(100*i)[0:1]
+    return 'P0' + str(100*j)[0:1] + 'N0' + str(100*i)[0:1]
 
-# Baseline produnction [Ton/year]
-base = x0.sum(0) * parameters.Yield
+def serpentine(nP,nN):
+    """
+    Order of the (capP, capN) grid indices that walks capP forward and backward
+    on alternate capN rows, so consecutive scenarios are always neighbours.
+    """
+    for i in range(nN):
+        cols = range(nP) if i % 2 == 0 else range(nP-1,-1,-1)
+        for j in cols:
+            yield j,i
 
-results = pd.DataFrame(base)
-results.rename(columns = {'Yield':'Base'},inplace=True)
 
+#%% Parallel sweep
+def initWorker(waterAvailable,cubeFolder=None):
+    global workerModel,workerCube
+    workerModel = CropModel(waterAvailable)
+    if cubeFolder is not None:
+        workerCube = result_cube.openCube(cubeFolder,mode='r+')[0]
 
-for i in capN:
-    for j in capP:
-        i = round(i,3)
-        j = round(j,3)
-        if 100*i >= 10:
-            if 100*j >= 10:
-                name = 'P' + str(100*j)[0:2] + 'N' + str(100*i)[0:2]
-            else:
-                name = 'P0' + str(100*j)[0:1] + 'N' + str(100*i)[0:2]
+def solveChunk(chunk):
+    """
+    Solve a run of neighbouring scenarios on the model held by this worker.
+    Returns the grid indices with the production of each scenario.
+    """
+    global workerModel
+    out = []
+    for j,i,cp,cn in chunk:
+        sol = workerModel.solve(cp,cn)
+        out.append((j,i,None if sol is None else sol.Prod_Ton.to_numpy('float64')))
+    return out
+
+def sweepCaps(capP,capN,processes=None,waterAvailable=False):
+    """
+    Solve the whole capP x capN grid on a process pool, one built CropModel
+    per worker. The serpentine path is cut into contiguous chunks so every
+    worker still warm-starts from a neighbouring scenario.
+    Returns production [Ton/yr] as an array of shape (crops, capP, capN);
+    scenarios without a solution are NaN.
+    """
+    global crops
+    
+    order = [(j,i,capP[j],capN[i]) for j,i in serpentine(len(capP),len(capN))]
+    
+    processes = processes or os.cpu_count()
+    nChunks = min(len(order),4*processes)
+    bounds = np.linspace(0,len(order),nChunks+1).astype(int)
+    chunks = [order[a:b] for a,b in zip(bounds[:-1],bounds[1:])]
+    
+    prod = np.full((len(crops),len(capP),len(capN)),np.nan)
+    
+    with multiprocessing.Pool(processes,initializer=initWorker,initargs=(waterAvailable,)) as pool:
+        for out in pool.imap(solveChunk,chunks):
+            for j,i,values in out:
+                if values is not None:
+                    prod[:,j,i] = values
+    
+    return prod
+
+
+#%% Adaptive grid
+def activeSet(lp,values,tol=1e-7):
+    # Rows and columns sitting on one of their bounds
+    def atBound(v,lo,hi):
+        scale = tol * (1 + np.abs(v))
+        return (np.abs(v - lo) <= scale) | (np.abs(hi - v) <= scale)
+    return np.concatenate((atBound(lp['A'] @ values,lp['rowLo'],lp['rowHi']),
+                           atBound(values,lp['colLo'],lp['colHi'])))
+
+def adaptiveCaps(capP,capN,tol=0.01,budget=200,coarse=8,waterAvailable=False):
+    """
+    Solve the capP x capN grid only where the response changes.
+    
+    Starts from every coarse-th grid line (plus the last one) and splits a
+    cell in four while the relative change of production (any crop) or
+    utility between its corners is above tol, or its corners differ in
+    feasibility or in the set of active constraints and bounds. Cells are
+    split in order of change times size, until none is left or the next
+    split would exceed budget solves (the coarse grid is always solved).
+    All solves run in sequence on one warm model.
+    
+    Returns production (crops x capP x capN) and utility, interpolated
+    bilinearly inside the cells that were not split, and the mask of the
+    grid points actually solved (see adaptiveTable).
+    """
+    rec = instrumentation.Recorder('nleb_linear',event='adaptive',tol=tol,budget=budget,
+                                   gridPoints=len(capP)*len(capN))
+    
+    model = CropModel(waterAvailable)
+    nC,nX = model.lp['nC'],model.lp['nX']
+    nP,nN = len(capP),len(capN)
+    
+    prod = np.full((nC,nP,nN),np.nan)
+    utility = np.full((nP,nN),np.nan)
+    solved = np.zeros((nP,nN),bool)
+    active = {}
+    
+    def solve(points):
+        for j,i in points:
+            if model.solve(capP[j],capN[i]) is not None:
+                prod[:,j,i] = model.values[nX:nX+nC]
+                utility[j,i] = model.utility
+                active[j,i] = activeSet(model.lp,model.values)
+            solved[j,i] = True
+    
+    def change(j0,j1,i0,i1):
+        corners = [(j0,i0),(j1,i0),(j0,i1),(j1,i1)]
+        u = np.array([utility[c] for c in corners])
+        if np.isnan(u).all():
+            return 0.0
+        if np.isnan(u).any() or any((active[c] != active[corners[0]]).any() for c in corners[1:]):
+            return np.inf
+        p = np.column_stack([prod[:,j,i] for j,i in corners])
+        dp = (p.max(1) - p.min(1)) / np.maximum(np.abs(p).max(1),1e-12)
+        du = (u.max() - u.min()) / max(np.abs(u).max(),1e-12)
+        return max(dp.max(),du)
+    
+    cells = []    # cells not split: (j0, j1, i0, i1)
+    heap = []
+    def push(cell):
+        j0,j1,i0,i1 = cell
+        c = change(*cell)
+        if c <= tol or (j1 - j0 <= 1 and i1 - i0 <= 1):
+            cells.append(cell)
         else:
-            if 100*j >= 10:
-                name = 'P' + str(100*j)[0:2] + 'N0' + str(100*i)[0:1]
-            else:
-                name = 'P0' + str(100*j)[0:1] + 'N0' + str(100*i)[0:1]
+            heapq.heappush(heap,(-c * (j1-j0) * (i1-i0),cell))
+    
+    linesP = sorted(set(range(0,nP-1,coarse)) | {nP-1})
+    linesN = sorted(set(range(0,nN-1,coarse)) | {nN-1})
+    with rec.phase('solve'):
+        solve([(j,i) for k,i in enumerate(linesN) for j in (linesP if k % 2 == 0 else linesP[::-1])])
+        for j0,j1 in zip(linesP[:-1],linesP[1:]):
+            for i0,i1 in zip(linesN[:-1],linesN[1:]):
+                push((j0,j1,i0,i1))
         
-        results[name] = solveCrop(j,i,False,False).Prod_Ton
+        while heap:
+            score,(j0,j1,i0,i1) = heapq.heappop(heap)
+            js = sorted({j0,(j0+j1)//2,j1})
+            iS = sorted({i0,(i0+i1)//2,i1})
+            new = [(j,i) for i in iS for j in js if not solved[j,i]]
+            if solved.sum() + len(new) > budget:
+                cells.append((j0,j1,i0,i1))
+                continue
+            solve(new)
+            for a,b in zip(js[:-1],js[1:]):
+                for c,d in zip(iS[:-1],iS[1:]):
+                    push((a,b,c,d))
+    
+    # Bilinear interpolation inside the cells, from their corners
+    for j0,j1,i0,i1 in cells:
+        s = (np.arange(j0,j1+1) - j0) / (j1 - j0)
+        t = (np.arange(i0,i1+1) - i0) / (i1 - i0)
+        w = {(j0,i0):np.outer(1-s,1-t),(j1,i0):np.outer(s,1-t),
+             (j0,i1):np.outer(1-s,t),(j1,i1):np.outer(s,t)}
+        fill = ~solved[j0:j1+1,i0:i1+1]
+        prod[:,j0:j1+1,i0:i1+1][:,fill] = sum(prod[:,j,i][:,None,None] * wk
+                                              for (j,i),wk in w.items())[:,fill]
+        utility[j0:j1+1,i0:i1+1][fill] = sum(utility[j,i] * wk for (j,i),wk in w.items())[fill]
+    
+    rec.add(solves=int(solved.sum()),cells=len(cells))
+    rec.emit()
+    
+    return {'capP':np.asarray(capP),'capN':np.asarray(capN),'prod':prod,'utility':utility,
+            'solved':solved}
 
+def adaptiveTable(result,interpolated=False):
+    """
+    Production of adaptiveCaps in the layout of Prod.csv: the baseline, then
+    one column per scenario ordered by capN, then capP. Only the solved
+    scenarios unless interpolated is set.
+    """
+    global crops,parameters,x0
+    capP,capN = result['capP'],result['capN']
+    keep = np.ones_like(result['solved']) if interpolated else result['solved']
+    points = [(j,i) for i in range(len(capN)) for j in range(len(capP)) if keep[j,i]]
+    
+    base = x0.sum(0) * parameters.Yield
+    columns = {'Base':np.asarray(base,'float64')}
+    for j,i in points:
+        columns[scenarioName(capP[j],capN[i])] = result['prod'][:,j,i]
+    return pd.DataFrame(columns,index=crops)
 
-results.to_csv('Prod.csv')
 
-del base,capP,capN,i,j,dx,name
-del crops,parameters,subdivisions,x0
+#%% Scenarios
 
+if __name__ == '__main__':
+    
+    os.chdir(nleb_data.dataFolder)
+    
+    dx = 0.02
+    capP = np.arange(0.0,0.5+dx,dx)
+    capN = np.arange(0.0,0.5+dx,dx)
+    
+    # Baseline produnction [Ton/year]
+    base = x0.sum(0) * parameters.Yield
+    
+    prod = sweepCaps(capP,capN)
+    
+    # Columns ordered by capN, then capP
+    names = [scenarioName(capP[j],capN[i]) for i in range(len(capN)) for j in range(len(capP))]
+    
+    results = pd.DataFrame(np.column_stack((base,prod.transpose(0,2,1).reshape((len(crops),-1)))),
+                           index=crops,columns=['Base'] + names)
+    
+    results.to_csv('Prod.csv')
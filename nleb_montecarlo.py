@@ -0,0 +1,261 @@
+"""
+------------  NLEB Monte Carlo  --------------
+Distributions of production, utility and shadow
+prices when the crop coefficients are uncertain
+
+Yield, Price, Cost, Pexp and Nexp are drawn per
+crop as lognormal factors (mean 1) on the values
+of DataCropsLingo. Samples are split in blocks
+with their own seed and merged in order, so
+the results do not depend on the number of
+processes. Each worker keeps one model and only
+changes its coefficients between samples (warm
+start), and the statistics are accumulated in a
+streaming way. With a folder, every sample is
+also written to a result cube on disk.
+
+    stats = simulate(20000,capP=0.4,capN=0.3)
+    stats['utility']['mean'],stats['prod']['std']
+
+May     2021
+----------------------------------------------
+
+"""
+
+import numpy as np
+import os
+import multiprocessing
+
+import nleb_linear
+import result_cube
+import instrumentation
+
+
+# Coefficient of variation of each uncertain coefficient
+uncertainty = {'Yield':0.10,'Price':0.10,'Cost':0.05,'Pexp':0.20,'Nexp':0.20}
+
+
+#%% Statistics
+
+class RunningStats:
+    """
+    Count, mean, variance, min and max of arrays of one shape, updated by
+    batches without keeping them (Welford's update in the batched form of
+    Chan et al., which also merges the statistics of two workers).
+    """
+
+    def __init__(self,shape=()):
+        self.n = 0
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.min = np.full(shape,np.inf)
+        self.max = np.full(shape,-np.inf)
+
+    def update(self,batch):
+        batch = np.asarray(batch,'float64')
+        if len(batch) == 0:
+            return self
+        other = RunningStats(batch.shape[1:])
+        other.n = len(batch)
+        other.mean = batch.mean(0)
+        other.m2 = ((batch - other.mean)**2).sum(0)
+        other.min = batch.min(0)
+        other.max = batch.max(0)
+        return self.merge(other)
+
+    def merge(self,other):
+        if other.n == 0:
+            return self
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.n / n
+        self.m2 = self.m2 + other.m2 + delta**2 * self.n * other.n / n
+        self.min = np.minimum(self.min,other.min)
+        self.max = np.maximum(self.max,other.max)
+        self.n = n
+        return self
+
+    def summary(self):
+        var = self.m2 / (self.n - 1) if self.n > 1 else np.full(np.shape(self.m2),np.nan)
+        return {'n':self.n,'mean':self.mean,'std':np.sqrt(var),'min':self.min,'max':self.max}
+
+
+#%% Sampling
+
+def drawFactors(rng,count,names,nC):
+    """
+    Lognormal factors with mean 1 and the coefficients of variation in
+    uncertainty, as an array (count, coefficient, crop).
+    """
+    cv = np.array([uncertainty[k] for k in names])
+    sigma = np.sqrt(np.log1p(cv**2))[:,None]
+    z = rng.standard_normal((count,len(names),nC))
+    return np.exp(sigma*z - sigma**2/2)
+
+def baseCoefficients(names):
+    parameters = nleb_linear.parameters
+    return np.array([parameters[k].to_numpy('float64') for k in names])
+
+def quantities(nonlinear):
+    # Outputs recorded per sample: name -> per-sample shape ('crop' or scalar)
+    if nonlinear:
+        return {'prod':'crop','price':'crop','utility':None}
+    return {'prod':'crop','utility':None,'shadowP':None,'shadowN':None,'water':None}
+
+
+#%% Workers
+
+def initWorker(capP,capN,waterAvailable,nonlinear,method,cubeFolder):
+    global workerModel,workerTask,workerCube
+    workerTask = {'capP':capP,'capN':capN,'nonlinear':nonlinear,'method':method}
+    if nonlinear:
+        import nleb_nonlinear
+        workerModel = nleb_nonlinear
+    else:
+        workerModel = nleb_linear.CropModel(waterAvailable)
+    workerCube = None
+    if cubeFolder is not None:
+        workerCube = result_cube.openCube(cubeFolder,mode='r+')[0]
+
+def solveLinear(coefficients):
+    """
+    Outputs of one sample on the linear model, and the cause of the
+    failure (None if solved).
+    """
+    model = workerModel
+    model.setCoefficients(coefficients)
+    if model.solve(workerTask['capP'],workerTask['capN']) is None:
+        return None,'no optimal solution'
+    lp = model.lp
+    return {'prod':model.values[lp['nX']:lp['nX']+lp['nC']],'utility':model.utility,
+            'shadowP':model.constraints[lp['rowP']].dual_value(),
+            'shadowN':model.constraints[lp['rowN']].dual_value(),
+            'water':model.values[-1]},None
+
+def solveNonlinear(coefficients,vInit):
+    """
+    Outputs of one sample on the nonlinear model, its solution (to warm
+    start the next sample) and the cause of the failure (None if solved).
+    A failed solve is tried again from the baseline, then on the reduced
+    formulation; the cause is the solver message of the last attempt.
+    """
+    nleb_nonlinear = workerModel
+    nleb_nonlinear.setCoefficients(coefficients)
+    attempts = [(vInit,False),(None,False),(None,True)]
+    for v,reduced in attempts[1:] if vInit is None else attempts:
+        sol = nleb_nonlinear.solveExp(workerTask['capP'],workerTask['capN'],
+                                      method=workerTask['method'],vInit=v,reduced=reduced)
+        if sol.success:
+            v = nleb_nonlinear.extractVars(sol.x)
+            return {'prod':v['y'],'price':v['p'],'utility':-sol.fun},sol.x,None
+    return None,None,str(sol.message)
+
+def sampleBlock(task):
+    """
+    Solve the samples start:start+count drawn from seed. Returns the start,
+    the statistics of the block and the number of samples without a
+    solution by cause. Outputs of the block are the only per-sample arrays
+    held in memory.
+    """
+    global workerModel,workerTask,workerCube
+    start,count,seed,names = task
+    nonlinear = workerTask['nonlinear']
+
+    factors = drawFactors(np.random.default_rng(seed),count,names,len(nleb_linear.crops))
+    base = baseCoefficients(names)
+
+    out = {name:np.full((count,len(nleb_linear.crops)) if dim else count,np.nan)
+           for name,dim in quantities(nonlinear).items()}
+
+    v = None
+    failures = {}
+    for k in range(count):
+        coefficients = dict(zip(names,base * factors[k]))
+        if nonlinear:
+            sol,v,cause = solveNonlinear(coefficients,v)
+        else:
+            sol,cause = solveLinear(coefficients)
+        if sol is None:
+            failures[cause] = failures.get(cause,0) + 1
+            continue
+        for name,value in sol.items():
+            out[name][k] = value
+
+    solved = ~np.isnan(out['utility'])
+    stats = {name:RunningStats(arr.shape[1:]).update(arr[solved]) for name,arr in out.items()}
+
+    if workerCube is not None:
+        workerCube['factor'][start:start+count] = factors
+        for name,arr in out.items():
+            workerCube[name][start:start+count] = arr
+        for arr in workerCube.values():
+            arr.flush()
+
+    return start,stats,failures
+
+
+#%% Engine
+
+def simulate(nSamples,capP=0.4,capN=0.3,waterAvailable=False,nonlinear=False,method='SLSQP',
+             seed=0,processes=None,blockSize=500,folder=None):
+    """
+    Solve the (capP, capN) scenario for nSamples draws of the uncertain
+    coefficients, on the linear model (solveCrop) or, with nonlinear=True,
+    on the price-responsive model (runExp, with the given method).
+
+    Returns, for every output, a dict with the count, mean, std, min and
+    max over the samples with a solution, plus the number of failures
+    ('failed') and that number by cause ('failures', solver messages).
+    Outputs are production [Ton/yr] per crop and utility [$M], plus the
+    shadow prices of the P and N rows and the additional water for the
+    linear model, or the prices per crop for the nonlinear one.
+    With folder, every sample (its factors and outputs) goes to a result
+    cube there, e.g. for quantiles.
+    """
+    rec = instrumentation.Recorder('nleb_montecarlo',event='simulate',samples=nSamples,
+                                   capP=float(capP),capN=float(capN),nonlinear=nonlinear)
+    names = list(uncertainty)
+    crops = nleb_linear.crops
+
+    starts = range(0,nSamples,blockSize)
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+    tasks = [(a,min(blockSize,nSamples-a),s,names) for a,s in zip(starts,seeds)]
+
+    if folder is not None:
+        dims = {None:('sample',),'crop':('sample','crop')}
+        cube = {name:dims[dim] for name,dim in quantities(nonlinear).items()}
+        cube['factor'] = ('sample','coefficient','crop')
+        result_cube.createCube(folder,{'sample':list(range(nSamples)),'coefficient':names,
+                                       'crop':crops},cube)
+
+    stats = {name:RunningStats((len(crops),) if dim else ())
+             for name,dim in quantities(nonlinear).items()}
+    failures = {}
+
+    processes = processes or os.cpu_count()
+    with rec.phase('solve'):
+        with multiprocessing.Pool(processes,initializer=initWorker,
+                                  initargs=(capP,capN,waterAvailable,nonlinear,method,folder)) as pool:
+            for start,block,blockFailures in pool.imap(sampleBlock,tasks):
+                for name,s in block.items():
+                    stats[name].merge(s)
+                for cause,n in blockFailures.items():
+                    failures[cause] = failures.get(cause,0) + n
+    failed = sum(failures.values())
+
+    rec.add(failed=failed,failures=failures,utilityMean=float(stats['utility'].mean))
+    rec.emit()
+
+    out = {name:s.summary() for name,s in stats.items()}
+    out['failed'] = failed
+    out['failures'] = failures
+    return out
+
+
+if __name__ == '__main__':
+    stats = simulate(1000)
+    print('Utility [$M]: mean', round(float(stats['utility']['mean']),3),
+          'std', round(float(stats['utility']['std']),3))
+    print('Samples without a solution:', stats['failed'])
+    for cause,n in stats['failures'].items():
+        print(f'  {n} x {cause}')
@@ -0,0 +1,228 @@
+"""
+-----------  NLEB multi-year planning  -------------
+Crop areas over a trajectory of P and N caps, year
+after year from the 2016 baseline
+
+Years are linked per subdivision and crop by
+  transition  |x[t] - x[t-1]| <= maxChange * area
+  rotation    x[t] + x[t-1] <= (1 + share) * area
+where share is the largest fraction of the
+subdivision that may grow the crop two years in a
+row (x[t] + x[t-1] - area is the least area that
+must do so).
+
+The rolling-horizon solver optimizes a window of
+a few years, keeps the first year(s) and moves
+the window on. The window model is built once:
+moving it only changes the caps of its years and
+the bounds tied to the year before it, so GLOP
+starts every window from the previous basis.
+
+May     2021
+----------------------------------------------------
+
+"""
+
+import numpy as np
+import os
+from scipy import sparse
+from ortools.linear_solver import pywraplp
+
+import lp_tools
+import nleb_data
+import nleb_linear
+import instrumentation
+
+
+#%% Trajectories
+
+def capTrajectory(start,stop,years,rampYears=None):
+    """
+    Caps for every year: a straight line from start to stop over rampYears
+    (default: all the years), then stop.
+    """
+    rampYears = rampYears or years
+    t = np.minimum(np.arange(1,years+1),rampYears) / rampYears
+    return start + (stop - start) * t
+
+
+#%% Window model
+
+def windowMatrices(horizon,waterAvailable=False,maxChange=0.1,rotation=None,discount=1.0):
+    """
+    Model of horizon consecutive years: the blocks of nleb_linear.cropMatrices
+    (full subdivision x crop model) on the diagonal, the objective of year t
+    discounted by discount**t, and the transition and rotation rows between
+    years. The rows of the first year refer to the year before the window;
+    their bounds are set by MultiYearModel.
+    rotation maps crops to their share (crops not in it are not limited).
+    """
+    one = nleb_linear.cropMatrices(0,0,waterAvailable,aggregate=False)
+    nS,nC = one['nS'],one['nC']
+    nX = nS * nC
+    n1,m1 = len(one['c']),len(one['rowHi'])
+
+    share = np.ones(nC)
+    for crop,value in (rotation or {}).items():
+        share[nleb_linear.crops.index(crop)] = value
+    rotated = np.flatnonzero(np.tile(share,nS) < 1)
+    areaSC = np.repeat(one['area'],nC)
+
+    I = sparse.identity(nX,format='csr')
+    shift = sparse.diags(np.ones(horizon-1),-1,shape=(horizon,horizon))   # year t-1 of year t
+    selectX = sparse.hstack([I,sparse.csr_matrix((nX,n1 - nX))],format='csr')
+    R = I[rotated]
+
+    transition = sparse.kron(sparse.identity(horizon) - shift,selectX)
+    rotationRows = sparse.kron(sparse.identity(horizon) + shift,R @ selectX)
+
+    A = sparse.vstack([sparse.block_diag([one['A']]*horizon),transition,rotationRows],format='csr')
+
+    change = maxChange * areaSC
+    rotationHi = (1 + np.tile(share,nS)[rotated]) * areaSC[rotated]
+
+    return {'c':np.concatenate([one['c'] * discount**t for t in range(horizon)]),
+            'A':A,
+            'rowLo':np.concatenate((np.tile(one['rowLo'],horizon),np.tile(-change,horizon),
+                                    np.full(horizon*len(rotated),-np.inf))),
+            'rowHi':np.concatenate((np.tile(one['rowHi'],horizon),np.tile(change,horizon),
+                                    np.tile(rotationHi,horizon))),
+            'colLo':np.tile(one['colLo'],horizon),
+            'colHi':np.tile(one['colHi'],horizon),
+            'one':one,'horizon':horizon,'n1':n1,'m1':m1,'nX':nX,
+            'transition0':horizon*m1,'rotation0':horizon*m1 + horizon*nX,
+            'rotated':rotated,'change':change,'rotationHi':rotationHi}
+
+
+class MultiYearModel:
+    """
+    Window model built once. solveWindow moves the caps of its years and
+    the bounds of its first year (which depend on the areas of the year
+    before) and re-solves from the current basis.
+    """
+
+    def __init__(self,horizon=5,waterAvailable=False,maxChange=0.1,rotation=None,discount=1.0):
+        rec = instrumentation.Recorder('nleb_multiyear',event='build',horizon=horizon)
+
+        with rec.phase('build'):
+            self.lp = windowMatrices(horizon,waterAvailable,maxChange,rotation,discount)
+            lp = self.lp
+
+            solver = pywraplp.Solver.CreateSolver('GLOP')
+            solver.SetSolverSpecificParametersAsString('use_preprocessing: false')
+            self.variables,self.constraints = lp_tools.loadMatrixModel(solver,lp['c'],lp['A'],
+                                                                       lp['rowLo'],lp['rowHi'],
+                                                                       lp['colLo'],lp['colHi'],
+                                                                       maximize=True)
+            self.solver = solver
+
+        rec.add(variables=len(lp['c']),constraints=len(lp['rowHi']),nonzeros=int(lp['A'].nnz))
+        rec.emit()
+
+    def solveWindow(self,previous,capP,capN):
+        """
+        Solve the window after a year with areas previous (S*C, row-major)
+        under the caps of each of its years. Returns the solution as an
+        array (years x variables of one year), or None.
+        """
+        lp = self.lp
+        one,m1 = lp['one'],lp['m1']
+        rec = instrumentation.Recorder('nleb_multiyear',event='solve',
+                                       capP=float(capP[0]),capN=float(capN[0]))
+
+        for t in range(lp['horizon']):
+            self.constraints[t*m1 + one['rowP']].SetUb(one['allowed']['P'] * (1-capP[t]))
+            self.constraints[t*m1 + one['rowN']].SetUb(one['allowed']['N'] * (1-capN[t]))
+
+        # First-year rows: the areas of the year before move to the bounds
+        for k,(p,change) in enumerate(zip(previous.tolist(),lp['change'].tolist())):
+            self.constraints[lp['transition0'] + k].SetBounds(p - change,p + change)
+        for k,(i,hi) in enumerate(zip(lp['rotated'].tolist(),lp['rotationHi'].tolist())):
+            self.constraints[lp['rotation0'] + k].SetUb(hi - previous[i])
+
+        with rec.phase('solve'):
+            status = self.solver.Solve()
+        rec.add(status=int(status),iterations=int(self.solver.iterations()),
+                solverWallTime=self.solver.wall_time()*1e-3)
+
+        if status != pywraplp.Solver.OPTIMAL:
+            rec.add(optimal=False)
+            rec.emit()
+            return None
+
+        with rec.phase('extract'):
+            values = lp_tools.solutionValues(self.solver).reshape((lp['horizon'],lp['n1']))
+        rec.add(optimal=True,objective=self.solver.Objective().Value())
+        rec.emit()
+        return values
+
+
+#%% Rolling horizon
+
+def rollingHorizon(capP,capN,horizon=5,step=1,waterAvailable=False,maxChange=0.1,
+                   rotation=None,discount=1.0,verbose=False):
+    """
+    Plan len(capP) years under the caps of each year (see capTrajectory).
+    Each window of horizon years keeps its first step years; windows that
+    run past the last year see its caps repeated. horizon=step=len(capP)
+    solves the whole trajectory as one model.
+
+    Returns areas (years x subdivisions x crops), production (years x crops),
+    utility and additional water per year, and the number of years solved
+    (fewer than requested if a window has no solution).
+    """
+    if not 1 <= step <= horizon:
+        raise ValueError(f'step must be between 1 and horizon ({horizon}), not {step}')
+    capP = np.asarray(capP,'float64')
+    capN = np.asarray(capN,'float64')
+    years = len(capP)
+    rec = instrumentation.Recorder('nleb_multiyear',event='rolling',years=years,
+                                   horizon=horizon,step=step)
+
+    model = MultiYearModel(horizon,waterAvailable,maxChange,rotation,discount)
+    one,nX = model.lp['one'],model.lp['nX']
+    nS,nC = one['nS'],one['nC']
+
+    capP = np.concatenate((capP,np.full(horizon-1,capP[-1])))
+    capN = np.concatenate((capN,np.full(horizon-1,capN[-1])))
+
+    areas = np.full((years,nS,nC),np.nan)
+    prod = np.full((years,nC),np.nan)
+    utility = np.full(years,np.nan)
+    water = np.full(years,np.nan)
+
+    previous = np.asarray(nleb_linear.x0,'float64').ravel()
+    solved = 0
+    with rec.phase('solve'):
+        for start in range(0,years,step):
+            values = model.solveWindow(previous,capP[start:start+horizon],capN[start:start+horizon])
+            if values is None:
+                if verbose:
+                    print(f'No solution for the window starting in year {start+1}.')
+                break
+            keep = min(step,years - start)
+            for t in range(keep):
+                areas[start+t] = values[t,:nX].reshape((nS,nC))
+                prod[start+t] = values[t,nX:nX+nC]
+                utility[start+t] = one['c'] @ values[t]
+                water[start+t] = values[t,-1]
+            previous = values[keep-1,:nX]
+            solved = start + keep
+            if verbose:
+                print(f'Years {start+1}-{start+keep}: utility', np.round(utility[start:start+keep],3))
+
+    rec.add(solved=solved,utility=float(np.nansum(utility)))
+    rec.emit()
+
+    return {'areas':areas,'prod':prod,'utility':utility,'water':water,'years':solved}
+
+
+if __name__ == '__main__':
+
+    os.chdir(nleb_data.dataFolder)
+
+    # Caps tightening to 40% P and 30% N over 10 years, then held for 20 more
+    years = 30
+    plan = rollingHorizon(capTrajectory(0,0.4,years,10),capTrajectory(0,0.3,years,10),
+                          horizon=5,verbose=True)
+    np.save('MultiYear_prod.npy',plan['prod'])
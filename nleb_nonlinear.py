@@ -11,31 +11,20 @@ import pandas as pd
 import numpy as np
 import time
 import os
-from scipy.optimize import minimize,Bounds
+import multiprocessing
+from scipy import sparse
+from scipy.optimize import minimize,Bounds,LinearConstraint
+from ortools.linear_solver import pywraplp
 
-
-os.chdir('~/Documents/data/folder/path')
+import lp_tools
+import nleb_data
+import instrumentation
+import solve_cache
 
 
 #%% Parameters
 
-parameters = pd.read_excel('../ResultsModel/DataCropsLingo.xlsx',
-                           sheet_name='DataParametersCrops',
-                           usecols=['Pexp','Nexp','Water','Yield','Cost','Price','Names'])
-
-crops = parameters.Names.tolist()
-
-baseline = pd.read_excel('../AllCropsOntario2016.xlsx',
-                         sheet_name='FinalData',
-                         usecols=['Geography'] + crops)
-
-subdivisions = baseline.Geography.tolist()
-
-
-# Baseline [thousand-Ha/yr]
-x0 = round(baseline.loc[:,crops],2)
-x0 = baseline.loc[:,crops].to_numpy('float64').reshape((len(subdivisions),len(crops))) * 1e-3
-
+parameters,crops,subdivisions,x0 = nleb_data.loadData()
 
 yieldCrop = parameters.Yield.to_numpy('float64')     # [Ton/thousand-Ha]
 costCrop = parameters.Cost.to_numpy('float64')*1e-3  # [$M/thousand-Ha]
@@ -65,7 +54,7 @@ maxProd = 1.5
 elast = -0.2
 
 
-del parameters,baseline
+del parameters
 
 
 #%% Auxiliary functions
@@ -81,6 +70,15 @@ def extractVars(v):
 def stackVar(x,y,p):
     return np.concatenate((x.flatten(),y,p))
 
+def scenarioName(dp,dn):
+    if dp < 0.1:
+        if dn < 0.1:
+            return 'P0' + str(int(100*dp)) + 'N0' + str(int(100*dn))
+        return 'P0' + str(int(100*dp)) + 'N' + str(int(100*dn))
+    if dn < 0.1:
+        return 'P' + str(int(100*dp)) + 'N0' + str(int(100*dn))
+    return 'P' + str(int(100*dp)) + 'N' + str(int(100*dn))
+
 def printTime(x):
     hours = int(x / 3600)
     minutes = int( (x-3600*hours) / 60)
@@ -99,12 +97,11 @@ def objectiveFunction(v):
     return - np.matmul(v['x'].sum(0),z)
 
 def gradient(v):
-    global yieldCrop,costCrop,subdivisions
+    global yieldCrop,costCrop,subdivisions,crops
     v = extractVars(v)
     z1 = v['p'] * yieldCrop - costCrop
-    z2 = v['p'] - costCrop / yieldCrop
     z3 = yieldCrop * v['x'].sum(0)
-    return - np.concatenate((np.tile(z1,len(subdivisions)),z2,z3)) #np.repeat
+    return - np.concatenate((np.tile(z1,len(subdivisions)),np.zeros(len(crops)),z3))
     
 # Less or equal
 def constPexport(v):
@@ -153,15 +150,360 @@ v0 = stackVar(x0,y0,p0)
 bounds = Bounds(np.zeros(v0.size),np.inf)
 
 
+def setCoefficients(coefficients):
+    """
+    Replace crop coefficients, given per crop in the units of the data
+    ('Yield', 'Cost', 'Price', 'Pexp', 'Nexp', 'Water'), and update the
+    baseline production, prices, allowed exports and v0 derived from them.
+    """
+    global yieldCrop,costCrop,exportP,exportN,waterCoef,p0,y0,allowedP,allowedN,allowedW,v0
+    coefficients = {k:np.asarray(v,'float64') for k,v in coefficients.items()}
+    if 'Yield' in coefficients:
+        yieldCrop = coefficients['Yield']
+    if 'Cost' in coefficients:
+        costCrop = coefficients['Cost']*1e-3
+    if 'Price' in coefficients:
+        p0 = coefficients['Price']*1e-3
+    if 'Pexp' in coefficients:
+        exportP = coefficients['Pexp']
+    if 'Nexp' in coefficients:
+        exportN = coefficients['Nexp']
+    if 'Water' in coefficients:
+        waterCoef = coefficients['Water']
+    
+    y0 = x0.sum(0) * yieldCrop
+    allowedP = np.matmul(x0.sum(0),exportP)
+    allowedN = np.matmul(x0.sum(0),exportN)
+    allowedW = np.matmul(x0.sum(0),waterCoef)
+    v0 = stackVar(x0,y0,p0)
+
+
+#%% Derivatives
+
+def constraintJacobians():
+    """
+    Sparse Jacobians of the constraint functions, keyed by function.
+    Every constraint is linear in v = [x, y, p], so they are built once.
+    """
+    global subdivisions,crops,exportP,exportN,waterCoef,yieldCrop,elast,p0,y0
+    nS = len(subdivisions)
+    nC = len(crops)
+    I = sparse.identity(nC,format='csr')
+    Z = sparse.csr_matrix((nC,nC))
+    
+    def row(coef):
+        return sparse.csr_matrix(np.concatenate((-np.tile(coef,nS),np.zeros(2*nC)))[None,:])
+    
+    return {constPexport: row(exportP),
+            constNexport: row(exportN),
+            constWaterUse: row(waterCoef),
+            availableArea: sparse.hstack([-sparse.kron(sparse.identity(nS),np.ones((1,nC))),
+                                          sparse.csr_matrix((nS,2*nC))],format='csr'),
+            minProduction: sparse.hstack([sparse.csr_matrix((nC,nS*nC)),I,Z],format='csr'),
+            maxProduction: sparse.hstack([sparse.csr_matrix((nC,nS*nC)),-I,Z],format='csr'),
+            production: sparse.hstack([-sparse.kron(np.ones((1,nS)),sparse.diags(yieldCrop)),I,Z],
+                                      format='csr'),
+            priceChange: sparse.hstack([sparse.csr_matrix((nC,nS*nC)),
+                                        -sparse.diags(p0/(elast*y0)),I],format='csr')}
+
+def denseJacobian(fun,jacobians):
+    # SLSQP works with dense arrays
+    J = jacobians[fun].toarray()
+    if J.shape[0] == 1:
+        J = J[0]
+    return lambda v: J
+
+def checkDerivatives(v=None,h=1e-6):
+    """
+    Compare gradient and constraintJacobians (and the derivatives of
+    ReducedEvaluator, at the x part of v) with forward finite differences
+    at v (default v0). Returns the largest absolute error for each function.
+    """
+    global v0,dP,dN
+    if v is None:
+        v = v0
+    if 'dP' not in globals():
+        dP,dN = 0.0,0.0
+    
+    def numerical(fun,u=v):
+        f0 = np.atleast_1d(fun(u))
+        J = np.zeros((f0.size,u.size))
+        for i in range(u.size):
+            uh = u.copy()
+            uh[i] += h
+            J[:,i] = (np.atleast_1d(fun(uh)) - f0) / h
+        return J
+    
+    errors = {'objectiveFunction':np.abs(numerical(objectiveFunction)[0] - gradient(v)).max()}
+    for fun,J in constraintJacobians().items():
+        errors[fun.__name__] = np.abs(numerical(fun) - J.toarray()).max()
+    
+    ev = ReducedEvaluator()
+    x = v[:len(subdivisions)*len(crops)]
+    errors['reducedObjective'] = np.abs(numerical(ev.objective,x)[0] - ev.gradient(x)).max()
+    errors['reducedConstraints'] = np.abs(numerical(ev.constraints,x) - ev.J.toarray()).max()
+    return errors
+
+
+#%% Reduced formulation
+
+def reducedJacobian(nS,productionRows=True):
+    """
+    Jacobian of the constraints of ReducedEvaluator over nS subdivisions.
+    They are linear in x, so it is built once.
+    """
+    global crops,exportP,exportN,waterCoef,yieldCrop
+    nC = len(crops)
+    
+    def row(coef):
+        return sparse.csr_matrix(-np.tile(coef,nS)[None,:])
+    
+    prodRows = sparse.kron(np.ones((1,nS)),sparse.diags(yieldCrop))
+    return sparse.vstack([row(exportP),row(exportN),row(waterCoef),
+                          -sparse.kron(sparse.identity(nS),np.ones((1,nC)))]
+                         + ([prodRows,-prodRows] if productionRows else []),format='csr')
+
+class ReducedEvaluator:
+    """
+    The model in x alone: production and priceChange give y and p as
+    explicit functions of x, so they are substituted and the equalities
+    disappear. The constraints are one vector (P, N, water, area, min and
+    max production, all >= 0).
+    
+    The objective, gradient and constraints are computed together the first
+    time a point is seen and every callback at the same point reads them
+    from the cache. Build one per solve: dP and dN are read then.
+    
+    With totals=True, x is the vector of crop totals instead: the model
+    as if the basin were one subdivision. The objective and the P, N,
+    water and production rows only see crop totals, and any totals within
+    the basin area can be split over the subdivisions (see spreadTotals),
+    so this has the same optimum with C variables instead of S*C. The
+    production limits are then bounds on x (see bounds) rather than rows.
+    """
+    
+    def __init__(self,totals=False):
+        global subdivisions,area
+        self.x = None
+        self.totals = totals
+        self.nS = 1 if totals else len(subdivisions)
+        self.area = np.array([area.sum()]) if totals else area
+        self.J = reducedJacobian(self.nS,not totals)
+    
+    def bounds(self):
+        global crops,yieldCrop,y0,minProd,maxProd
+        if self.totals:
+            return Bounds(minProd*y0/yieldCrop,maxProd*y0/yieldCrop)
+        return Bounds(np.zeros(self.nS*len(crops)),np.inf)
+    
+    def at(self,x):
+        global crops,yieldCrop,costCrop,exportP,exportN,waterCoef
+        global allowedP,allowedN,allowedW,p0,y0,elast,minProd,maxProd,dP,dN
+        if self.x is not None and np.array_equal(x,self.x):
+            return self.values
+        
+        nS = self.nS
+        xs = x.reshape((nS,len(crops)))
+        X = xs.sum(0)
+        y = yieldCrop * X
+        p = p0 * (1 + (y/y0 - 1)/elast)
+        
+        # d(p*y)/dX
+        marginal = yieldCrop * (p + y * p0/(elast*y0))
+        
+        self.values = {'y':y,'p':p,
+                       'objective':-np.dot(p*yieldCrop - costCrop,X),
+                       'gradient':-np.tile(marginal - costCrop,nS),
+                       'constraints':np.concatenate(([(1-dP)*allowedP - np.dot(X,exportP),
+                                                      (1-dN)*allowedN - np.dot(X,exportN),
+                                                      allowedW - np.dot(X,waterCoef)],
+                                                     self.area - xs.sum(1))
+                                                    + (() if self.totals else (y - minProd*y0,
+                                                                               maxProd*y0 - y)))}
+        self.x = x.copy()
+        return self.values
+    
+    def objective(self,x):
+        return self.at(x)['objective']
+    
+    def gradient(self,x):
+        return self.at(x)['gradient']
+    
+    def constraints(self,x):
+        return self.at(x)['constraints']
+    
+    def hessianProduct(self,x,d):
+        # d^2(p*y)/dX^2 = 2 yield^2 p0/(elast y0), the same for every subdivision
+        global crops,yieldCrop,p0,y0,elast
+        D = d.reshape((self.nS,len(crops))).sum(0)
+        return -np.tile(2 * yieldCrop**2 * p0/(elast*y0) * D,self.nS)
+
+def spreadTotals(X):
+    """
+    Areas (S*C, row-major) with crop totals X, every subdivision growing
+    the crops in the same proportions. Within the area of the subdivisions
+    if X is within the area of the basin.
+    """
+    global area
+    return (area[:,None] * X[None,:] / area.sum()).ravel()
+
+def solveReduced(vInit,exact,method,verbose,rec):
+    """
+    solveExp on the reduced formulation. As in the full trust-constr solve,
+    x is solved for in u = x/scale with the objective and the constraint
+    rows scaled to about one; unscaled, SLSQP stops in its line search
+    (status 8) at the optimum on many basins. trust-constr solves for the
+    crop totals (ReducedEvaluator with totals=True) and spreads them over
+    the subdivisions, so its size does not grow with the basin; its x is
+    one optimum among many with the same totals. The
+    result's x is expanded back to v = [x, y, p], so it reads like a solve
+    of the full model.
+    """
+    nS,nC = len(subdivisions),len(crops)
+    nX = nS * nC
+    totals = method == 'trust-constr'
+    
+    with rec.phase('build'):
+        def fold(x):
+            return x.reshape((nS,nC)).sum(0) if totals else x
+        
+        ev = ReducedEvaluator(totals)
+        scale = fold(variableScale()[:nX])
+        xInit = fold(vInit[:nX])
+        f0 = max(1.0,abs(ev.objective(fold(v0[:nX]))))
+        J = ev.J @ sparse.diags(scale)
+        rows = 1 / np.maximum(abs(J).max(1).toarray().ravel(),1e-12)
+        J = sparse.diags(rows) @ J
+        xBounds = ev.bounds()
+        uBounds = Bounds(xBounds.lb/scale,xBounds.ub/scale)
+        uInit = np.clip(xInit/scale,uBounds.lb,uBounds.ub)
+    
+    def objective(u):
+        return ev.objective(scale*u) / f0
+    
+    def gradient(u):
+        return scale * ev.gradient(scale*u) / f0
+    
+    def constraints(u):
+        return rows * ev.constraints(scale*u)
+    
+    if method == 'SLSQP':
+        with rec.phase('build'):
+            J = J.toarray()
+        with rec.phase('solve'):
+            sol = minimize(objective,
+                           uInit,
+                           jac=gradient if exact else None,
+                           method='SLSQP',
+                           constraints=[{'type':'ineq','fun':constraints,
+                                         'jac':(lambda u: J) if exact else None}],
+                           bounds=uBounds,
+                           options={'disp':verbose})
+    elif method == 'trust-constr':
+        with rec.phase('build'):
+            constraint = LinearConstraint(J.tocsr(),-constraints(np.zeros(len(scale))),
+                                          np.full(J.shape[0],np.inf))
+        
+        with rec.phase('solve'):
+            # C variables: converge further than the default gtol, which
+            # leaves production off by about 1e-3
+            sol = minimize(objective,
+                           uInit,
+                           jac=gradient,
+                           hessp=lambda u,d: scale * ev.hessianProduct(scale*u,scale*d) / f0,
+                           method='trust-constr',
+                           constraints=constraint,
+                           bounds=uBounds,
+                           options={'disp':verbose,'gtol':1e-10})
+    else:
+        raise ValueError(f'Unknown method: {method}')
+    
+    sol.fun = sol.fun * f0
+    values = ev.at(scale * sol.x)
+    x = spreadTotals(scale * sol.x) if totals else scale * sol.x
+    sol.x = stackVar(x,values['y'],values['p'])
+    return sol
+
+
 #%% Solution
 
-def runExp(dp,dn):
+def hessianProduct(v,d):
+    """
+    Hessian of objectiveFunction times d. The only second-order terms are
+    the x-p cross products of the revenue, so this never forms the matrix.
+    """
+    global yieldCrop,subdivisions
+    d = extractVars(d)
+    hx = - np.tile(yieldCrop * d['p'],len(subdivisions))
+    hp = - yieldCrop * d['x'].sum(0)
+    return np.concatenate((hx,np.zeros(len(hp)),hp))
+
+def variableScale():
+    """
+    Typical size of every entry of v: the area of the subdivision split
+    over its crops for x, the baseline production for y and prices for p.
+    """
+    global subdivisions,crops,area,y0,p0
+    xScale = np.maximum(area,1e-3)[:,None] / len(crops) * np.ones((1,len(crops)))
+    return stackVar(xScale,y0,p0)
+
+def linearConstraint(cons,jacobians,scale=None):
+    """
+    All the constraints as one sparse LinearConstraint: f(v) = J v + f(0),
+    so f(v) >= 0 is J v >= -f(0) and f(v) = 0 is J v = -f(0).
+    With scale, the constraint is on u = v/scale and every row is divided
+    by its largest coefficient.
+    """
+    zero = np.zeros(v0.size)
+    A,lb,ub = [],[],[]
+    for con in cons:
+        f0 = np.atleast_1d(con['fun'](zero))
+        A.append(jacobians[con['fun']])
+        lb.append(-f0)
+        ub.append(-f0 if con['type'] == 'eq' else np.full(f0.size,np.inf))
+    A,lb,ub = sparse.vstack(A,format='csr'),np.concatenate(lb),np.concatenate(ub)
+    if scale is not None:
+        A = A @ sparse.diags(scale)
+        rows = 1 / np.maximum(abs(A).max(1).toarray().ravel(),1e-12)
+        A,lb,ub = sparse.diags(rows) @ A,rows*lb,rows*ub
+    return LinearConstraint(A.tocsr(),lb,ub)
+
+def maxViolation(v,cons):
+    # Largest violation of the constraints and bounds at v
+    worst = max(0.0,-v.min())
+    for con in cons:
+        f = np.atleast_1d(con['fun'](v))
+        worst = max(worst,np.abs(f).max() if con['type'] == 'eq' else -f.min())
+    return float(worst)
+
+def solveExp(dp,dn,exact=True,method='SLSQP',vInit=None,verbose=False,rec=None,reduced=False):
+    """
+    Solve one (dP, dN) scenario starting from vInit (default: the baseline v0).
+    method='SLSQP' is the original dense solver; method='trust-constr' uses
+    the sparse constraint Jacobians and Hessian products. With reduced=True
+    x is the only decision vector (see ReducedEvaluator; trust-constr then
+    solves for the crop totals, in seconds and little memory at any number
+    of subdivisions); reduced=False (default) solves the original
+    formulation in [x, y, p]. On that formulation the few dense rows (P, N,
+    water, production) fill in the interior-point factorizations: SLSQP is
+    dense and trust-constr takes minutes and about 0.5 GB at 1000 x 10
+    subdivisions x crops, so use reduced=True beyond that.
+    Returns the OptimizeResult.
+    Timings and solver statistics go to rec (an instrumentation.Recorder);
+    without one, a record is emitted for this solve.
+    """
     global dP,dN
     
-    startTime = time.time()
+    emit = rec is None
+    if emit:
+        rec = instrumentation.Recorder('nleb_nonlinear',event='solve')
+    rec.add(method=method,dP=float(dp),dN=float(dn),warmStart=vInit is not None,reduced=reduced)
     
     dP = dp
     dN = dn
+    
+    if vInit is None:
+        vInit = v0
         
     cons = [{'type':'ineq','fun':constPexport},
             {'type':'ineq','fun':constNexport},
@@ -172,45 +514,298 @@ def runExp(dp,dn):
             {'type':'eq','fun':production},
             {'type':'eq','fun':priceChange}]
     
-    sol = minimize(objectiveFunction,
-                   v0,
-                   #jac=gradient,
-                   method='SLSQP',   # 'SLSQP'
-                   constraints=cons,
-                   bounds=bounds,
-                   options={'disp':True})
+    if reduced:
+        sol = solveReduced(vInit,exact,method,verbose,rec)
+    elif method == 'SLSQP':
+        # Exact derivatives instead of finite differences
+        with rec.phase('build'):
+            if exact:
+                jacobians = constraintJacobians()
+                for con in cons:
+                    con['jac'] = denseJacobian(con['fun'],jacobians)
+        
+        with rec.phase('solve'):
+            sol = minimize(objectiveFunction,
+                           vInit,
+                           jac=gradient if exact else None,
+                           method='SLSQP',
+                           constraints=cons,
+                           bounds=bounds,
+                           options={'disp':verbose})
+    elif method == 'trust-constr':
+        # x, y and p differ by six orders of magnitude: solve in u = v/scale
+        # with the objective and the rows scaled to about one
+        with rec.phase('build'):
+            scale = variableScale()
+            f0 = max(1.0,abs(objectiveFunction(v0)))
+            constraint = linearConstraint(cons,constraintJacobians(),scale)
+        
+        with rec.phase('solve'):
+            sol = minimize(lambda u: objectiveFunction(scale*u) / f0,
+                           vInit / scale,
+                           jac=lambda u: scale * gradient(scale*u) / f0,
+                           hessp=lambda u,d: scale * hessianProduct(scale*u,scale*d) / f0,
+                           method='trust-constr',
+                           constraints=constraint,
+                           bounds=Bounds(np.zeros(v0.size),np.inf),
+                           options={'disp':verbose})
+        sol.x = scale * sol.x
+        sol.fun = sol.fun * f0
+    else:
+        raise ValueError(f'Unknown method: {method}')
+    
+    rec.add(success=bool(sol.success),status=int(sol.status),iterations=int(sol.nit),
+            functionEvaluations=int(sol.nfev),jacobianEvaluations=int(getattr(sol,'njev',0)),
+            objective=-float(sol.fun))
+    # Evaluates every constraint: only when someone listens
+    if instrumentation.sink is not None:
+        rec.add(maxViolation=maxViolation(sol.x,cons))
+    if emit:
+        rec.emit()
+    return sol
+
+@solve_cache.memoize('nleb_nonlinear',lambda: (x0,yieldCrop,costCrop,exportP,exportN,waterCoef,
+                                                p0,minProd,maxProd,elast))
+def runExp(dp,dn,exact=True,method='SLSQP',verbose=False,reduced=False):
+    """
+    Solve one (dP, dN) scenario from the baseline (see solveExp).
+    Returns optimal production and prices, or (None, None).
+    """
+    startTime = time.time()
+    rec = instrumentation.Recorder('nleb_nonlinear',event='solve')
+    
+    sol = solveExp(dp,dn,exact,method,verbose=verbose,rec=rec,reduced=reduced)
     
-    printTime(round(time.time() - startTime))
+    if verbose:
+        printTime(round(time.time() - startTime))
     
-    if sol.status == 0:
-        vopt = extractVars(sol.x)
-        print('Objective function:',-sol.fun)
+    if sol.success:
+        if verbose:
+            print('Objective function:',-sol.fun)
         
-        vopt = extractVars(sol.x)
+        with rec.phase('extract'):
+            vopt = extractVars(sol.x)
+        rec.emit()
         return vopt['y'],vopt['p']
+    rec.emit()
     return None,None
 
-#%%
 
-dp = 0.1
-dn = 0.0
-
-prodOpt, priceOpt = runExp(dp,dn)
-
-if dp < 0.1:
-    if dn < 0.1:
-        name = 'P0' + str(int(100*dp)) + 'N0' + str(int(100*dn))
-    else:
-        name = 'P0' + str(int(100*dp)) + 'N' + str(int(100*dn))
-else:
-    if dn < 0.1:
-        name = 'P' + str(int(100*dp)) + 'N0' + str(int(100*dn))
-    else:
-        name = 'P' + str(int(100*dp)) + 'N' + str(int(100*dn))
+#%% Scenario grid
+
+def solvePath(path):
+    """
+    Solve a list of scenarios in order, each one warm-started from the
+    solution of the previous one (or from vStart for the first).
+    Returns (index, y, p, v, iterations, cold iterations) per scenario; the
+    cold count is only computed when compareCold is set.
+    """
+    vStart,scenarios,method,compareCold = path
+    out = []
+    v = vStart
+    for index,dp,dn in scenarios:
+        sol = solveExp(dp,dn,method=method,vInit=v)
+        nitCold = solveExp(dp,dn,method=method).nit if compareCold else np.nan
+        if sol.success:
+            vopt = extractVars(sol.x)
+            out.append((index,vopt['y'],vopt['p'],sol.x,sol.nit,nitCold))
+            v = sol.x
+        else:
+            out.append((index,None,None,None,sol.nit,nitCold))
+            v = None
+    return out
+
+def runGrid(dPs,dNs,method='SLSQP',processes=None,compareCold=False):
+    """
+    Solve every (dP, dN) of the grid by continuation.
+    
+    The first column (dPs[0], every dN) is solved in order, each scenario
+    starting from the one before. Every row then walks along dP from its
+    first-column solution; rows are independent and run on a process pool.
+    Returns production and prices (dP x dN x crops), the iterations of each
+    solve and a summary of iterations saved against cold starts. Unless
+    compareCold is set, the cold count of every scenario is estimated by the
+    cold start of the grid origin.
+    """
+    global crops
+    nP,nN,nC = len(dPs),len(dNs),len(crops)
+    
+    prod = np.full((nP,nN,nC),np.nan)
+    price = np.full((nP,nN,nC),np.nan)
+    nit = np.zeros((nP,nN),int)
+    nitCold = np.full((nP,nN),np.nan)
+    
+    def store(out):
+        for (j,i),y,p,v,it,itCold in out:
+            if y is not None:
+                prod[j,i],price[j,i] = y,p
+            nit[j,i] = it
+            nitCold[j,i] = itCold
+    
+    # Origin cold, then along the first column
+    spine = solvePath((None,[((0,i),dPs[0],dNs[i]) for i in range(nN)],method,compareCold))
+    nitCold[0,0] = spine[0][4]
+    store(spine)
+    
+    rows = [(spine[i][3],[((j,i),dPs[j],dNs[i]) for j in range(1,nP)],method,compareCold)
+            for i in range(nN)]
+    with multiprocessing.Pool(processes) as pool:
+        for out in pool.imap(solvePath,rows):
+            store(out)
+    
+    reference = nitCold if compareCold else np.full((nP,nN),nitCold[0,0])
+    summary = {'iterations':int(nit.sum()),
+               'coldIterations':float(reference.sum()),
+               'saved':float(reference.sum() - nit.sum()),
+               'estimated':not compareCold}
+    instrumentation.Recorder('nleb_nonlinear',event='grid',**summary).emit()
+    
+    return {'prod':prod,'price':price,'nit':nit,'nitCold':nitCold,'summary':summary}
+
+#%% Concave QP
+
+def qpMatrices(dp,dn):
+    """
+    Elastic-price model with p eliminated. priceChange makes p affine in y,
+    so the revenue is p*y = a*y + b*y^2 with b < 0 and the problem is the
+    concave QP
+        maximize q'z + sum(b*y^2)  s.t.  rowLo <= A z <= rowHi, colLo <= z <= colHi
+    over z = [x (row-major), y]. The quadratic part is separable, so it is
+    returned as b rather than as a matrix.
+    """
+    global subdivisions,crops,yieldCrop,costCrop,exportP,exportN,waterCoef
+    global allowedP,allowedN,allowedW,area,p0,y0,elast,minProd,maxProd
+    nS = len(subdivisions)
+    nC = len(crops)
+    
+    a = p0 * (1 - 1/elast)
+    b = p0 / (elast * y0)
+    
+    q = np.concatenate((-np.tile(costCrop,nS),a))
+    
+    export = sparse.csr_matrix(np.vstack((np.tile(exportP,nS),
+                                          np.tile(exportN,nS),
+                                          np.tile(waterCoef,nS))))
+    A = sparse.bmat([[export,None],
+                     [sparse.kron(sparse.identity(nS),np.ones((1,nC))),None],
+                     [sparse.kron(np.ones((1,nS)),sparse.diags(yieldCrop)),-sparse.identity(nC)]],
+                    format='csr')
+    
+    rowLo = np.concatenate((np.full(3+nS,-np.inf),np.zeros(nC)))
+    rowHi = np.concatenate(([(1-dp)*allowedP,(1-dn)*allowedN,allowedW],area,np.zeros(nC)))
+    colLo = np.concatenate((np.zeros(nS*nC),minProd*y0))
+    colHi = np.concatenate((np.full(nS*nC,np.inf),maxProd*y0))
+    
+    return {'q':q,'A':A,'rowLo':rowLo,'rowHi':rowHi,'colLo':colLo,'colHi':colHi,
+            'a':a,'b':b}
 
-# Data frame of production
-pd.DataFrame(prodOpt,columns=['Ton_' + name],index=crops).to_csv('Prod_PV_'+name+'.csv')
-pd.DataFrame(priceOpt,columns=['MCAD_Ton_' + name],index=crops).to_csv('Price_PV_'+name+'.csv')
+def runQP(dp,dn,tol=1e-9,maxIter=200,verbose=False):
+    """
+    Solve the concave QP of qpMatrices to certified optimality.
+    
+    The revenue is separable and concave in each y[c], so its tangents are
+    upper bounds. GLOP maximizes t - cost*x with t[c] under the tangents
+    collected so far (an upper bound on the optimum), the true objective at
+    that point is a lower bound, and a new tangent is added at every y[c]
+    where the two differ. Stops when the gap is below tol (relative).
+    Returns production, prices and a dict with the bounds, gap, iterations
+    and success. If the gap is still above tol after maxIter LPs, the
+    production and prices are None (the dict says how far it got); if an
+    LP has no solution, all three are None.
+    """
+    global subdivisions,crops,p0,y0,elast
+    startTime = time.time()
+    rec = instrumentation.Recorder('nleb_nonlinear',event='solve',method='QP',
+                                   dP=float(dp),dN=float(dn))
+    buildStart = time.perf_counter()
+    
+    qp = qpMatrices(dp,dn)
+    nX = len(subdivisions) * len(crops)
+    nC = len(crops)
+    a,b = qp['a'],qp['b']
+    
+    # z = [x, y, t]; t is the revenue of each crop
+    c = np.concatenate((qp['q'][:nX],np.zeros(nC),np.ones(nC)))
+    A = sparse.hstack([qp['A'],sparse.csr_matrix((qp['A'].shape[0],nC))],format='csr')
+    
+    solver = pywraplp.Solver.CreateSolver('GLOP')
+    variables,_ = lp_tools.loadMatrixModel(solver,c,A,qp['rowLo'],qp['rowHi'],
+                                           np.concatenate((qp['colLo'],np.full(nC,-np.inf))),
+                                           np.concatenate((qp['colHi'],np.full(nC,np.inf))),
+                                           maximize=True)
+    y = variables[nX:nX+nC]
+    t = variables[nX+nC:]
+    
+    def addCut(k,yHat):
+        # t <= a*y + b*y^2 linearized at yHat
+        ct = solver.Constraint(-solver.infinity(),-b[k]*yHat**2)
+        ct.SetCoefficient(t[k],1)
+        ct.SetCoefficient(y[k],-(a[k] + 2*b[k]*yHat))
+    
+    # Tangents at both production bounds and at the baseline keep the LP bounded
+    for k in range(nC):
+        for yHat in (qp['colLo'][nX+k],y0[k],qp['colHi'][nX+k]):
+            addCut(k,yHat)
+    
+    rec.record['phases']['build'] = time.perf_counter() - buildStart
+    rec.record['phases']['solve'] = 0.0
+    simplexIterations = 0
+    
+    for it in range(1,maxIter+1):
+        solveStart = time.perf_counter()
+        status = solver.Solve()
+        rec.record['phases']['solve'] += time.perf_counter() - solveStart
+        simplexIterations += solver.iterations()
+        if status != solver.OPTIMAL:
+            rec.add(success=False,status=int(status),iterations=it,simplexIterations=simplexIterations)
+            rec.emit()
+            if verbose:
+                print('The solver could not solve the problem.')
+            return None,None,None
+        
+        upper = solver.Objective().Value()
+        yOpt = np.array([v.solution_value() for v in y])
+        tOpt = np.array([v.solution_value() for v in t])
+        revenue = a*yOpt + b*yOpt**2
+        lower = upper - (tOpt - revenue).sum()
+        
+        gap = (upper - lower) / max(1.0,abs(lower))
+        if gap <= tol:
+            break
+        for k in np.flatnonzero(tOpt - revenue > 0):
+            addCut(k,yOpt[k])
+    
+    success = gap <= tol
+    rec.add(success=success,iterations=it,simplexIterations=simplexIterations,
+            cuts=solver.NumConstraints() - A.shape[0],objective=lower,upper=upper,gap=gap)
+    rec.emit()
+    
+    info = {'lower':lower,'upper':upper,'gap':gap,'iterations':it,'success':success}
+    if verbose:
+        printTime(round(time.time() - startTime))
+        print('Objective function:',lower,'(gap',gap,')')
+    if not success:
+        if verbose:
+            print(f'The gap is still above {tol} after {maxIter} iterations.')
+        return None,None,info
+    
+    pOpt = p0 * (1 + (yOpt/y0 - 1)/elast)
+    return yOpt,pOpt,info
 
 
+#%%
 
+if __name__ == '__main__':
+    
+    os.chdir(nleb_data.dataFolder)
+    
+    dp = 0.1
+    dn = 0.0
+    
+    prodOpt, priceOpt = runExp(dp,dn,verbose=True)
+    
+    name = scenarioName(dp,dn)
+    
+    # Data frame of production
+    pd.DataFrame(prodOpt,columns=['Ton_' + name],index=crops).to_csv('Prod_PV_'+name+'.csv')
+    pd.DataFrame(priceOpt,columns=['MCAD_Ton_' + name],index=crops).to_csv('Price_PV_'+name+'.csv')
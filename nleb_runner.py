@@ -0,0 +1,203 @@
+"""
+-----------  NLEB scenario runner  -------------
+Command-line runner for the cap scenarios of
+nleb_linear and nleb_nonlinear
+
+Every solved scenario is appended to a JSON-lines
+store as soon as it finishes. Running the same
+command again skips what the store already holds,
+failed scenarios included unless --retry-failed.
+
+    python nleb_runner.py linear --capP 0 0.5 0.02 --capN 0 0.5 0.02 --store linear.jsonl
+    python nleb_runner.py nonlinear --capP 0 0.3 0.1 --capN 0 0.3 0.1 --store nonlinear.jsonl
+    python nleb_runner.py --spec scenarios.json
+
+The spec file holds the same options as JSON
+(e.g. {"model": "linear", "capP": [0, 0.5, 0.02], ...}).
+
+May     2021
+------------------------------------------------
+
+"""
+
+import pandas as pd
+import numpy as np
+import os
+import json
+import argparse
+import multiprocessing
+import queue as queue_
+
+
+#%% Store
+
+def scenarioKey(model,capP,capN):
+    return f'{model}:{capP:.3f}:{capN:.3f}'
+
+def openStore(path):
+    """
+    Status of every scenario in the store, by key (the last record wins).
+    A line cut short by a crash is removed so new records start on a clean
+    line.
+    """
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path,'rb+') as f:
+        data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            f.truncate(end)
+    for line in data[:end].splitlines():
+        record = json.loads(line)
+        done[scenarioKey(record['model'],record['capP'],record['capN'])] = record['status']
+    return done
+
+def appendRecord(f,record):
+    f.write(json.dumps(record) + '\n')
+    f.flush()
+    os.fsync(f.fileno())
+
+def readStore(path,model=None,crops=None,base=None):
+    """
+    Store as a data frame of production in the layout of Prod.csv: the
+    baseline production as 'Base' (if given), then one column per solved
+    scenario ordered by capN, then capP, rows in crop order. A scenario
+    stored more than once counts by its last record.
+    """
+    records = {}
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            if model in (None,record['model']):
+                records[scenarioKey(record['model'],record['capP'],record['capN'])] = record
+    solved = sorted((r for r in records.values() if r['status'] == 'optimal'),
+                    key=lambda r: (r['capN'],r['capP']))
+    columns = {} if base is None else {'Base':list(base)}
+    columns.update((r['name'],r['prod']) for r in solved)
+    return pd.DataFrame(columns,index=crops)
+
+
+#%% Workers
+
+def linearWorker(chunk,waterAvailable,queue):
+    import nleb_linear
+    if 'workerModel' not in vars(nleb_linear):
+        nleb_linear.initWorker(waterAvailable)
+    for capP,capN in chunk:
+        sol = nleb_linear.workerModel.solve(capP,capN)
+        queue.put({'model':'linear','name':nleb_linear.scenarioName(capP,capN),
+                   'capP':capP,'capN':capN,
+                   'status':'failed' if sol is None else 'optimal',
+                   'prod':None if sol is None else sol.Prod_Ton.tolist(),'price':None})
+
+def nonlinearWorker(path,method,queue):
+    """
+    One row of the nonlinear grid, each scenario warm-started from the
+    previous one (see nleb_nonlinear.runGrid).
+    """
+    import nleb_nonlinear
+    v = None
+    for capP,capN in path:
+        sol = nleb_nonlinear.solveExp(capP,capN,method=method,vInit=v)
+        record = {'model':'nonlinear','name':nleb_nonlinear.scenarioName(capP,capN),
+                  'capP':capP,'capN':capN,'status':'failed','prod':None,'price':None,
+                  'iterations':int(sol.nit)}
+        if sol.success:
+            vopt = nleb_nonlinear.extractVars(sol.x)
+            record.update(status='optimal',prod=vopt['y'].tolist(),price=vopt['p'].tolist())
+            v = sol.x
+        else:
+            v = None
+        queue.put(record)
+
+
+#%% Runner
+
+def capRange(start,stop,step):
+    return [round(c,3) for c in np.arange(start,stop + step/2,step)]
+
+def runScenarios(model,capP,capN,store,processes=None,waterAvailable=False,method='SLSQP',
+                 retryFailed=False):
+    """
+    Solve every (capP, capN) not yet in the store and append each result as
+    soon as it arrives. Scenarios stored as failed are only solved again
+    with retryFailed. Returns the number of scenarios solved in this run.
+    """
+    done = openStore(store)
+    skip = {'optimal'} if retryFailed else {'optimal','failed'}
+    todo = [(p,n) for n in capN for p in capP if done.get(scenarioKey(model,p,n)) not in skip]
+    if not todo:
+        return 0
+
+    processes = processes or os.cpu_count()
+
+    with multiprocessing.Manager() as manager, \
+         multiprocessing.Pool(processes) as pool, \
+         open(store,'a') as f:
+        queue = manager.Queue()
+
+        if model == 'linear':
+            # Small chunks of neighbouring scenarios: warm starts, frequent writes
+            bounds = np.linspace(0,len(todo),min(len(todo),8*processes) + 1).astype(int)
+            tasks = [pool.apply_async(linearWorker,(todo[a:b],waterAvailable,queue))
+                     for a,b in zip(bounds[:-1],bounds[1:])]
+        elif model == 'nonlinear':
+            rows = [[(p,n) for p,m in todo if m == n] for n in capN]
+            tasks = [pool.apply_async(nonlinearWorker,(row,method,queue)) for row in rows if row]
+        else:
+            raise ValueError(f'Unknown model: {model}')
+
+        received = 0
+        while received < len(todo):
+            try:
+                appendRecord(f,queue.get(timeout=1))
+                received += 1
+            except queue_.Empty:
+                # Re-raise a worker's exception instead of waiting forever
+                for task in tasks:
+                    if task.ready() and not task.successful():
+                        task.get()
+
+        for task in tasks:
+            task.get()
+
+    return len(todo)
+
+
+#%% Command line
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Run NLEB cap scenarios with checkpointing.')
+    parser.add_argument('model',nargs='?',choices=['linear','nonlinear'])
+    parser.add_argument('--spec',help='JSON file with the options below')
+    parser.add_argument('--capP',nargs=3,type=float,metavar=('START','STOP','STEP'))
+    parser.add_argument('--capN',nargs=3,type=float,metavar=('START','STOP','STEP'))
+    parser.add_argument('--store',help='JSON-lines file of solved scenarios')
+    parser.add_argument('--processes',type=int)
+    parser.add_argument('--water',action='store_true',help='allow additional water (linear)')
+    parser.add_argument('--method',help='SLSQP (default) or trust-constr (nonlinear)')
+    parser.add_argument('--retry-failed',action='store_true',help='solve failed scenarios again')
+    parser.add_argument('--csv',help='write the production of all stored scenarios here')
+    args = parser.parse_args()
+
+    options = vars(args)
+    if args.spec:
+        with open(args.spec) as f:
+            spec = json.load(f)
+        options.update({k:v for k,v in spec.items() if options.get(k) in (None,False)})
+
+    if not (options['model'] and options['capP'] and options['capN'] and options['store']):
+        parser.error('model, --capP, --capN and --store are required (directly or in --spec)')
+
+    solved = runScenarios(options['model'],capRange(*options['capP']),capRange(*options['capN']),
+                          options['store'],options['processes'],options['water'],options['method'] or 'SLSQP',
+                          options['retry_failed'])
+    print(f'{solved} scenario(s) solved, results in {options["store"]}')
+
+    if options['csv']:
+        import nleb_data
+        parameters,crops,subdivisions,x0 = nleb_data.loadData()
+        base = x0.sum(0) * parameters.Yield.to_numpy('float64')
+        readStore(options['store'],options['model'],crops,base).to_csv(options['csv'])
@@ -0,0 +1,322 @@
+"""
+-------------  NLEB solve server  --------------
+Local HTTP/JSON server that keeps the data and
+the built models in memory
+
+    python nleb_server.py --port 8765
+    curl -d '{"capP":0.4,"capN":0.3}' localhost:8765/linear
+    curl -d '[{"capP":0.1,"capN":0},{"capP":0.2,"capN":0}]' localhost:8765/nonlinear
+
+POST /linear      {capP, capN, water, coefficients}
+POST /nonlinear   {capP, capN, method, coefficients}
+POST /goalprog    {weights}
+GET  /health
+
+coefficients edits crop values of the data, e.g.
+{"Price": {"Corn": 250}}. A body may also be a
+list of scenarios. Requests for a model that
+arrive while it is busy are solved together as
+one batch, ordered so every solve warm-starts
+from a neighbouring one. Solves run on one
+thread per model, so the event loop keeps
+accepting requests.
+
+May     2021
+------------------------------------------------
+
+"""
+
+import json
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import nleb_linear
+import nleb_nonlinear
+import goalProg_Ireland
+import instrumentation
+
+
+reasons = {200:'OK',400:'Bad Request',404:'Not Found',405:'Method Not Allowed',
+           500:'Internal Server Error'}
+
+
+#%% Requests
+
+def parseEdits(edits):
+    """
+    Coefficient edits as {name: {crop: value}}, checked against the data.
+    """
+    edits = edits or {}
+    for name,values in edits.items():
+        if name not in nleb_linear.coefficientNames:
+            raise ValueError(f'Unknown coefficient: {name}')
+        for crop,value in values.items():
+            if crop not in nleb_linear.crops:
+                raise ValueError(f'Unknown crop: {crop}')
+            float(value)
+    return edits
+
+def editKey(edits):
+    return json.dumps(edits,sort_keys=True)
+
+def editedCoefficients(edits,names=None):
+    """
+    Per-crop coefficient arrays with the edits applied. Only the edited
+    coefficients unless names are given.
+    """
+    parameters = nleb_linear.parameters
+    index = {crop:k for k,crop in enumerate(nleb_linear.crops)}
+    out = {}
+    for name in set(names or ()) | set(edits):
+        arr = parameters[name].to_numpy('float64').copy()
+        for crop,value in edits.get(name,{}).items():
+            arr[index[crop]] = float(value)
+        out[name] = arr
+    return out
+
+def parseScenario(body):
+    return {'capP':float(body.get('capP',0.4)),'capN':float(body.get('capN',0.3)),
+            'water':bool(body.get('water',False)),'method':body.get('method','SLSQP'),
+            'coefficients':parseEdits(body.get('coefficients'))}
+
+def parseWeights(body):
+    weights = body.get('weights',{})
+    missing = [w for w in goalProg_Ireland.weightNames if w not in weights]
+    if missing:
+        raise ValueError(f'Missing weights: {", ".join(missing)}')
+    return {w:float(weights[w]) for w in goalProg_Ireland.weightNames}
+
+
+#%% Models
+
+class LinearService:
+    """
+    CropModel per water setting, built once. Coefficient edits are pushed
+    into the model in place and only when they differ from the last solve.
+    """
+
+    def __init__(self):
+        self.models = {False:nleb_linear.CropModel(False)}
+        self.current = {False:editKey({})}
+
+    def model(self,water,edits):
+        if water not in self.models:
+            self.models[water] = nleb_linear.CropModel(water)
+            self.current[water] = editKey({})
+        model = self.models[water]
+        key = editKey(edits)
+        if key != self.current[water]:
+            model.setCoefficients(editedCoefficients(edits))
+            self.current[water] = key
+        return model
+
+    def order(self,r):
+        return (r['water'],editKey(r['coefficients']),r['capN'],r['capP'])
+
+    def solve(self,r):
+        model = self.model(r['water'],r['coefficients'])
+        sol = model.solve(r['capP'],r['capN'])
+        if sol is None:
+            return {'status':'infeasible'}
+        lp = model.lp
+        return {'status':'optimal','prod':dict(zip(nleb_linear.crops,sol.Prod_Ton.tolist())),
+                'utility':model.utility,'water':float(model.values[-1]),
+                'shadowP':model.constraints[lp['rowP']].dual_value(),
+                'shadowN':model.constraints[lp['rowN']].dual_value()}
+
+
+class NonlinearService:
+    """
+    nleb_nonlinear with its data in memory. Each solve starts from the
+    solution of the one before.
+    """
+
+    def __init__(self):
+        self.current = editKey({})
+        self.v = None
+
+    def order(self,r):
+        return (editKey(r['coefficients']),r['method'],r['capN'],r['capP'])
+
+    def solve(self,r):
+        key = editKey(r['coefficients'])
+        if key != self.current:
+            nleb_nonlinear.setCoefficients(editedCoefficients(r['coefficients'],
+                                                              nleb_linear.coefficientNames))
+            self.current = key
+        sol = nleb_nonlinear.solveExp(r['capP'],r['capN'],method=r['method'],vInit=self.v)
+        if not sol.success:
+            self.v = None
+            return {'status':'failed','message':str(sol.message)}
+        self.v = sol.x
+        v = nleb_nonlinear.extractVars(sol.x)
+        return {'status':'optimal','prod':dict(zip(nleb_linear.crops,v['y'].tolist())),
+                'price':dict(zip(nleb_linear.crops,v['p'].tolist())),'utility':-float(sol.fun)}
+
+
+class GoalProgService:
+
+    def __init__(self):
+        self.model = goalProg_Ireland.IrelandModel()
+
+    def order(self,weights):
+        return 0
+
+    def solve(self,weights):
+        sol = self.model.solve(weights)
+        if sol is None:
+            return {'status':'infeasible'}
+        return {'status':'optimal','solution':sol}
+
+
+#%% Batching
+
+class Batcher:
+    """
+    Queue of requests for one service. Requests that arrive within window
+    seconds of each other, or while the previous batch is solving, form
+    the next batch; it is solved in the service's order on the service's
+    own thread (the models are not thread-safe).
+    """
+
+    def __init__(self,name,service,window=0.002):
+        self.name = name
+        self.service = service
+        self.window = window
+        self.pending = []
+        self.wakeup = asyncio.Event()
+        self.executor = ThreadPoolExecutor(1)
+
+    async def submit(self,request):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((request,future))
+        self.wakeup.set()
+        return await future
+
+    def solveBatch(self,requests):
+        rec = instrumentation.Recorder('nleb_server',event='batch',service=self.name,
+                                       requests=len(requests))
+        results = [None] * len(requests)
+        with rec.phase('solve'):
+            for k in sorted(range(len(requests)),key=lambda k: self.service.order(requests[k])):
+                try:
+                    results[k] = self.service.solve(requests[k])
+                except ValueError as e:
+                    results[k] = {'status':'error','error':str(e)}
+        rec.emit()
+        return results
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.wakeup.wait()
+            await asyncio.sleep(self.window)
+            self.wakeup.clear()
+            batch,self.pending = self.pending,[]
+            try:
+                results = await loop.run_in_executor(self.executor,self.solveBatch,
+                                                     [r for r,f in batch])
+            except Exception as e:
+                for r,f in batch:
+                    if not f.done():
+                        f.set_exception(e)
+            else:
+                for (r,f),result in zip(batch,results):
+                    if not f.done():
+                        f.set_result(result)
+
+
+#%% HTTP
+
+class Server:
+
+    def __init__(self,window=0.002):
+        self.batchers = {'/linear':Batcher('linear',LinearService(),window),
+                         '/nonlinear':Batcher('nonlinear',NonlinearService(),window),
+                         '/goalprog':Batcher('goalprog',GoalProgService(),window)}
+        self.parsers = {'/linear':parseScenario,'/nonlinear':parseScenario,
+                        '/goalprog':parseWeights}
+
+    async def route(self,method,path,body):
+        if path == '/health':
+            return 200,{'status':'ok','services':[p.strip('/') for p in self.batchers]}
+        if path not in self.batchers:
+            return 404,{'error':f'Unknown path: {path}'}
+        if method != 'POST':
+            return 405,{'error':'Use POST'}
+        try:
+            payload = json.loads(body or b'{}')
+            many = isinstance(payload,list)
+            requests = [self.parsers[path](p) for p in (payload if many else [payload])]
+        except (ValueError,TypeError,AttributeError) as e:
+            return 400,{'error':str(e)}
+        try:
+            results = await asyncio.gather(*[self.batchers[path].submit(r) for r in requests])
+        except Exception as e:
+            return 500,{'error':f'{type(e).__name__}: {e}'}
+        return 200,(list(results) if many else results[0])
+
+    async def handle(self,reader,writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method,path,version = line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n',b'\n',b''):
+                        break
+                    name,_,value = header.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length',0)))
+
+                status,payload = await self.route(method,path.split('?')[0],body)
+                data = json.dumps(payload,default=float).encode()
+                writer.write(f'HTTP/1.1 {status} {reasons[status]}\r\n'
+                             f'Content-Type: application/json\r\n'
+                             f'Content-Length: {len(data)}\r\n\r\n'.encode() + data)
+                await writer.drain()
+                if version == 'HTTP/1.0' or headers.get('connection','').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError,ConnectionResetError,ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self,host='127.0.0.1',port=8765,socket=None):
+        """
+        Start the batchers and listen. Returns the asyncio server; with
+        port=0 the system picks a free port (see server.sockets).
+        """
+        for batcher in self.batchers.values():
+            asyncio.get_running_loop().create_task(batcher.run())
+        if socket:
+            return await asyncio.start_unix_server(self.handle,socket)
+        return await asyncio.start_server(self.handle,host,port)
+
+    async def serve(self,host='127.0.0.1',port=8765,socket=None):
+        server = await self.start(host,port,socket)
+        async with server:
+            await server.serve_forever()
+
+
+#%% Command line
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Serve NLEB and goal programming solves over HTTP.')
+    parser.add_argument('--host',default='127.0.0.1')
+    parser.add_argument('--port',type=int,default=8765)
+    parser.add_argument('--socket',help='listen on this Unix socket instead')
+    parser.add_argument('--window',type=float,default=0.002,
+                        help='seconds to wait for more requests before solving a batch')
+    args = parser.parse_args()
+
+    async def main():
+        # Batchers need the running loop, so the models are built inside it
+        await Server(args.window).serve(args.host,args.port,args.socket)
+
+    asyncio.run(main())
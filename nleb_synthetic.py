@@ -0,0 +1,68 @@
+"""
+-----------  Synthetic NLEB basins  ------------
+Random crop parameters and baseline areas with
+the layout of the North Lake Erie Basin data
+
+Written with nleb_data.writeCache, so the models
+load them through NLEB_DATA without any Excel file:
+
+    NLEB_DATA=folder python nleb_linear.py
+
+May     2021
+------------------------------------------------
+
+"""
+
+import pandas as pd
+import numpy as np
+
+import nleb_data
+
+
+def syntheticData(nS=50,nC=10,seed=0):
+    """
+    Parameters, crops, subdivisions and x0 [thousand-Ha/yr] of a random
+    basin with nS subdivisions and nC crops. Magnitudes follow the Ontario
+    data; the cost is drawn relative to revenue so margins can be negative.
+    """
+    rng = np.random.default_rng(seed)
+
+    crops = [f'Crop{c:03d}' for c in range(nC)]
+    subdivisions = [f'Sub{s:05d}' for s in range(nS)]
+
+    yieldHa = rng.uniform(2000,10000,nC)       # [Ton/thousand-Ha]
+    price = rng.uniform(100,500,nC)            # Price/1000 -> [$M/Ton]
+    revenue = price/1000 * yieldHa             # [$M/thousand-Ha]
+
+    parameters = pd.DataFrame({'Pexp':rng.uniform(0.3,3,nC),
+                               'Nexp':rng.uniform(5,60,nC),
+                               'Water':rng.uniform(0,2000,nC),
+                               'Yield':yieldHa,
+                               'Cost':revenue * rng.uniform(0.4,1.2,nC) / 1e-3,
+                               'Price':price,
+                               'Names':crops},index=crops)
+
+    # Each subdivision splits its area over a few crops
+    area = rng.uniform(0.5,20,nS)
+    shares = rng.dirichlet(np.full(nC,0.3),nS)
+    x0 = area[:,None] * shares
+
+    return parameters,crops,subdivisions,x0
+
+def syntheticBMPs(nB=5,seed=0):
+    """
+    Best management practices in the layout read by nleb_bmp.readBMPs:
+    fixed cost of adopting one [$M/yr], cost per area of the subdivision
+    [$M/thousand-Ha/yr] and fractions of its P and N exports removed.
+    """
+    rng = np.random.default_rng(seed)
+    names = [f'BMP{b:02d}' for b in range(nB)]
+    return pd.DataFrame({'Fixed':rng.uniform(0.01,0.2,nB),
+                         'CostHa':rng.uniform(0.01,0.1,nB),
+                         'Pred':rng.uniform(0.1,0.6,nB),
+                         'Nred':rng.uniform(0.05,0.4,nB),
+                         'Names':names},index=names)
+
+def writeSynthetic(folder,nS=50,nC=10,seed=0):
+    nleb_data.writeCache(folder,*syntheticData(nS,nC,seed))
+    return folder
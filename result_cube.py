@@ -0,0 +1,70 @@
+"""
+-------------  Result cube  --------------
+Scenario results on disk as memory-mapped
+.npy arrays with labelled axes
+
+A cube folder holds one array per quantity
+and axes.json with the labels of every axis.
+Arrays are preallocated with NaN, so workers
+can fill their own scenarios in place.
+
+May     2021
+------------------------------------------
+
+"""
+
+import numpy as np
+import os
+import json
+from numpy.lib.format import open_memmap
+
+
+def createCube(folder,axes,quantities):
+    """
+    Preallocate a cube. axes maps axis names to their labels, quantities
+    maps each array name to the tuple of axis names it spans, e.g.
+    {'area':('capP','capN','subdivision','crop'),'utility':('capP','capN')}.
+    """
+    os.makedirs(folder,exist_ok=True)
+    for name,dims in quantities.items():
+        arr = open_memmap(os.path.join(folder,name + '.npy'),mode='w+',dtype='float64',
+                          shape=tuple(len(axes[d]) for d in dims))
+        arr[...] = np.nan
+        arr.flush()
+        del arr
+    with open(os.path.join(folder,'axes.json'),'w') as f:
+        json.dump({'axes':{k:list(v) for k,v in axes.items()},
+                   'quantities':{k:list(v) for k,v in quantities.items()}},f)
+
+def openCube(folder,mode='r'):
+    """
+    Memory-map every array of a cube. Returns (arrays, axes, quantities);
+    use mode='r+' to write.
+    """
+    with open(os.path.join(folder,'axes.json')) as f:
+        meta = json.load(f)
+    arrays = {name:np.load(os.path.join(folder,name + '.npy'),mmap_mode=mode)
+              for name in meta['quantities']}
+    return arrays,meta['axes'],meta['quantities']
+
+def label(folder,name,**where):
+    """
+    Slice of one quantity selected by axis labels, e.g.
+    label(folder,'area',capP=0.1,capN=0.2) -> subdivision x crop array.
+    Numeric labels are matched to 3 decimals.
+    """
+    arrays,axes,quantities = openCube(folder)
+    index = []
+    for dim in quantities[name]:
+        if dim in where:
+            labels = axes[dim]
+            value = where[dim]
+            if isinstance(value,float):
+                index.append(int(np.argmin(np.abs(np.asarray(labels,'float64') - value))))
+                if abs(labels[index[-1]] - value) > 5e-4:
+                    raise KeyError(f'{value} is not a label of {dim}')
+            else:
+                index.append(labels.index(value))
+        else:
+            index.append(slice(None))
+    return arrays[name][tuple(index)]
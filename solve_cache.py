@@ -0,0 +1,284 @@
+"""
+-------------  Solve cache  --------------
+Scenario solutions memoized on disk
+
+A wrapped solver hashes the model name, the
+sources of its module and of the repository
+modules it imports, the model's input arrays
+and constants and the call arguments, and
+returns the stored solution for that key
+instead of solving again:
+
+    @solve_cache.memoize('nleb_linear',lambda: (parameters,x0,minProd,maxProd))
+    def solveCrop(capP,capN,...):
+        ...
+
+Entries are pickles written under a temporary
+name and moved into place, so any number of
+processes can share a folder. The least
+recently used entries are evicted when the
+folder grows above maxBytes. Failed solves
+(None) are never stored.
+
+The cache is off unless NLEB_SOLVE_CACHE names
+its folder (or setFolder is called).
+
+May     2021
+------------------------------------------
+
+"""
+
+import numpy as np
+import pandas as pd
+import os
+import time
+import fcntl
+import pickle
+import hashlib
+import types
+import inspect
+import tempfile
+import functools
+
+import instrumentation
+
+
+folder = os.environ.get('NLEB_SOLVE_CACHE') or None
+
+# Size bound of the folder [bytes]
+maxBytes = 2**30
+
+# Bytes this process stored since it last checked the folder size
+written = None
+
+missing = object()
+
+
+def setFolder(newFolder,newMaxBytes=None):
+    """
+    Cache into newFolder (None turns caching off). Returns the previous folder.
+    """
+    global folder,maxBytes,written
+    previous = folder
+    folder = newFolder
+    if newMaxBytes is not None:
+        maxBytes = newMaxBytes
+    written = None
+    return previous
+
+
+#%% Keys
+
+def feed(h,obj):
+    """
+    Add obj to the hash h. Types are part of the hash, so 1, 1.0 and '1'
+    give different keys. Scalar floats are taken to 12 significant digits,
+    so caps from different grids (0.06 and 0.06000000000000001) match.
+    """
+    if isinstance(obj,pd.DataFrame):
+        h.update(b'frame')
+        feed(h,[str(k) for k in obj.columns])
+        feed(h,[str(k) for k in obj.index])
+        for col in obj.columns:
+            feed(h,obj[col].to_numpy())
+    elif isinstance(obj,np.ndarray):
+        if obj.dtype == object:
+            feed(h,obj.tolist())
+        else:
+            arr = np.ascontiguousarray(obj)
+            h.update(f'array{arr.dtype.str}{arr.shape}'.encode())
+            h.update(arr.tobytes())
+    elif isinstance(obj,dict):
+        h.update(f'dict{len(obj)}'.encode())
+        for k in sorted(obj,key=str):
+            feed(h,str(k))
+            feed(h,obj[k])
+    elif isinstance(obj,(list,tuple)):
+        h.update(f'list{len(obj)}'.encode())
+        for v in obj:
+            feed(h,v)
+    elif isinstance(obj,np.generic):
+        feed(h,obj.item())
+    elif isinstance(obj,float):
+        h.update(f'float:{obj:.12g};'.encode())
+    elif obj is None or isinstance(obj,(bool,int,str)):
+        h.update(f'{type(obj).__name__}:{obj!r};'.encode())
+    else:
+        raise TypeError(f'Cannot hash {type(obj).__name__} for the solve cache')
+
+@functools.lru_cache(maxsize=None)
+def sourceHash(path):
+    with open(path,'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def repoSources(module):
+    """
+    Source files of module and of every module from the same folder that
+    it imports, directly or through another one, in a fixed order.
+    """
+    root = os.path.dirname(os.path.abspath(module.__file__))
+    paths = set()
+    stack = [module]
+    while stack:
+        module = stack.pop()
+        path = getattr(module,'__file__',None)
+        if path is None:
+            continue
+        path = os.path.abspath(path)
+        if os.path.dirname(path) != root or path in paths or not path.endswith('.py'):
+            continue
+        paths.add(path)
+        stack.extend(v for v in vars(module).values() if isinstance(v,types.ModuleType))
+    return sorted(paths)
+
+def makeKey(*parts):
+    h = hashlib.sha256()
+    feed(h,list(parts))
+    return h.hexdigest()
+
+
+#%% Storage
+
+def entryPath(key):
+    return os.path.join(folder,key[:2],key + '.pkl')
+
+def load(key):
+    """
+    Stored value of key, or missing. A hit refreshes the entry's time,
+    which is what eviction orders by.
+    """
+    path = entryPath(key)
+    try:
+        with open(path,'rb') as f:
+            value = pickle.load(f)
+        os.utime(path)
+    except FileNotFoundError:
+        return missing
+    except (EOFError,pickle.UnpicklingError):
+        # Damaged outside the cache (writes are atomic): solve again
+        return missing
+    return value
+
+def store(key,value):
+    global written
+    path = entryPath(key)
+    os.makedirs(os.path.dirname(path),exist_ok=True)
+    fd,tmp = tempfile.mkstemp(suffix='.tmp',dir=os.path.dirname(path))
+    with os.fdopen(fd,'wb') as f:
+        pickle.dump(value,f,protocol=pickle.HIGHEST_PROTOCOL)
+        size = f.tell()
+    os.replace(tmp,path)
+
+    # Check the folder size on the first store and then every maxBytes/16
+    if written is None or written + size > maxBytes // 16:
+        evict()
+        written = 0
+    else:
+        written += size
+
+def evict(fill=0.9,staleSeconds=3600):
+    """
+    Remove the least recently used entries until the folder is below fill
+    times maxBytes, plus temporary files left by writers that died. One
+    process evicts at a time; the others skip instead of waiting.
+    """
+    os.makedirs(folder,exist_ok=True)
+    with open(os.path.join(folder,'.lock'),'w') as lock:
+        try:
+            fcntl.flock(lock,fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+
+        now = time.time()
+        entries = []
+        for sub in os.scandir(folder):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                try:
+                    stat = entry.stat()
+                    if entry.name.endswith('.pkl'):
+                        entries.append((stat.st_mtime,stat.st_size,entry.path))
+                    elif entry.name.endswith('.tmp') and now - stat.st_mtime > staleSeconds:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+
+        total = sum(size for mtime,size,path in entries)
+        if total <= maxBytes:
+            return
+        for mtime,size,path in sorted(entries):
+            if total <= fill * maxBytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+def clear():
+    # Remove every entry of the folder
+    global written
+    if folder is None or not os.path.isdir(folder):
+        return
+    for sub in os.scandir(folder):
+        if sub.is_dir():
+            for entry in os.scandir(sub.path):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+    written = None
+
+
+#%% Decorator
+
+def isFailure(value):
+    return value is None or (isinstance(value,tuple) and all(v is None for v in value))
+
+def memoize(model,state,ignore=('verbose',)):
+    """
+    Cache the results of a solver function on disk. state() returns the
+    module-level inputs the solution depends on (data arrays, constants);
+    it is called on every lookup, so changing a global gives a new key.
+    Arguments named in ignore are not part of the key; calls with
+    verbose=True always solve, so they still print. Results that are None,
+    or tuples of None (e.g. runExp's (None, None)), are not stored, so a
+    failed solve is tried again next time.
+
+    The original function stays available as the wrapper's .uncached.
+    """
+    def decorate(fun):
+        signature = inspect.signature(fun)
+        sources = []
+
+        @functools.wraps(fun)
+        def cached(*args,**kwargs):
+            bound = signature.bind(*args,**kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            if folder is None or arguments.get('verbose'):
+                return fun(*args,**kwargs)
+            for name in ignore:
+                arguments.pop(name,None)
+
+            rec = instrumentation.Recorder(model,event='cache',function=fun.__name__)
+            with rec.phase('lookup'):
+                # Imports are complete by the first call
+                if not sources:
+                    sources.extend(repoSources(inspect.getmodule(fun)))
+                key = makeKey(model,fun.__name__,[sourceHash(p) for p in sources],state(),arguments)
+                value = load(key)
+            rec.add(key=key,cacheHit=value is not missing)
+
+            if value is missing:
+                value = fun(*args,**kwargs)
+                if not isFailure(value):
+                    with rec.phase('store'):
+                        store(key,value)
+            rec.emit()
+            return value
+
+        cached.uncached = fun
+        return cached
+    return decorate
@@ -0,0 +1,19 @@
+"""
+Every test runs on a small synthetic basin (nleb_synthetic) written to a
+temporary NLEB_DATA folder before any model module is imported, with the
+solve cache off.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ['NLEB_DATA'] = os.path.join(tempfile.mkdtemp(prefix='nleb_tests_'),'data')
+os.environ.pop('NLEB_SOLVE_CACHE',None)
+os.environ.pop('NLEB_RECORDS',None)
+
+import nleb_synthetic
+
+nleb_synthetic.writeSynthetic(os.environ['NLEB_DATA'],nS=30,nC=6,seed=0)
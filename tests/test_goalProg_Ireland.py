@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+import goalProg_Ireland
+
+
+def levelValue(sol,level):
+    return sum(sol[goalProg_Ireland.deviations[w]] for w in level)
+
+def test_preemptive_solution_matches_levels():
+    priorities = [['Exceed_P','Exceed_C'],['Deficit_CowSales']]
+    model = goalProg_Ireland.IrelandModel()
+    sol = model.solvePreemptive(priorities)
+    assert sol is not None
+    for level,value in zip(priorities,sol['Levels']):
+        assert np.isclose(levelValue(sol,level),value,atol=1e-6)
+    assert sol['Levels'][1] > 0
+
+    # The optimum of the first level does not depend on the levels after it
+    alone = model.solvePreemptive(priorities[:1])
+    assert np.isclose(alone['Levels'][0],sol['Levels'][0],atol=1e-6)
+
+    # Level rows are released: solving again gives the same answer
+    again = model.solvePreemptive(priorities)
+    assert np.allclose(again['Levels'],sol['Levels'])
+
+def test_weight_sweep_matches_single_solves():
+    rng = np.random.default_rng(0)
+    weights = rng.uniform(0.001,1,(5,len(goalProg_Ireland.weightNames)))
+    model = goalProg_Ireland.IrelandModel()
+    values,objective = model.solveWeights(weights)
+    for k,w in enumerate(weights):
+        sol = goalProg_Ireland.IrelandModel().solve(dict(zip(goalProg_Ireland.weightNames,w)))
+        assert np.isclose(sol['Obj_fun'],objective[k],rtol=1e-7)
+
+def test_weight_matrix_must_have_every_weight():
+    model = goalProg_Ireland.IrelandModel()
+    with pytest.raises(ValueError):
+        model.solveWeights(np.ones((1,len(goalProg_Ireland.weightNames) - 5)))
+    with pytest.raises(ValueError):
+        model.solveWeights(np.ones(len(goalProg_Ireland.weightNames)))
+    with pytest.raises(ValueError):
+        model.setWeights([1.0])
+
+def test_preemptive_needs_a_level():
+    with pytest.raises(ValueError):
+        goalProg_Ireland.IrelandModel().solvePreemptive([])
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+import goalProg_farms
+import goalProg_Ireland
+
+
+# The weights of goalProg_Ireland's example, as in irelandFarms
+weights = {'Deficit_GrassSales':1.0,'Deficit_WheatSales':1.0,'Deficit_CowSales':1.0,
+           'Exceed_Cost':1.0,'Exceed_P':0.001,'Exceed_C':0.001,'Exceed_OF':0.01,'Deficit_OF':0.1,
+           'Exceed_CF':0.001,'Exceed_ProdGrass':1.0,'Deficit_ProdGrass':1.0,
+           'Exceed_ProdWheat':1.0,'Deficit_ProdWheat':1.0,'Exceed_ProdCow':1.0,'Deficit_ProdCow':1.0}
+
+def emissionP(sol):
+    e = sol['enterprises']
+    return (e.level * e.emissionP).sum()
+
+def test_one_farm_matches_ireland_model():
+    enterprises,goals = goalProg_farms.irelandFarms(1)
+    sol = goalProg_farms.solveFarms(enterprises,goals,processes=1)
+    reference = goalProg_Ireland.solveIrelandModel(weights)
+    assert np.isclose(sol['objective'].iloc[0],reference['Obj_fun'],rtol=1e-9)
+    level = sol['enterprises'].set_index('enterprise').level
+    for name in ('grass','wheat','cow'):
+        assert np.isclose(level[name],reference[name],rtol=1e-9)
+
+def test_regional_cap_binds():
+    enterprises,goals = goalProg_farms.irelandFarms(4)
+    free = goalProg_farms.solveFarms(enterprises,goals,processes=2)
+    cap = 0.8 * emissionP(free)
+    capped = goalProg_farms.solveFarms(enterprises,goals,caps={'emissionP':cap})
+    assert np.isclose(emissionP(capped),cap,rtol=1e-9)
+    assert capped['objective'].sum() > free['objective'].sum()
+
+@pytest.mark.parametrize('blocks',[1,4])
+def test_infeasible_farm_is_left_out(blocks):
+    enterprises,goals = goalProg_farms.irelandFarms(4)
+    goals.loc[(goals.farm == 2) & (goals.goal == 'AvailableArea'),'target'] = -1.0
+    sol = goalProg_farms.solveFarms(enterprises,goals,processes=2,blocks=blocks)
+    assert sol['objective'].isna().tolist() == [False,False,True,False]
+    assert sol['enterprises'].level.isna().groupby(enterprises.farm).all().tolist() == \
+        [False,False,True,False]
+    reference = goalProg_Ireland.solveIrelandModel(weights)['Obj_fun']
+    assert np.allclose(sol['objective'].dropna(),reference,rtol=1e-9)
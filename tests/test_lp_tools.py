@@ -0,0 +1,38 @@
+import numpy as np
+from scipy import sparse
+from ortools.linear_solver import pywraplp
+
+import lp_tools
+
+
+def randomLP(m=40,n=60,seed=0):
+    rng = np.random.default_rng(seed)
+    A = sparse.random(m,n,density=0.2,format='csr',random_state=seed)
+    rowLo = np.where(rng.random(m) < 0.3,-1.0,-np.inf)
+    rowHi = np.full(m,5.0)
+    return rng.uniform(-1,1,n),A,rowLo,rowHi,np.zeros(n),np.full(n,10.0)
+
+def test_bulk_load_matches_highs():
+    c,A,rowLo,rowHi,colLo,colHi = randomLP()
+    solver = pywraplp.Solver.CreateSolver('GLOP')
+    variables,constraints = lp_tools.loadMatrixModel(solver,c,A,rowLo,rowHi,colLo,colHi,
+                                                     maximize=True)
+    assert len(variables) == A.shape[1] and len(constraints) == A.shape[0]
+    assert solver.Solve() == pywraplp.Solver.OPTIMAL
+
+    x,objective = lp_tools.solveMatrixHighs(c,A,rowLo,rowHi,colLo,colHi,maximize=True)
+    assert np.isclose(solver.Objective().Value(),objective,rtol=1e-7)
+    values = lp_tools.solutionValues(solver)
+    assert lp_tools.maxViolation(A,rowLo,rowHi,colLo,colHi,values) < 1e-7
+
+def test_integer_columns():
+    c,A,rowLo,rowHi,colLo,colHi = randomLP()
+    integer = np.zeros(len(c),bool)
+    integer[::3] = True
+    solver = pywraplp.Solver.CreateSolver('SCIP')
+    variables,_ = lp_tools.loadMatrixModel(solver,c,A,rowLo,rowHi,colLo,colHi,maximize=True,
+                                           integer=integer)
+    assert [v.integer() for v in variables] == integer.tolist()
+    assert solver.Solve() == pywraplp.Solver.OPTIMAL
+    values = lp_tools.solutionValues(solver)
+    assert np.allclose(values[integer],np.round(values[integer]),atol=1e-6)
@@ -0,0 +1,26 @@
+import pytest
+
+import nleb_bmp
+import nleb_linear
+import nleb_synthetic
+
+
+@pytest.mark.parametrize('backend',['CBC','SCIP'])
+@pytest.mark.parametrize('nB',[1,2])
+def test_mip_within_bounds(nB,backend):
+    capP,capN = 0.5,0.45
+    sol = nleb_bmp.solveBMP(nleb_synthetic.syntheticBMPs(nB),capP,capN,backend=backend,
+                            timeLimit=30)
+    assert sol is not None
+    assert sol['utility'] <= sol['lpBound'] + 1e-6 * abs(sol['lpBound'])
+    assert sol['maxViolation'] < 1e-6
+    assert (sol['adoption'].sum(axis=1) <= 1).all()
+
+    # Adopting nothing is feasible, so BMPs can only help
+    model = nleb_linear.CropModel(presolve=False)
+    model.solve(capP,capN)
+    assert sol['utility'] >= model.utility - 1e-6 * abs(model.utility)
+
+def test_missing_workbook(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        nleb_bmp.readBMPs(str(tmp_path / 'DataBMPs.xlsx'))
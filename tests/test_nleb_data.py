@@ -0,0 +1,40 @@
+import os
+import numpy as np
+
+import nleb_data
+
+
+def test_cache_follows_workbook_contents(tmp_path,monkeypatch):
+    parameters,crops,subdivisions,x0 = nleb_data.loadData()
+    parameters = parameters.copy()
+    x0 = np.array(x0)
+
+    workbooks = [tmp_path / 'parameters.xlsx',tmp_path / 'baseline.xlsx']
+    for path in workbooks:
+        path.write_bytes(b'workbook ' + path.name.encode())
+    monkeypatch.setattr(nleb_data,'parametersFile',str(workbooks[0]))
+    monkeypatch.setattr(nleb_data,'baselineFile',str(workbooks[1]))
+
+    reads = []
+    def readExcel():
+        reads.append(1)
+        return parameters,crops,subdivisions,x0
+    monkeypatch.setattr(nleb_data,'readExcel',readExcel)
+
+    folder = str(tmp_path / 'cache')
+    nleb_data.loadData(folder)
+    assert len(reads) == 1
+
+    # Same contents, new mtime: the cache is reused
+    stat = os.stat(workbooks[0])
+    os.utime(workbooks[0],ns=(stat.st_atime_ns,stat.st_mtime_ns + 10**9))
+    loaded = nleb_data.loadData(folder)
+    assert len(reads) == 1
+    assert np.array_equal(loaded[3],x0) and loaded[1] == list(crops)
+
+    # New contents: the cache is rebuilt
+    workbooks[0].write_bytes(b'edited workbook')
+    nleb_data.loadData(folder)
+    assert len(reads) == 2
+    nleb_data.loadData(folder)
+    assert len(reads) == 2
@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+
+import nleb_linear
+import nleb_decomposition
+
+
+@pytest.mark.parametrize('capP,capN',[(0.1,0.0),(0.4,0.3),(0.5,0.45)])
+def test_decomposition_matches_monolithic_model(capP,capN):
+    sol = nleb_decomposition.decompose(capP,capN,processes=2)
+    model = nleb_linear.CropModel()
+    prod = model.solve(capP,capN)
+    assert sol['artificial'] == 0 and sol['gap'] <= 1e-6
+    assert np.isclose(sol['utility'],model.utility,rtol=1e-7)
+    assert np.allclose(sol['prod'],prod.Prod_Ton.to_numpy(),rtol=1e-6)
+    assert np.all(sol['x'].sum(1) <= nleb_linear.x0.sum(1) * (1 + 1e-9))
+
+def test_infeasible_caps_leave_artificial_slack():
+    sol = nleb_decomposition.decompose(0.99,0.99,processes=2)
+    assert sol['artificial'] > 0
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+import nleb_linear
+import instrumentation
+
+
+def test_warm_resolve_matches_fresh_model():
+    model = nleb_linear.CropModel(presolve=False)
+    for capP,capN in [(0.0,0.0),(0.2,0.1),(0.4,0.3),(0.1,0.2)]:
+        warm = model.solve(capP,capN)
+        fresh = nleb_linear.CropModel(presolve=False)
+        cold = fresh.solve(capP,capN)
+        assert warm is not None and cold is not None
+        assert np.isclose(model.utility,fresh.utility,rtol=1e-7)
+
+def test_aggregated_model_has_the_same_optimum():
+    full = nleb_linear.CropModel(presolve=False)
+    aggregated = nleb_linear.CropModel(presolve=True)
+    assert aggregated.lp['aggregated']
+    full.solve(0.4,0.3)
+    aggregated.solve(0.4,0.3)
+    assert np.isclose(full.utility,aggregated.utility,rtol=1e-7)
+
+def test_violation_check_only_with_a_sink(monkeypatch):
+    model = nleb_linear.CropModel()
+    def fail(*args):
+        raise AssertionError('maxViolation without a sink')
+    monkeypatch.setattr(nleb_linear.lp_tools,'maxViolation',fail)
+    assert model.solve(0.1,0.0) is not None
+
+    monkeypatch.undo()
+    records = []
+    previous = instrumentation.setSink(records.append)
+    try:
+        model.solve(0.1,0.0)
+    finally:
+        instrumentation.setSink(previous)
+    assert records[-1]['maxViolation'] < 1e-7
+
+@pytest.mark.parametrize('vary,fixedCap',[('P',0.3),('N',0.4)])
+def test_frontier_matches_direct_solves(vary,fixedCap):
+    frontier = nleb_linear.capFrontier(fixedCap,vary,0.0,0.5)
+    caps = frontier['caps']
+    assert len(caps) > 2 and caps[-1] == 0.5
+    for cap in np.concatenate(((caps[:-1] + caps[1:]) / 2,caps[:-1] + 0.1*np.diff(caps))):
+        point = nleb_linear.frontierAt(frontier,cap)
+        model = nleb_linear.CropModel()
+        prod = model.solve(cap,fixedCap) if vary == 'P' else model.solve(fixedCap,cap)
+        assert np.isclose(point['utility'],model.utility,rtol=1e-9)
+        assert np.allclose(point['prod'],prod.Prod_Ton.to_numpy(),rtol=1e-7)
+
+def test_frontier_without_pieces():
+    frontier = nleb_linear.capFrontier(0.99,'P',0.99,1.0)
+    assert len(frontier['caps']) == 1
+    with pytest.raises(ValueError):
+        nleb_linear.frontierAt(frontier,0.99)
+
+def test_adaptive_grid_solves_within_budget():
+    caps = np.arange(0.0,0.5 + 1e-9,0.02)
+    result = nleb_linear.adaptiveCaps(caps,caps,budget=60,coarse=8)
+    solved = result['solved']
+    lines = [0,8,16,24,25]
+    assert solved[np.ix_(lines,lines)].all() and solved.sum() <= 60
+    model = nleb_linear.CropModel()
+    for j,i in zip(*np.nonzero(solved)):
+        prod = model.solve(caps[j],caps[i])
+        if prod is None:
+            assert np.isnan(result['utility'][j,i])
+            continue
+        assert np.isclose(result['utility'][j,i],model.utility,rtol=1e-9)
+        assert np.allclose(result['prod'][:,j,i],prod.Prod_Ton.to_numpy(),rtol=1e-7)
+    
+    table = nleb_linear.adaptiveTable(result)
+    assert table.shape == (len(nleb_linear.crops),1 + solved.sum())
+    assert nleb_linear.adaptiveTable(result,interpolated=True).shape[1] == 1 + solved.size
+
+def test_adaptive_grid_without_tolerance_solves_everything():
+    caps = np.arange(0.0,0.3 + 1e-9,0.05)
+    result = nleb_linear.adaptiveCaps(caps,caps,tol=0.0,budget=caps.size**2,coarse=4)
+    assert result['solved'].all()
@@ -0,0 +1,13 @@
+import nleb_montecarlo
+
+
+def test_nonlinear_samples_are_solved():
+    stats = nleb_montecarlo.simulate(20,nonlinear=True,processes=2,blockSize=10)
+    assert stats['failed'] == 0 and stats['failures'] == {}
+    assert stats['utility']['n'] == 20
+
+def test_failures_are_counted_by_cause():
+    stats = nleb_montecarlo.simulate(6,capP=0.99,capN=0.99,processes=2,blockSize=3)
+    assert stats['failed'] == 6
+    assert stats['failures'] == {'no optimal solution':6}
+    assert stats['utility']['n'] == 0
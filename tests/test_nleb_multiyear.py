@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+import nleb_linear
+import nleb_multiyear
+
+
+years = 6
+capP = nleb_multiyear.capTrajectory(0,0.4,years,4)
+capN = nleb_multiyear.capTrajectory(0,0.3,years,4)
+
+def test_step_longer_than_window():
+    with pytest.raises(ValueError):
+        nleb_multiyear.rollingHorizon(capP,capN,horizon=2,step=3)
+
+@pytest.mark.parametrize('horizon,step',[(1,1),(3,1),(3,2),(years,years)])
+def test_rolling_plan_is_feasible(horizon,step):
+    maxChange,rotation = 0.1,{nleb_linear.crops[0]:0.5}
+    plan = nleb_multiyear.rollingHorizon(capP,capN,horizon,step,maxChange=maxChange,
+                                         rotation=rotation)
+    assert plan['years'] == years
+
+    lp = nleb_linear.cropMatrices(0,0,aggregate=False)
+    nX,area = lp['nX'],lp['area'][:,None]
+    areas = np.concatenate((np.asarray(nleb_linear.x0)[None],plan['areas']))
+    tol = 1e-6
+
+    assert (np.abs(np.diff(areas,axis=0)) <= maxChange * area + tol).all()
+    assert (areas[1:,:,0] + areas[:-1,:,0] <= 1.5 * area[:,0] + tol).all()
+    for t in range(years):
+        exports = lp['A'][[lp['rowP'],lp['rowN']],:nX] @ plan['areas'][t].ravel()
+        assert exports[0] <= lp['allowed']['P'] * (1-capP[t]) + tol
+        assert exports[1] <= lp['allowed']['N'] * (1-capN[t]) + tol
+
+def test_one_window_is_at_least_as_good():
+    rolling = nleb_multiyear.rollingHorizon(capP,capN,horizon=2,step=1)
+    whole = nleb_multiyear.rollingHorizon(capP,capN,horizon=years,step=years)
+    assert whole['utility'].sum() >= rolling['utility'].sum() - 1e-6 * abs(rolling['utility'].sum())
@@ -0,0 +1,75 @@
+import numpy as np
+import os
+import sys
+import subprocess
+import pytest
+
+import nleb_synthetic
+import nleb_nonlinear
+
+
+repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize('reduced',[True,False])
+@pytest.mark.parametrize('dp,dn',[(0.1,0.0),(0.5,0.45)])
+def test_trust_constr_matches_slsqp(dp,dn,reduced):
+    reference = nleb_nonlinear.solveExp(dp,dn,method='SLSQP',reduced=False)
+    sol = nleb_nonlinear.solveExp(dp,dn,method='trust-constr',reduced=reduced)
+    assert reference.success and sol.success
+    assert np.isclose(sol.fun,reference.fun,rtol=1e-6)
+    y,yRef = nleb_nonlinear.extractVars(sol.x)['y'],nleb_nonlinear.extractVars(reference.x)['y']
+    assert np.allclose(y,yRef,rtol=1e-3)
+
+def test_derivatives():
+    assert max(nleb_nonlinear.checkDerivatives().values()) < 1e-3
+
+@pytest.mark.parametrize('dp,dn',[(0.1,0.0),(0.5,0.45)])
+def test_qp_matches_slsqp(dp,dn):
+    reference = nleb_nonlinear.solveExp(dp,dn,method='SLSQP',reduced=False)
+    y,p,info = nleb_nonlinear.runQP(dp,dn)
+    assert info['success'] and info['gap'] <= 1e-9
+    assert info['lower'] >= -reference.fun * (1 - 1e-7)
+    assert np.allclose(y,nleb_nonlinear.extractVars(reference.x)['y'],rtol=1e-3)
+
+@pytest.mark.parametrize('dp,dn',[(0.1,0.0),(0.5,0.45)])
+def test_reduced_slsqp_matches_full(dp,dn):
+    reference = nleb_nonlinear.solveExp(dp,dn,method='SLSQP',reduced=False)
+    sol = nleb_nonlinear.solveExp(dp,dn,method='SLSQP',reduced=True)
+    assert reference.success and sol.success
+    assert np.isclose(sol.fun,reference.fun,rtol=1e-6)
+
+# The model reads its basin on import, so other basins are solved in a child process
+reducedScript = '''
+import nleb_nonlinear
+for dp,dn in [(0.1,0.0),(0.3,0.2),(0.5,0.45)]:
+    print(int(nleb_nonlinear.solveExp(dp,dn,method='SLSQP',reduced=True).status))
+'''
+
+@pytest.mark.parametrize('nS,nC,seed',[(20,5,4),(80,8,3),(30,6,1),(50,10,2)])
+def test_reduced_slsqp_succeeds(tmp_path,nS,nC,seed):
+    nleb_synthetic.writeSynthetic(str(tmp_path),nS=nS,nC=nC,seed=seed)
+    out = subprocess.run([sys.executable,'-c',reducedScript],cwd=repo,check=True,
+                         capture_output=True,text=True,env=dict(os.environ,NLEB_DATA=str(tmp_path)))
+    assert out.stdout.split() == ['0','0','0']
+
+scaleScript = '''
+import resource
+import nleb_nonlinear
+for dp,dn in [(0.1,0.0),(0.5,0.45)]:
+    print(int(nleb_nonlinear.solveExp(dp,dn,method='trust-constr',reduced=True).success))
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024)
+'''
+
+def test_reduced_trust_constr_scales(tmp_path):
+    nleb_synthetic.writeSynthetic(str(tmp_path),nS=10000,nC=10,seed=0)
+    out = subprocess.run([sys.executable,'-c',scaleScript],cwd=repo,check=True,timeout=120,
+                         capture_output=True,text=True,env=dict(os.environ,NLEB_DATA=str(tmp_path)))
+    *success,peakMB = out.stdout.split()
+    assert success == ['1','1']
+    assert int(peakMB) < 1024
+
+def test_qp_without_convergence_has_no_solution():
+    y,p,info = nleb_nonlinear.runQP(0.1,0.0,maxIter=1)
+    assert y is None and p is None
+    assert not info['success'] and info['gap'] > 1e-9
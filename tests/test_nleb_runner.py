@@ -0,0 +1,36 @@
+import numpy as np
+
+import nleb_linear
+import nleb_runner
+
+
+def countLines(path):
+    with open(path) as f:
+        return sum(1 for _ in f)
+
+def test_store_layout_and_restart(tmp_path):
+    store = str(tmp_path / 'linear.jsonl')
+    capP,capN = [0.0,0.02,0.1],[0.0,0.1]
+    assert nleb_runner.runScenarios('linear',capP,capN,store,processes=2) == 6
+    assert nleb_runner.runScenarios('linear',capP,capN,store,processes=2) == 0
+    assert countLines(store) == 6
+
+    base = nleb_linear.x0.sum(0) * nleb_linear.parameters.Yield.to_numpy('float64')
+    prod = nleb_runner.readStore(store,'linear',nleb_linear.crops,base)
+    names = [nleb_linear.scenarioName(p,n) for n in capN for p in capP]
+    assert list(prod.columns) == ['Base'] + names
+    assert np.allclose(prod.Base,base)
+
+    sol = nleb_linear.CropModel(presolve=False).solve(0.1,0.1)
+    assert np.allclose(prod[nleb_linear.scenarioName(0.1,0.1)],sol.Prod_Ton,rtol=1e-6)
+
+def test_failed_scenarios_are_not_repeated(tmp_path):
+    store = str(tmp_path / 'linear.jsonl')
+    # Minimum production cannot be met with almost no exports
+    assert nleb_runner.runScenarios('linear',[0.99],[0.99],store,processes=1) == 1
+    assert nleb_runner.openStore(store) == {nleb_runner.scenarioKey('linear',0.99,0.99):'failed'}
+    assert nleb_runner.runScenarios('linear',[0.99],[0.99],store,processes=1) == 0
+    assert countLines(store) == 1
+    assert nleb_runner.runScenarios('linear',[0.99],[0.99],store,processes=1,retryFailed=True) == 1
+    assert countLines(store) == 2
+    assert nleb_runner.readStore(store,'linear',nleb_linear.crops).shape[1] == 0
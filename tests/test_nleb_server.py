@@ -0,0 +1,77 @@
+import json
+import asyncio
+import numpy as np
+
+import nleb_linear
+import nleb_server
+import instrumentation
+
+
+async def post(port,method,path,payload=None,raw=None):
+    reader,writer = await asyncio.open_connection('127.0.0.1',port)
+    body = raw if raw is not None else json.dumps(payload).encode() if payload is not None else b''
+    writer.write(f'{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\n'
+                 f'Connection: close\r\n\r\n'.encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head,_,data = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]),json.loads(data)
+
+def serve(requests):
+    """
+    Start a server on a free port, run the requests (coroutines of the
+    port) concurrently and return their (status, payload) with the batch
+    records emitted meanwhile.
+    """
+    records = []
+    async def main():
+        server = await nleb_server.Server(window=0.05).start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            return await asyncio.gather(*[r(port) for r in requests])
+    previous = instrumentation.setSink(records.append)
+    try:
+        out = asyncio.run(main())
+    finally:
+        instrumentation.setSink(previous)
+    return out,[r for r in records if r['model'] == 'nleb_server']
+
+def test_concurrent_requests_are_batched():
+    caps = [(0.1,0.0),(0.4,0.3),(0.2,0.1)]
+    out,records = serve([lambda port,c=c: post(port,'POST','/linear',{'capP':c[0],'capN':c[1]})
+                         for c in caps])
+    for (status,sol),(capP,capN) in zip(out,caps):
+        model = nleb_linear.CropModel()
+        model.solve(capP,capN)
+        assert status == 200 and sol['status'] == 'optimal'
+        assert np.isclose(sol['utility'],model.utility,rtol=1e-9)
+    assert sum(r['requests'] for r in records) == 3
+    assert max(r['requests'] for r in records) > 1
+
+def test_coefficient_edits():
+    crop = nleb_linear.crops[0]
+    price = float(nleb_linear.parameters.Price.iloc[0])
+    edit = {'Price':{crop:2*price}}
+    out,records = serve([lambda port: post(port,'POST','/linear',
+                                           [{'capP':0.4,'capN':0.3,'coefficients':edit},
+                                            {'capP':0.4,'capN':0.3}])])
+    status,(edited,plain) = out[0]
+    model = nleb_linear.CropModel()
+    model.setCoefficients({'Price':np.where(np.array(nleb_linear.crops) == crop,2*price,
+                                            nleb_linear.parameters.Price.to_numpy('float64'))})
+    model.solve(0.4,0.3)
+    assert status == 200
+    assert np.isclose(edited['utility'],model.utility,rtol=1e-9)
+    assert edited['utility'] > plain['utility']
+
+def test_errors():
+    out,records = serve([lambda port: post(port,'POST','/linear',raw=b'{not json'),
+                         lambda port: post(port,'POST','/linear',{'coefficients':{'Price':{'Nope':1}}}),
+                         lambda port: post(port,'POST','/goalprog',{'weights':{}}),
+                         lambda port: post(port,'POST','/missing',{}),
+                         lambda port: post(port,'GET','/linear'),
+                         lambda port: post(port,'GET','/health')])
+    assert [status for status,payload in out] == [400,400,400,404,405,200]
+    assert 'Unknown crop' in out[1][1]['error']
+    assert not records
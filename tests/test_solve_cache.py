@@ -0,0 +1,48 @@
+import importlib
+import textwrap
+
+import solve_cache
+
+
+def writeModules(folder,scale):
+    (folder / 'cachedHelper.py').write_text(f'scale = {scale}\n')
+    (folder / 'cachedSolver.py').write_text(textwrap.dedent('''
+        import solve_cache
+        import cachedHelper
+
+        calls = []
+
+        @solve_cache.memoize('test',lambda: ())
+        def solve(x,verbose=False):
+            calls.append(x)
+            return None if x < 0 else cachedHelper.scale * x
+    '''))
+
+def test_off_without_environment():
+    assert solve_cache.folder is None
+
+def test_memoize(tmp_path,monkeypatch):
+    code = tmp_path / 'code'
+    code.mkdir()
+    writeModules(code,2)
+    monkeypatch.syspath_prepend(str(code))
+    cachedSolver = importlib.import_module('cachedSolver')
+
+    previous = solve_cache.setFolder(str(tmp_path / 'cache'))
+    try:
+        assert cachedSolver.solve(3) == 6
+        assert cachedSolver.solve(3) == 6
+        assert cachedSolver.calls == [3]
+
+        # Failures are solved again
+        assert cachedSolver.solve(-1) is None
+        assert cachedSolver.solve(-1) is None
+        assert cachedSolver.calls == [3,-1,-1]
+
+        # An edit to an imported module of the same folder changes the key
+        writeModules(code,5)
+        solve_cache.sourceHash.cache_clear()
+        cachedSolver.solve(3)
+        assert cachedSolver.calls == [3,-1,-1,3]
+    finally:
+        solve_cache.setFolder(previous)